@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+# Helpers of the redaction app that need neither GStreamer nor DeepStream: input manifests,
+# live URIs, and the per-source output locations. deepstream_redaction_app re-exports them.
+
+import os
+import os.path
+
+# URI schemes of live streams, reconnected when they fail or end
+LIVE_SCHEMES = ("rtsp", "rtsps", "rtmp", "udp", "srt", "http", "https")
+
+def computeDiffInMillis(start, end):
+    return int(1000*(end-start))
+
+def parse_resolution(resolution):
+    """'1280x720' -> (1280, 720)"""
+    width, height = resolution.lower().split("x")
+    return int(width), int(height)
+
+def is_live_uri(location):
+    return "://" in location and location.split("://", 1)[0].lower() in LIVE_SCHEMES
+
+def read_input_manifest(path):
+    """Returns the inputs listed in a manifest file, one file path or URI per line"""
+    inputs = []
+    with open(path) as manifest:
+        for line in manifest:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                inputs.append(line)
+    return inputs
+
+def output_location_for_source(output_mp4, index, num_sources):
+    """With several sources, out.mp4 becomes out_0.mp4, out_1.mp4, ..."""
+    if output_mp4 is None or num_sources == 1:
+        return output_mp4
+    root, ext = os.path.splitext(output_mp4)
+    return "%s_%d%s" % (root, index, ext)
+
+def kitti_dir_for_source(output_kitti, index, num_sources):
+    """With several sources, the kitti files of each source go to a source_<index> sub folder"""
+    if output_kitti is None or num_sources == 1:
+        return output_kitti
+    kitti_dir = os.path.join(output_kitti, "source_%d" % index)
+    if not os.path.isdir(kitti_dir):
+        os.makedirs(kitti_dir)
+    return kitti_dir
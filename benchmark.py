@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+# Headless benchmark of the redaction pipeline.
+# Builds Redaction_Main with videotestsrc inputs, the stub detector and a fakesink (or file)
+# output, sweeps resolution, object density, kitti export and encoder, and writes the
+# results as JSON. The compare command flags regressions against a stored baseline.
+#
+# The autotune command runs a sample clip under every combination of a search space of
+# profile settings (grid, or successive halving on growing frame budgets) and writes the
+# profile with the best fps whose p95 end-to-end latency stays within a bound.
+#
+# python3 benchmark.py run -o results.json
+# python3 benchmark.py compare baseline.json results.json
+# python3 benchmark.py autotune clip.mp4 --space search_space.ini -o tuned_profile.ini --app_args "-c configs/pgie_config_fd_lpd.txt"
+
+import os
+import sys
+import json
+import time
+import math
+import shlex
+import shutil
+import argparse
+import platform
+import tempfile
+import itertools
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GObject
+
+import deepstream_redaction_app
+from deepstream_redaction_app import Redaction_Main, TEST_SOURCE, computeDiffInMillis
+from output_encoders import ENCODERS
+from pipeline_profiles import Profile, load_profile, save_profile, parse_args_with_profile
+
+# encoder value meaning "no encoding, frames go to a fakesink"
+NO_ENCODER = "none"
+
+def run_case(case, common):
+    """Runs one configuration of the sweep and returns its measurements"""
+    work_dir = tempfile.mkdtemp(prefix="redaction-bench-")
+    try:
+        app_args = [
+            "-c", common.pgie_config,
+            "-i", "%s:%d" % (TEST_SOURCE, common.num_buffers),
+            "--detector", common.detector,
+            "--stub_objects", str(case["objects"]),
+            "--test_resolution", case["resolution"],
+            "--cpu_batch_size", str(common.cpu_batch_size),
+            "--cpu_workers", str(common.cpu_workers),
+            # one snapshot at the end of the run is enough
+            "--stats_interval", "3600",
+            "--log_level", "WARNING",
+        ]
+        if case["kitti"]:
+            app_args += ["-k", work_dir]
+        if case["encoder"] == NO_ENCODER:
+            app_args += ["--fakesink"]
+        else:
+            app_args += ["-o", os.path.join(work_dir, "out.mp4"), "--encoder", case["encoder"]]
+        args = deepstream_redaction_app.build_arg_parser().parse_args(app_args)
+        return dict(case, **run_app(args))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def run_app(args):
+    """Builds and runs Redaction_Main for args, returns its measurements"""
+    app = Redaction_Main(args, run=False)
+    if not app.built:
+        return {"error": "pipeline could not be built"}
+    sink_names = [sink.get_name() for sink in app.sinks]
+    wall_start = time.time()
+    app.run()
+    wall_ms = computeDiffInMillis(wall_start, time.time())
+    if app.error is not None:
+        return {"error": app.error}
+    frames = sum(app.source_frame_numbers)
+    stages = {}
+    if app.stats_snapshot is not None:
+        for name, stage in app.stats_snapshot["stages"].items():
+            stages[name] = stage["latency_ms"]
+    # end-to-end latency, measured on the sinks from the moment a frame entered the processing
+    sink_latencies = [stages[name]["p95"] for name in sink_names if name in stages and stages[name]["p95"] is not None]
+    return dict(
+        frames=frames,
+        wall_ms=wall_ms,
+        fps=frames * 1000.0 / max(wall_ms, 1),
+        probe_ms_per_frame=app.probe_seconds * 1000.0 / max(frames, 1),
+        latency_p95_ms=max(sink_latencies) if sink_latencies else None,
+        stages=stages)
+
+def case_key(case):
+    return "%s/%d objects/kitti %s/%s" % (case["resolution"], case["objects"], "on" if case["kitti"] else "off", case["encoder"])
+
+def run(args):
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "num_buffers": args.num_buffers,
+        "detector": args.detector,
+        "cases": [],
+    }
+    for resolution, objects, kitti, encoder in itertools.product(args.resolutions, args.objects, args.kitti, args.encoders):
+        case = {"resolution": resolution, "objects": objects, "kitti": kitti == "on", "encoder": encoder}
+        print("Running", case_key(case))
+        result = run_case(case, args)
+        if "error" in result:
+            print("  failed:", result["error"])
+        else:
+            print("  %.2f fps, probe %.3f ms/frame" % (result["fps"], result["probe_ms_per_frame"]))
+        results["cases"].append(result)
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print("Results written to", args.output)
+    return 0
+
+def compare(args):
+    """Flags cases whose fps dropped or whose probe cost grew by more than the threshold"""
+    with open(args.baseline) as baseline_file:
+        baseline = dict((case_key(c), c) for c in json.load(baseline_file)["cases"] if "error" not in c)
+    with open(args.results) as results_file:
+        current = [c for c in json.load(results_file)["cases"]]
+    threshold = args.threshold / 100.0
+    regressions = 0
+    print("%-48s %10s %10s %8s %12s %12s" % ("case", "base fps", "fps", "change", "base probe", "probe"))
+    for case in current:
+        key = case_key(case)
+        if "error" in case:
+            print("%-48s failed: %s" % (key, case["error"]))
+            regressions += 1
+            continue
+        base = baseline.get(key)
+        if base is None:
+            print("%-48s %10s %10.2f %8s" % (key, "-", case["fps"], "new"))
+            continue
+        fps_change = (case["fps"] - base["fps"]) / max(base["fps"], 1e-6)
+        probe_change = (case["probe_ms_per_frame"] - base["probe_ms_per_frame"]) / max(base["probe_ms_per_frame"], 1e-6)
+        flag = ""
+        if fps_change < -threshold or probe_change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print("%-48s %10.2f %10.2f %+7.1f%% %12.3f %12.3f%s" % (key, base["fps"], case["fps"], 100 * fps_change,
+            base["probe_ms_per_frame"], case["probe_ms_per_frame"], flag))
+    if regressions:
+        print(regressions, "regression(s) above", args.threshold, "%")
+        return 1
+    print("No regressions above", args.threshold, "%")
+    return 0
+
+def search_space(space):
+    """Expands a profile whose values are comma separated candidate lists into all the profiles it describes"""
+    knobs = []
+    for key, value in space.app_options.items():
+        knobs.append((None, key, [v.strip() for v in str(value).split(",")]))
+    for rule_index, (prefix, pattern, properties) in enumerate(space.element_rules):
+        for name, value in properties.items():
+            knobs.append((rule_index, name, [v.strip() for v in value.split(",")]))
+    candidates = []
+    for values in itertools.product(*[knob[2] for knob in knobs]):
+        profile = Profile({}, [(prefix, pattern, {}) for prefix, pattern, _ in space.element_rules])
+        for (rule_index, name, _), value in zip(knobs, values):
+            if rule_index is None:
+                profile.app_options[name] = value
+            else:
+                profile.element_rules[rule_index][2][name] = value
+        candidates.append(profile)
+    return candidates
+
+def describe(profile):
+    settings = ["%s=%s" % item for item in sorted(profile.app_options.items())]
+    for prefix, pattern, properties in profile.element_rules:
+        settings += ["%s.%s=%s" % (pattern, name, value) for name, value in sorted(properties.items())]
+    return " ".join(settings)
+
+def evaluate(profile, frames, args):
+    """Runs the sample clip for frames frames under profile"""
+    work_dir = tempfile.mkdtemp(prefix="redaction-tune-")
+    try:
+        profile_path = os.path.join(work_dir, "profile.ini")
+        save_profile(profile, profile_path)
+        app_argv = shlex.split(args.app_args) + ["-i", args.clip, "--profile", profile_path,
+            "--max_frames", str(frames), "--stats_interval", "3600", "--log_level", "WARNING"]
+        if args.fakesink:
+            app_argv += ["--fakesink"]
+        else:
+            app_argv += ["-o", os.path.join(work_dir, "out.mp4")]
+        result = run_app(parse_args_with_profile(deepstream_redaction_app.build_arg_parser(), app_argv))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    result["feasible"] = "error" not in result and result["latency_p95_ms"] is not None and result["latency_p95_ms"] <= args.latency_ms
+    print("  %-70s %s" % (describe(profile), "failed: %s" % result["error"] if "error" in result else
+        "%.2f fps, p95 latency %s ms%s" % (result["fps"], "-" if result["latency_p95_ms"] is None else "%.0f" % result["latency_p95_ms"],
+        "" if result["feasible"] else " (over the bound)")))
+    return result
+
+def score(result):
+    """Feasible results by fps, then infeasible ones by latency, failures last"""
+    if "error" in result:
+        return (0, 0.0)
+    if result["feasible"]:
+        return (2, result["fps"])
+    return (1, -(result["latency_p95_ms"] or float("inf")))
+
+def autotune(args):
+    candidates = search_space(load_profile(args.space))
+    print("Search space of %d profiles" % len(candidates))
+    if args.strategy == "grid":
+        rounds = 1
+    else:
+        rounds = max(1, int(math.ceil(math.log(len(candidates), 2))))
+    for round_index in range(rounds):
+        # successive halving: short runs first, the best half survives to a run twice as long
+        frames = max(30, args.frames >> (rounds - 1 - round_index))
+        print("Round %d: %d profiles, %d frames each" % (round_index + 1, len(candidates), frames))
+        scored = sorted(((evaluate(profile, frames, args), profile) for profile in candidates), key=lambda item: score(item[0]), reverse=True)
+        candidates = [profile for _, profile in scored[:max(1, len(scored) // 2)]]
+    best_result, best_profile = scored[0]
+    if not best_result.get("feasible"):
+        print("No profile kept the p95 latency within", args.latency_ms, "ms")
+        return 1
+    save_profile(best_profile, args.output, [
+        "autotuned on %s with %s, %s" % (os.path.basename(args.clip), platform.node(), time.strftime("%Y-%m-%dT%H:%M:%S")),
+        "%.2f fps, p95 latency %.0f ms (bound %.0f ms)" % (best_result["fps"], best_result["latency_p95_ms"], args.latency_ms),
+    ])
+    print("Best profile written to", args.output, ":", describe(best_profile))
+    return 0
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="headless benchmark of the redaction pipeline")
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser("run", help="run the benchmark sweep")
+    run_parser.add_argument('-o', '--output', default="benchmark_results.json", help='(optional) path of the JSON results file')
+    run_parser.add_argument('-c', '--pgie_config', default="configs/pgie_config_fd_lpd.txt", help='(optional) pgie config, only read by the cpu detector')
+    run_parser.add_argument('--detector', choices=['stub', 'cpu'], default='stub', help='(optional) detector used by the runs, stub (default) needs no model or GPU')
+    run_parser.add_argument('--num_buffers', type=int, default=300, help='(optional) frames generated per run')
+    run_parser.add_argument('--resolutions', nargs='+', default=["640x360", "1280x720", "1920x1080"], help='(optional) videotestsrc resolutions to sweep')
+    run_parser.add_argument('--objects', nargs='+', type=int, default=[0, 8, 32], help='(optional) objects per frame to sweep')
+    run_parser.add_argument('--kitti', nargs='+', choices=['off', 'on'], default=['off', 'on'], help='(optional) kitti export settings to sweep')
+    run_parser.add_argument('--encoders', nargs='+', choices=[NO_ENCODER] + sorted(ENCODERS), default=[NO_ENCODER, 'avenc_mpeg4'], help='(optional) encoders to sweep, "none" sends the frames to a fakesink')
+    run_parser.add_argument('--cpu_batch_size', type=int, default=4, help='(optional) frames per detector call')
+    run_parser.add_argument('--cpu_workers', type=int, default=2, help='(optional) detector worker threads')
+    compare_parser = subparsers.add_parser("compare", help="compare results against a baseline")
+    compare_parser.add_argument('baseline', help='baseline results JSON')
+    compare_parser.add_argument('results', help='new results JSON')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help='(optional) allowed fps drop or probe cost increase, in percent')
+    autotune_parser = subparsers.add_parser("autotune", help="search the profile with the best fps within a latency bound")
+    autotune_parser.add_argument('clip', help='sample clip the profiles are measured on')
+    autotune_parser.add_argument('--space', required=True, help='profile whose values are comma separated lists of candidates')
+    autotune_parser.add_argument('-o', '--output', default="tuned_profile.ini", help='(optional) path of the best profile')
+    autotune_parser.add_argument('--latency_ms', type=float, default=500, help='(optional) bound on the p95 end-to-end latency')
+    autotune_parser.add_argument('--strategy', choices=['halving', 'grid'], default='halving', help='(optional) successive halving (default) or a full grid with --frames frames per profile')
+    autotune_parser.add_argument('--frames', type=int, default=600, help='(optional) frames per run, of the last round for successive halving')
+    autotune_parser.add_argument('--app_args', default="", help='(optional) other deepstream_redaction_app.py options used for every run, e.g. "-c <pgie config> --detector cpu"')
+    autotune_parser.add_argument('--fakesink', action='store_true', help='(optional) discard the frames instead of encoding them')
+    return parser
+
+if __name__ == '__main__':
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    if args.command == "run":
+        GObject.threads_init()
+        Gst.init(None)
+        sys.exit(run(args))
+    elif args.command == "compare":
+        sys.exit(compare(args))
+    elif args.command == "autotune":
+        GObject.threads_init()
+        Gst.init(None)
+        sys.exit(autotune(args))
+    parser.print_help()
+    sys.exit(1)
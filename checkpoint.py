@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+# Checkpoints of long file jobs, for --checkpoint.
+# The output is written by splitmuxsink as fragments of about --checkpoint_interval seconds.
+# Whenever a fragment is closed on disk the checkpoint file records it, with the input position
+# the next fragment starts at (PTS and frame number). A job restarted with the same checkpoint
+# seeks the input there, cuts the consolidated detection export back to that frame and appends
+# new fragments, so a crash costs at most one interval of work. The fragments are remuxed into
+# the -o output once the whole input is done.
+
+import os
+import os.path
+import glob
+import json
+import threading
+import collections
+
+from detection_writer import input_fingerprint
+
+class Checkpoint(object):
+    def __init__(self, path, location, output_location):
+        self.path = path
+        self.location = location
+        self.fingerprint = input_fingerprint(location)
+        self.output_location = output_location
+        # closed fragments, in order
+        self.segments = []
+        # input position of the first frame after the last closed fragment
+        self.pts = 0
+        self.frame = 0
+        # position this run started at, running times of the fragments are relative to it: the PTS of
+        # the first frame of a fresh run, the checkpoint position of a resumed one
+        self.start_pts = None
+        # (pts, frame number) of the frames processed since the last closed fragment
+        self.pending = collections.deque()
+        self.last_frame = -1
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path, location, output_location):
+        """Returns the checkpoint of path when it was written for the same input and output, a new one otherwise"""
+        checkpoint = cls(path, location, output_location)
+        if not os.path.exists(path):
+            return checkpoint
+        with open(path) as checkpoint_file:
+            state = json.load(checkpoint_file)
+        if state["fingerprint"] != checkpoint.fingerprint or state["output"] != output_location:
+            print("Warning: checkpoint", path, "is for another input or output, starting over")
+            return checkpoint
+        checkpoint.segments = [segment for segment in state["segments"] if os.path.exists(segment)]
+        if len(checkpoint.segments) == len(state["segments"]):
+            checkpoint.pts = checkpoint.start_pts = state["pts"]
+            checkpoint.frame = state["frame"]
+        else:
+            print("Warning: fragments of checkpoint", path, "are missing, starting over")
+            checkpoint.segments = []
+        return checkpoint
+
+    def resuming(self):
+        return self.frame > 0
+
+    def segment_pattern(self):
+        """splitmuxsink location of the fragments, next to the output"""
+        stem, extension = os.path.splitext(self.output_location)
+        return stem + ".part%05d" + extension
+
+    def frame_seen(self, pts, frame_number):
+        """Called for every processed frame, ahead of the encoder"""
+        with self.lock:
+            if self.start_pts is None:
+                self.start_pts = pts
+            self.pending.append((pts, frame_number))
+            self.last_frame = frame_number
+
+    def fragment_closed(self, location, running_time):
+        """Records a fragment splitmuxsink finished writing, and the position the next one starts at"""
+        with self.lock:
+            boundary = (self.start_pts or 0) + running_time
+            while self.pending and self.pending[0][0] < boundary:
+                self.pending.popleft()
+            self.frame = self.pending[0][1] if self.pending else self.last_frame + 1
+            self.pts = boundary
+            self.segments.append(location)
+        self.save()
+
+    def save(self):
+        state = {
+            "input": self.location,
+            "fingerprint": self.fingerprint,
+            "output": self.output_location,
+            "segments": self.segments,
+            "pts": self.pts,
+            "frame": self.frame,
+        }
+        with open(self.path + ".tmp", "w") as checkpoint_file:
+            json.dump(state, checkpoint_file, indent=2)
+        os.replace(self.path + ".tmp", self.path)
+
+    def remove_stale_fragments(self):
+        """Deletes the fragments past the recorded ones, left half written by the interrupted run"""
+        for path in glob.glob(self.segment_pattern().replace("%05d", "*")):
+            if path not in self.segments:
+                os.remove(path)
+
+    def finish(self, muxer_factory):
+        """Remuxes the fragments into the output and removes them with the checkpoint"""
+        from chunked_processing import concat_chunks
+        concat_chunks(self.segment_pattern().replace("%05d", "*"), self.output_location, muxer_factory)
+        for segment in self.segments:
+            os.remove(segment)
+        if os.path.exists(self.path):
+            os.remove(self.path)
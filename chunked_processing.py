@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+# Parallel processing of long recordings for --chunk_workers.
+# Each input file is cut at keyframes into chunks without re-encoding (splitmuxsink), the
+# chunks are redacted by Redaction_Main in separate worker processes, and the redacted
+# chunks and their detections are stitched back together with continuous frame numbers
+# and timestamps. Chunks whose worker fails or crashes are retried.
+
+import os
+import os.path
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import collections
+import multiprocessing
+import multiprocessing.connection
+
+from detection_writer import DetectionWriter, input_fingerprint
+from detection_reader import DetectionStore
+
+# result file written by a worker when its chunk completed
+RESULT_FILE = "result.json"
+
+def import_gst():
+    """GStreamer is imported on first use, so the detection merge runs without it"""
+    import gi
+    gi.require_version("Gst", "1.0")
+    from gi.repository import Gst, GObject
+    return Gst, GObject
+
+class ChunkJob(object):
+    """One chunk of one input, and the folder its worker writes to"""
+    def __init__(self, input_index, chunk_index, path, start_pts, work_dir, output_path):
+        self.input_index = input_index
+        self.chunk_index = chunk_index
+        self.path = path
+        self.start_pts = start_pts
+        self.work_dir = work_dir
+        # redacted chunk, next to the other chunks of the input so splitmuxsrc can read them back in order
+        self.output_path = output_path
+        self.attempts = 0
+        self.frames = None
+
+    def name(self):
+        return "input %d chunk %d" % (self.input_index, self.chunk_index)
+
+def split_input(location, chunk_dir, chunk_seconds):
+    """Cuts the video stream of an input file into chunks of about chunk_seconds, each starting
+    on a keyframe. Returns the (path, start pts) of the chunks in order."""
+    Gst, GObject = import_gst()
+    pipeline = Gst.Pipeline.new("chunk-splitter")
+    source = Gst.ElementFactory.make("filesrc", "chunk-source")
+    parser = Gst.ElementFactory.make("parsebin", "chunk-parser")
+    splitmux = Gst.ElementFactory.make("splitmuxsink", "chunk-splitter")
+    if None in (pipeline, source, parser, splitmux):
+        raise RuntimeError("chunk splitter components could not be created")
+    source.set_property("location", location)
+    splitmux.set_property("max-size-time", int(chunk_seconds * Gst.SECOND))
+    chunks = []
+
+    def on_format_location(splitmux, fragment_id, first_sample):
+        path = os.path.join(chunk_dir, "chunk_%05d.mp4" % fragment_id)
+        chunks.append((path, first_sample.get_buffer().pts))
+        return path
+
+    def on_pad_added(parser, pad):
+        caps = pad.query_caps(None)
+        if caps.get_structure(0).get_name().startswith("video") and not splitmux.get_static_pad("video"):
+            pad.link(splitmux.get_request_pad("video"))
+
+    splitmux.connect("format-location-full", on_format_location)
+    parser.connect("pad-added", on_pad_added)
+    for element in (source, parser, splitmux):
+        pipeline.add(element)
+    source.link(parser)
+    pipeline.set_state(Gst.State.PLAYING)
+    message = pipeline.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    if message.type == Gst.MessageType.ERROR:
+        err, debug = message.parse_error()
+        raise RuntimeError("splitting %s failed: %s: %s" % (location, err, debug))
+    return chunks
+
+def concat_chunks(pattern, output_location, muxer_factory="qtmux"):
+    """Remuxes the redacted chunks matching pattern into one file, with continuous timestamps"""
+    Gst, GObject = import_gst()
+    pipeline = Gst.Pipeline.new("chunk-concat")
+    source = Gst.ElementFactory.make("splitmuxsrc", "chunk-concat-source")
+    muxer = Gst.ElementFactory.make(muxer_factory, "chunk-concat-muxer")
+    sink = Gst.ElementFactory.make("filesink", "chunk-concat-sink")
+    if None in (pipeline, source, muxer, sink):
+        raise RuntimeError("chunk concat components could not be created")
+    source.set_property("location", pattern)
+    sink.set_property("location", output_location)
+
+    def on_pad_added(source, pad):
+        pad.link(muxer.get_compatible_pad(pad, None))
+
+    source.connect("pad-added", on_pad_added)
+    for element in (source, muxer, sink):
+        pipeline.add(element)
+    muxer.link(sink)
+    pipeline.set_state(Gst.State.PLAYING)
+    message = pipeline.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    if message.type == Gst.MessageType.ERROR:
+        err, debug = message.parse_error()
+        raise RuntimeError("writing %s failed: %s: %s" % (output_location, err, debug))
+
+def chunk_args(args, job):
+    """Arguments of the Redaction_Main that processes one chunk"""
+    worker_args = argparse.Namespace(**vars(args))
+    worker_args.input_mp4 = [job.path]
+    worker_args.input_list = None
+    worker_args.chunk_workers = 0
+    # per-chunk outputs, stitched together once all the chunks are done
+    worker_args.output_mp4 = job.output_path if args.output_mp4 is not None else None
+    worker_args.fakesink = args.fakesink or args.output_mp4 is None
+    if args.output_kitti is not None:
+        worker_args.output_kitti = os.path.join(job.work_dir, "detections")
+        if not os.path.isdir(worker_args.output_kitti):
+            os.makedirs(worker_args.output_kitti)
+        worker_args.export_format = "jsonl"
+    worker_args.stats_interval = 0
+    return worker_args
+
+def run_chunk(worker_args, result_path):
+    """Worker process entry point"""
+    from deepstream_redaction_app import Redaction_Main
+    Gst, GObject = import_gst()
+    GObject.threads_init()
+    Gst.init(None)
+    app = Redaction_Main(worker_args)
+    if not app.built or app.error is not None:
+        sys.exit(1)
+    dropped = app.detection_writer.dropped if app.detection_writer is not None else 0
+    if dropped:
+        sys.stderr.write("Error: detection writer dropped %d frames\n" % dropped)
+        sys.exit(1)
+    with open(result_path, "w") as result_file:
+        json.dump({"frames": app.source_frame_numbers[0]}, result_file)
+
+def run_jobs(jobs, args, num_workers, retries):
+    """Runs the chunks on num_workers processes, retrying failed ones. Returns the jobs that kept failing"""
+    # spawn, so that no GStreamer or GLib state is inherited from the parent
+    context = multiprocessing.get_context("spawn")
+    waiting = collections.deque(jobs)
+    running = {}
+    failed = []
+    while waiting or running:
+        while waiting and len(running) < num_workers:
+            job = waiting.popleft()
+            job.attempts += 1
+            result_path = os.path.join(job.work_dir, RESULT_FILE)
+            if os.path.exists(result_path):
+                os.remove(result_path)
+            process = context.Process(target=run_chunk, args=(chunk_args(args, job), result_path), name="redaction-chunk")
+            process.start()
+            running[process.sentinel] = (process, job)
+        for sentinel in multiprocessing.connection.wait(list(running)):
+            process, job = running.pop(sentinel)
+            process.join()
+            result_path = os.path.join(job.work_dir, RESULT_FILE)
+            if process.exitcode == 0 and os.path.exists(result_path):
+                with open(result_path) as result_file:
+                    job.frames = json.load(result_file)["frames"]
+                print("Finished %s: %d frames" % (job.name(), job.frames))
+            elif job.attempts <= retries:
+                print("Retrying %s, attempt %d failed with exit code %s" % (job.name(), job.attempts, process.exitcode))
+                waiting.append(job)
+            else:
+                print("Giving up on %s after %d attempts" % (job.name(), job.attempts))
+                failed.append(job)
+    return failed
+
+def merge_detections(jobs, writer, input_index, class_names):
+    """Copies the detections of the chunks of one input to writer, renumbering the frames and
+    moving the timestamps back to the timeline of the input"""
+    offset = 0
+    for job in jobs:
+        store = DetectionStore(os.path.join(job.work_dir, "detections"), class_names)
+        stored = store.source(0)
+        if job.chunk_index == 0 and stored.width is not None:
+            writer.set_frame_size(input_index, stored.width, stored.height)
+        # timestamps of a chunk start near 0, its first frame is at start_pts of the input
+        first_pts = min(stored.pts_frames) if stored.pts_frames else 0
+        pts_by_frame = dict((frame, pts) for pts, frame in stored.pts_frames.items())
+        for frame_number in range(job.frames):
+            pts = pts_by_frame.get(frame_number)
+            if pts is not None:
+                pts = pts - first_pts + job.start_pts
+            writer.put(input_index, offset + frame_number, pts if pts is not None else -1,
+                stored.frames.get(frame_number, []), block=True)
+        offset += job.frames
+
+def run_chunked(args, class_names):
+    """Processes every input with --chunk_workers processes. Returns the exit code"""
+    from deepstream_redaction_app import output_location_for_source, kitti_dir_for_source
+    from output_encoders import CONTAINERS
+    inputs = args.input_mp4 or []
+    for location in inputs:
+        if not os.path.isfile(location):
+            sys.stderr.write("Error: --chunk_workers needs input files, %s is not one\n" % location)
+            return 1
+    work_dir = tempfile.mkdtemp(prefix="redaction-chunks-", dir=args.chunk_dir)
+    start = time.time()
+    jobs = []
+    for input_index, location in enumerate(inputs):
+        input_dir = os.path.join(work_dir, "input_%d" % input_index)
+        os.makedirs(input_dir)
+        chunks = split_input(location, input_dir, args.chunk_seconds)
+        print("Split %s into %d chunks" % (location, len(chunks)))
+        for chunk_index, (path, start_pts) in enumerate(chunks):
+            job_dir = os.path.join(input_dir, "job_%05d" % chunk_index)
+            os.makedirs(job_dir)
+            # the workers mux their chunk into --container, the concat reads them back with the same extension
+            jobs.append(ChunkJob(input_index, chunk_index, path, start_pts, job_dir,
+                os.path.join(input_dir, "redacted_%05d.%s" % (chunk_index, args.container))))
+    if args.engine_cache is not None and args.detector == "nvinfer":
+        # build a missing engine once here, rather than in every worker
+        import engine_cache
+        engine_cache.EngineCache(args.engine_cache, args.engine_cache_size).ensure(args.pgie_config, 1, engine_cache.build_with_nvinfer)
+    failed = run_jobs(jobs, args, args.chunk_workers, args.chunk_retries)
+    failed_inputs = set(job.input_index for job in failed)
+
+    writer = None
+    writer_error = None
+    stitched = False
+    try:
+        if args.output_kitti is not None:
+            kitti_dirs = [kitti_dir_for_source(args.output_kitti, i, len(inputs)) for i in range(len(inputs))]
+            writer = DetectionWriter(args.output_kitti, kitti_dirs, class_names, args.export_format, args.export_queue_size,
+                sources=[{"input": location, "fingerprint": input_fingerprint(location)} for location in inputs])
+        for input_index, location in enumerate(inputs):
+            if input_index in failed_inputs:
+                sys.stderr.write("Error: %s has failed chunks, its outputs are not written\n" % location)
+                continue
+            input_jobs = [job for job in jobs if job.input_index == input_index]
+            output_location = output_location_for_source(args.output_mp4, input_index, len(inputs))
+            try:
+                if output_location is not None:
+                    concat_chunks(os.path.join(work_dir, "input_%d" % input_index, "redacted_*.%s" % args.container),
+                        output_location, CONTAINERS[args.container])
+                    print("Sending output to ", output_location)
+                if writer is not None:
+                    merge_detections(input_jobs, writer, input_index, class_names)
+            except (RuntimeError, OSError, ValueError, KeyError) as e:
+                # the chunks are fine, keep them like those of a failed chunk
+                sys.stderr.write("Error: stitching %s failed, its outputs are incomplete: %s\n" % (location, e))
+                failed_inputs.add(input_index)
+                continue
+            print("source %d (%s): %d frames" % (input_index, location, sum(job.frames for job in input_jobs)))
+        stitched = True
+    finally:
+        if writer is not None:
+            writer_error = writer.close()
+        if failed_inputs or not stitched:
+            print("Chunks kept for inspection in", work_dir)
+    print("Processed %d chunks in %d ms" % (len(jobs), int(1000 * (time.time() - start))))
+    if failed_inputs:
+        return 1
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return 0 if writer_error is None else 1
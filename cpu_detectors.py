@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+# Detectors of the cpu path (see cpu_inference.py): the fd_lpd caffe model run with OpenCV DNN,
+# and a stub returning synthetic boxes for benchmarks. Both take a batch of RGBA frames and
+# return one Detection list per frame.
+#
+# run the following commands to install the dependencies:
+# sudo pip3 install numpy opencv-python
+
+import os
+import os.path
+import threading
+import configparser
+import numpy as np
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+from detections import Detection
+
+# DetectNet output decoding constants, same as the nvinfer resnet parser
+DETECTNET_BBOX_NORM = 35.0
+
+def read_pgie_config(config_path):
+    """Reads the nvinfer config file, resolving the model paths relative to the config file like nvinfer does"""
+    parser = configparser.ConfigParser()
+    if not parser.read(config_path):
+        raise IOError("could not read pgie config %s" % config_path)
+    config_dir = os.path.dirname(os.path.abspath(config_path))
+    properties = dict(parser["property"])
+    for key in ("model-file", "proto-file", "model-engine-file", "labelfile-path"):
+        if key in properties:
+            properties[key] = os.path.normpath(os.path.join(config_dir, properties[key]))
+    num_classes = int(properties.get("num-detected-classes", 4))
+    # class-attrs-all gives the defaults, class-attrs-<id> overrides them per class
+    defaults = dict(parser["class-attrs-all"]) if parser.has_section("class-attrs-all") else {}
+    class_attrs = []
+    for class_id in range(num_classes):
+        attrs = dict(defaults)
+        section = "class-attrs-%d" % class_id
+        if parser.has_section(section):
+            attrs.update(parser[section])
+        class_attrs.append({
+            "threshold": float(attrs.get("threshold", 0.2)),
+            "group-threshold": int(attrs.get("group-threshold", 1)),
+            "eps": float(attrs.get("eps", 0.2)),
+            "detected-min-w": int(attrs.get("detected-min-w", 0)),
+            "detected-min-h": int(attrs.get("detected-min-h", 0)),
+            "detected-max-w": int(attrs.get("detected-max-w", 1 << 30)),
+            "detected-max-h": int(attrs.get("detected-max-h", 1 << 30)),
+        })
+    properties["class-attrs"] = class_attrs
+    return properties
+
+def decode_detectnet_grid(cov, bbox, class_id, net_width, net_height, attrs):
+    """Proposals of one class from the output_cov/output_bbox grids of one frame: (rects, scores) with
+    [left, top, width, height] rows in network coordinates, filtered by the class threshold and size limits"""
+    num_classes, grid_h, grid_w = cov.shape
+    stride_x = (net_width + grid_w - 1) // grid_w
+    stride_y = (net_height + grid_h - 1) // grid_h
+    centers_x = (np.arange(grid_w, dtype=np.float32) * stride_x + 0.5) / DETECTNET_BBOX_NORM
+    centers_y = (np.arange(grid_h, dtype=np.float32) * stride_y + 0.5) / DETECTNET_BBOX_NORM
+    ys, xs = np.nonzero(cov[class_id] >= attrs["threshold"])
+    x1 = (bbox[class_id * 4 + 0, ys, xs] - centers_x[xs]) * -DETECTNET_BBOX_NORM
+    y1 = (bbox[class_id * 4 + 1, ys, xs] - centers_y[ys]) * -DETECTNET_BBOX_NORM
+    x2 = (bbox[class_id * 4 + 2, ys, xs] + centers_x[xs]) * DETECTNET_BBOX_NORM
+    y2 = (bbox[class_id * 4 + 3, ys, xs] + centers_y[ys]) * DETECTNET_BBOX_NORM
+    x1 = np.clip(x1, 0, net_width - 1)
+    y1 = np.clip(y1, 0, net_height - 1)
+    x2 = np.clip(x2, 0, net_width - 1)
+    y2 = np.clip(y2, 0, net_height - 1)
+    scores = cov[class_id, ys, xs]
+    keep = ((x2 - x1) >= attrs["detected-min-w"]) & ((y2 - y1) >= attrs["detected-min-h"]) & \
+        ((x2 - x1) <= attrs["detected-max-w"]) & ((y2 - y1) <= attrs["detected-max-h"])
+    return np.stack([x1, y1, x2 - x1, y2 - y1], axis=1)[keep], scores[keep]
+
+def cluster_confidence(rects, scores, left, top, width, height):
+    """Confidence of a cluster: the best score of the proposals whose corner lies within half its size of
+    the corner of the cluster, the best of all when none does"""
+    covered = (rects[:, 0] >= left - width * 0.5) & (rects[:, 0] <= left + width * 0.5) & \
+        (rects[:, 1] >= top - height * 0.5) & (rects[:, 1] <= top + height * 0.5)
+    return float(scores[covered].max()) if covered.any() else float(scores.max())
+
+def parse_detectnet_output(cov, bbox, net_width, net_height, class_attrs):
+    """Decodes the output_cov/output_bbox grids of one frame into (class_id, x1, y1, x2, y2, confidence) in network coordinates"""
+    objects = []
+    for class_id in range(cov.shape[0]):
+        attrs = class_attrs[class_id]
+        rects, scores = decode_detectnet_grid(cov, bbox, class_id, net_width, net_height, attrs)
+        if len(rects) == 0:
+            continue
+        # cluster the grid cell proposals the same way nvinfer does (cv::groupRectangles)
+        grouped, _ = cv2.groupRectangles(rects.astype(np.int32).tolist(), attrs["group-threshold"], attrs["eps"])
+        for left, top, width, height in grouped:
+            objects.append((class_id, left, top, left + width, top + height, cluster_confidence(rects, scores, left, top, width, height)))
+    return objects
+
+class OpenCVDetector(object):
+    """Runs the fd_lpd caffe model described by the nvinfer config with OpenCV DNN on the CPU"""
+    def __init__(self, pgie_config, num_workers=1):
+        if cv2 is None:
+            raise ImportError("the cpu detector requires opencv-python")
+        self.config = read_pgie_config(pgie_config)
+        self.proto_file = self.config["proto-file"]
+        self.model_file = self.config["model-file"]
+        self.scale_factor = float(self.config.get("net-scale-factor", 1.0))
+        offsets = [float(v) for v in self.config.get("offsets", "0;0;0").split(";") if v]
+        self.mean = tuple(offsets + [0.0] * (3 - len(offsets)))
+        # 0=RGB, 1=BGR; frames handed to the detector are RGBA
+        self.swap_rb = self.config.get("model-color-format", "0") == "1"
+        self.net_height, self.net_width = read_prototxt_input_dims(self.proto_file)
+        self.class_attrs = self.config["class-attrs"]
+        if num_workers > 1:
+            # every worker runs its own net, so keep opencv from oversubscribing the cores
+            cv2.setNumThreads(1)
+        # cv2.dnn.Net is not thread safe, each worker thread loads its own copy
+        self._local = threading.local()
+
+    def _net(self):
+        net = getattr(self._local, "net", None)
+        if net is None:
+            net = cv2.dnn.readNetFromCaffe(self.proto_file, self.model_file)
+            self._local.net = net
+        return net
+
+    def detect_batch(self, frames):
+        """Returns a list of Detection lists, one per frame, in frame coordinates"""
+        net = self._net()
+        blob = cv2.dnn.blobFromImages([np.ascontiguousarray(frame[:, :, :3]) for frame in frames], self.scale_factor, (self.net_width, self.net_height), self.mean, self.swap_rb, False)
+        net.setInput(blob)
+        outputs = net.forward(net.getUnconnectedOutLayersNames())
+        num_classes = len(self.class_attrs)
+        cov = [o for o in outputs if o.shape[1] == num_classes][0]
+        bbox = [o for o in outputs if o.shape[1] == 4 * num_classes][0]
+        results = []
+        for index, frame in enumerate(frames):
+            scale_x = frame.shape[1] / float(self.net_width)
+            scale_y = frame.shape[0] / float(self.net_height)
+            detections = []
+            for class_id, x1, y1, x2, y2, confidence in parse_detectnet_output(cov[index], bbox[index], self.net_width, self.net_height, self.class_attrs):
+                detections.append(Detection(class_id, int(x1 * scale_x), int(y1 * scale_y),
+                    int((x2 - x1) * scale_x), int((y2 - y1) * scale_y), confidence))
+            results.append(detections)
+        return results
+
+class StubDetector(object):
+    """Stand-in for the detector in benchmarks: returns objects_per_frame boxes on a grid
+    that drifts from frame to frame, without running any network"""
+    def __init__(self, objects_per_frame, num_classes=2):
+        self.objects_per_frame = objects_per_frame
+        self.num_classes = num_classes
+        self.frame_count = 0
+        self.lock = threading.Lock()
+
+    def detect_batch(self, frames):
+        # batches run on several worker threads, each one takes its own range of frame numbers
+        with self.lock:
+            first_frame = self.frame_count
+            self.frame_count += len(frames)
+        results = []
+        for offset, frame in enumerate(frames):
+            height, width = frame.shape[:2]
+            columns = max(1, int(np.ceil(np.sqrt(self.objects_per_frame))))
+            cell_w = width // columns
+            cell_h = height // columns
+            drift = (first_frame + offset) % max(1, cell_w // 4)
+            detections = []
+            for index in range(self.objects_per_frame):
+                row, column = divmod(index, columns)
+                detections.append(Detection(index % self.num_classes, column * cell_w + drift, row * cell_h,
+                    cell_w // 2, cell_h // 2, 1.0))
+            results.append(detections)
+        return results
+
+def read_prototxt_input_dims(proto_file):
+    """Returns the (height, width) declared by the input_dim lines of a caffe prototxt"""
+    dims = []
+    with open(proto_file) as proto:
+        for line in proto:
+            line = line.strip()
+            if line.startswith("input_dim:"):
+                dims.append(int(line.split(":")[1]))
+    return dims[2], dims[3]
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+# CPU replacement for the nvinfer + nvdsosd part of the redaction pipeline.
+# Frames are pulled from an appsink, run through the fd_lpd detector in batches on a
+# pool of worker threads, redacted, and pushed in order to an appsrc.
+#
+# run the following commands to install the dependencies:
+# sudo pip3 install numpy opencv-python
+
+import threading
+import traceback
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+
+# the detectors are plain python, re-exported for the app
+from cpu_detectors import OpenCVDetector, StubDetector
+
+class CpuInferenceStage(object):
+    """Connects an appsink to an appsrc through a batched detector running on worker threads"""
+    def __init__(self, detector, appsink, appsrc, source_index, executor, num_workers, batch_size, on_frame, interval=0, regions=None, gate=None):
+        self.detector = detector
+        self.appsink = appsink
+        self.appsrc = appsrc
+        self.source_index = source_index
+        self.executor = executor
+        self.batch_size = batch_size
+        # called as on_frame(source_index, frame, pts, detections) before the frame is pushed downstream,
+        # detections is None for the frames skipped by the detector
+        self.on_frame = on_frame
+        # like the nvinfer interval property: number of frames skipped between two detections
+        self.interval = interval
+        # privacy_masks.SourceRegions of the source: masked before detection, detector input cropped to the ROIs
+        self.regions = regions
+        # motion_gate.MotionGate of the source: the frames it finds unchanged get the boxes of the last detection
+        self.gate = gate
+        self.last_detected = []
+        self.frame_count = 0
+        self.pending = []
+        self.pending_detect = 0
+        self.in_flight = collections.deque()
+        self.cond = threading.Condition()
+        # bound the number of batches waiting for a worker so the appsink applies backpressure
+        self.slots = threading.Semaphore(max(2, 2 * num_workers))
+        self.eos = False
+        self.caps_set = False
+        self.appsink.set_property("emit-signals", True)
+        self.appsink.set_property("sync", False)
+        self.appsink.connect("new-sample", self.on_new_sample)
+        self.appsink.connect("eos", self.on_eos)
+        self.appsrc.set_property("format", Gst.Format.TIME)
+        self.appsrc.set_property("block", True)
+        self.output_thread = None
+        self.start_output_thread()
+
+    def start_output_thread(self):
+        self.output_thread = threading.Thread(target=self.push_results, name="cpu-infer-out-%d" % self.source_index)
+        self.output_thread.daemon = True
+        self.output_thread.start()
+
+    def reset(self):
+        """Prepares the stage for another stream, once the pipeline is back in READY"""
+        with self.cond:
+            self.eos = True
+            self.cond.notify()
+        self.output_thread.join()
+        self.frame_count = 0
+        self.pending = []
+        self.pending_detect = 0
+        self.eos = False
+        self.caps_set = False
+        self.last_detected = []
+        if self.gate is not None:
+            self.gate.reset()
+        self.start_output_thread()
+
+    def on_new_sample(self, appsink):
+        sample = appsink.emit("pull-sample")
+        if sample is None:
+            return Gst.FlowReturn.ERROR
+        if not self.caps_set:
+            self.appsrc.set_property("caps", sample.get_caps())
+            self.caps_set = True
+        frame, pts, duration = sample_to_frame(sample)
+        # without a detector (replays) every frame goes through as skipped
+        detect = self.detector is not None and self.frame_count % (self.interval + 1) == 0
+        # decided here, in frame order, on the frame before it is masked
+        unchanged = detect and self.gate is not None and not self.gate.should_detect(frame)
+        detect = detect and not unchanged
+        self.frame_count += 1
+        self.pending.append((frame, pts, duration, detect, unchanged))
+        if detect:
+            self.pending_detect += 1
+        # a batch is batch_size frames that go through the detector, plus the skipped ones in between
+        if self.pending_detect >= self.batch_size:
+            self.submit()
+        return Gst.FlowReturn.OK
+
+    def on_eos(self, appsink):
+        if self.pending:
+            self.submit()
+        with self.cond:
+            self.eos = True
+            self.cond.notify()
+
+    def submit(self):
+        batch = self.pending
+        self.pending = []
+        self.pending_detect = 0
+        self.slots.acquire()
+        future = self.executor.submit(self.detect, batch)
+        with self.cond:
+            self.in_flight.append((future, batch))
+            self.cond.notify()
+
+    def detect(self, batch):
+        """Runs the detector on the frames of the batch selected for detection, None for the others"""
+        if self.regions is None:
+            frames = [frame for frame, _, _, detect, _ in batch if detect]
+            results = iter(self.detector.detect_batch(frames) if frames else [])
+            return [next(results) if detect else None for _, _, _, detect, _ in batch]
+        for frame, _, _, _, _ in batch:
+            self.regions.apply_masks(frame)
+        frames = [frame for frame, _, _, detect, _ in batch if detect]
+        if not frames:
+            return [None] * len(batch)
+        height, width = frames[0].shape[:2]
+        left, top, right, bottom = self.regions.roi_bounds(width, height) or (0, 0, width, height)
+        if right <= left or bottom <= top:
+            results = iter([[] for _ in frames])
+        else:
+            # the detector only sees the part of the frame the ROIs cover
+            crops = self.detector.detect_batch([frame[top:bottom, left:right] for frame in frames])
+            results = iter([self.regions.select([d._replace(left=d.left + left, top=d.top + top) for d in detections], width, height)
+                for detections in crops])
+        return [next(results) if detect else None for _, _, _, detect, _ in batch]
+
+    def push_results(self):
+        # batches complete out of order on the workers, but are pushed downstream in order
+        failed = False
+        try:
+            while True:
+                with self.cond:
+                    while not self.in_flight and not self.eos:
+                        self.cond.wait()
+                    if not self.in_flight:
+                        break
+                    future, batch = self.in_flight.popleft()
+                try:
+                    # after a failure the frames are dropped rather than pushed unredacted, the error ends the run
+                    if not failed:
+                        self.push_batch(batch, future.result())
+                except Exception as e:
+                    failed = True
+                    self.post_error(e)
+                finally:
+                    self.slots.release()
+        finally:
+            self.appsrc.emit("end-of-stream")
+
+    def push_batch(self, batch, results):
+        for (frame, pts, duration, _, unchanged), detections in zip(batch, results):
+            if unchanged:
+                # handed on as a detection, so a tracker keeps its tracks alive over a static scene
+                detections = self.last_detected
+            elif detections is not None:
+                self.last_detected = detections
+            self.on_frame(self.source_index, frame, pts, detections)
+            buffer = Gst.Buffer.new_wrapped(frame.tobytes())
+            buffer.pts = pts
+            buffer.duration = duration
+            self.appsrc.emit("push-buffer", buffer)
+
+    def post_error(self, error):
+        """Reports a failed batch on the bus, where it ends the run like any element error"""
+        text = "cpu inference of source %d failed: %s" % (self.source_index, error)
+        self.appsrc.post_message(Gst.Message.new_error(self.appsrc, GLib.Error(text), traceback.format_exc()))
+
+def sample_to_frame(sample):
+    """Copies an RGBA sample into a writable (height, width, 4) array"""
+    structure = sample.get_caps().get_structure(0)
+    width = structure.get_value("width")
+    height = structure.get_value("height")
+    buffer = sample.get_buffer()
+    success, map_info = buffer.map(Gst.MapFlags.READ)
+    if not success:
+        raise RuntimeError("could not map buffer")
+    try:
+        frame = np.frombuffer(map_info.data, dtype=np.uint8).reshape(height, width, 4).copy()
+    finally:
+        buffer.unmap(map_info)
+    return frame, buffer.pts, buffer.duration
+
+def create_executor(num_workers):
+    """Returns the worker pool shared by the cpu inference stages of all the sources"""
+    return ThreadPoolExecutor(max_workers=max(1, num_workers), thread_name_prefix="cpu-infer")
@@ -8,16 +8,45 @@ import sys
 #sys.path.append('../')
 import argparse
 import traceback
-import pdb
 import time
 import json
 import base64
-#from _gst_nvds_bindings import ffi, lib
+import logging
+import platform
 import gi
 #gi.require_version('Gtk', '3.0')
 gi.require_version("Gst", "1.0")
-from gi.repository import Gst, GObject #, Gtk
-import pyds
+from gi.repository import Gst, GObject, GLib #, Gtk
+try:
+    import pyds
+except ImportError:
+    # pyds is only needed by the deepstream path, the cpu detector runs without it
+    pyds = None
+
+try:
+    # compiled batch metadata walker, see nvds_batch_walker_builder.py
+    import nvds_batch_walker
+except ImportError:
+    nvds_batch_walker = None
+
+from detections import Detection
+from app_helpers import computeDiffInMillis, parse_resolution, is_live_uri, read_input_manifest, \
+    output_location_for_source, kitti_dir_for_source
+from iou_tracker import IouTracker, expand
+from detection_writer import DetectionWriter, EXPORT_FORMATS, input_fingerprint, truncate_export
+from detection_reader import DetectionStore
+import output_encoders
+import redaction_styles
+from privacy_masks import load_regions
+from motion_gate import create_gates
+from checkpoint import Checkpoint
+from segmented_output import SegmentLog, segment_pattern, default_manifest
+from runtime_config import RuntimeSettings, ConfigWatcher
+from qos_controller import QosController
+from pipeline_profiles import load_profile, apply_element_properties, parse_args_with_profile
+from stage_stats import StageStats, StatsExporter, RateLimitedLog, STATS_FORMATS, print_summary
+
+logger = logging.getLogger("redaction")
 
 NVDS_META_STRING = b"nvdsmeta"
 GST_META_TAG_NVSTREAM = b"nvstream"
@@ -27,70 +56,410 @@ PGIE_CLASS_ID_VEHICLE = 0
 PGIE_CLASS_ID_BICYCLE = 1
 PGIE_CLASS_ID_PERSON = 2
 PGIE_CLASS_ID_ROADSIGN = 3
+# names of the classes of the fd_lpd model, used in the kitti files
+PGIE_CLASSES_STR = ["face", "license_plate", "make", "model"]
+
+# object_id of objects not tracked by nvtracker
+UNTRACKED_OBJECT_ID = 0xFFFFFFFFFFFFFFFF
+# unique_component_id of the objects added by the built-in tracker and by replays
+TRACKER_COMPONENT_ID = 2
+DEFAULT_TRACKER_LIB = "/opt/nvidia/deepstream/deepstream-4.0/lib/libnvds_mot_klt.so"
+
+# input name creating a videotestsrc instead of a file or URI source
+TEST_SOURCE = "videotestsrc"
+# queue leaky modes of the --drop_policy values
+DROP_POLICIES = {"none": 0, "newest": 1, "oldest": 2}
+# NvBufSurfaceMemType of the frames the osd probe maps on dGPU
+NVBUF_MEM_CUDA_UNIFIED = 3
 
 class Redaction_Main(object):
     """Class to initialize the deepstream redaction example pipeline"""
-    def __init__(self, args):
+    def __init__(self, args, run=True):
         super(Redaction_Main, self).__init__()
         self.args = args
-        self.pgie_classes_str = ["face", "license_plate", "make", "model"]
+        self.built = False
+        # message of the pipeline error that ended the run, if any
+        self.error = None
+        self.pgie_classes_str = PGIE_CLASSES_STR
+        self.inputs = args.input_mp4 or []
+        self.cpu_mode = args.detector in ("cpu", "stub")
+        self.num_sources = max(1, len(self.inputs))
         self.frame_number = 0
-        #self.statePtr = ffi.new("void **");
-        #self._nvdsmeta_quark = lib.g_quark_from_static_string(NVDS_META_STRING)
+        # per-source frame numbers and counters, indexed by frame_meta.pad_index
+        self.source_frame_numbers = [0] * self.num_sources
+        self.source_obj_counts = [0] * self.num_sources
+        self.source_kitti_dirs = [None] * self.num_sources
+        # live source reconnects, failed attempts since the last buffer, and pending reconnect timers
+        self.source_reconnects = [0] * self.num_sources
+        self.source_failures = [0] * self.num_sources
+        self.reconnect_timers = [None] * self.num_sources
+        # queues in front of the detector, and the frames they dropped by queue name
+        self.inference_queues = []
+        self.dropped_frames = {}
+        self.streammux = None
+        self.pgie = None
+        self.tracker = None
+        self.qos = None
+        self.qos_enabled = args.qos_target_fps is not None or args.qos_target_latency_ms is not None
+        self.eos_requested = False
+        self.sources = []
+        self.decoders = []
+        self.sinks = []
+        self.encoders = []
+        # elements timed by --stats_interval, and the ones where frames enter the processing
+        self.stage_elements = []
+        self.entry_elements = []
+        # source index of the timed elements that belong to a single source
+        self.stage_sources = {}
+        self.stats = None
+        self.stats_exporter = None
+        self.stats_snapshot = None
+        self.probe_log = RateLimitedLog(logger, args.log_interval)
+        # called as frame_listener(source_index, frame_number, pts, detections) for every recorded frame,
+        # from the streaming threads, and with every stats snapshot by stats_listeners
+        self.frame_listener = None
+        self.stats_listeners = []
+        # time spent in the per-frame callbacks (osd probe or cpu redaction)
+        self.probe_seconds = 0.0
+        self.detection_writer = None
+        self.batch_walker = None
+        # redaction style of each class, the blurred and pixelated ones are drawn on the frame
+        # buffer in the osd probe since nvdsosd can only fill
+        # swapped as a whole by update_settings, the probes read it once per frame
+        self.settings = RuntimeSettings(redaction_styles.parse_styles(args.redaction_style, self.pgie_classes_str))
+        self.config_watcher = None
+        if args.runtime_config is not None:
+            self.config_watcher = ConfigWatcher(args.runtime_config, args.runtime_config_interval, self.settings,
+                self.pgie_classes_str, self.update_settings)
+            self.settings = self.config_watcher.load()
+        # static masks and ROIs of each source, None when no source has any
+        self.regions = None
+        if args.privacy_regions is not None:
+            self.regions = load_regions(args.privacy_regions, self.inputs)
+        # stored detections rendered instead of running the detector
+        self.replay = None
+        if args.replay_detections is not None:
+            print("Replaying detections from", args.replay_detections)
+            self.replay = DetectionStore(args.replay_detections, self.pgie_classes_str)
+            self.replay.match_inputs(self.inputs)
+        # per-source frame differencing that skips the detector on unchanged frames, pointless on replays
+        self.motion_gates = None
+        if self.replay is None:
+            self.motion_gates = create_gates(args.motion_threshold, self.num_sources, args.motion_force_interval, args.motion_step)
+        if self.motion_gates is not None and not self.cpu_mode and args.tracker == "none":
+            # nvinfer is only gated after the fact, a tracker has to cover the moving frames it skipped
+            print("--motion_threshold needs a --tracker with nvinfer. Exiting.")
+            return
+        # the gates hold the nvinfer interval up while no source moves; interval set by --pgie_interval or the qos controller
+        self.motion_idle = False
+        self.pgie_base_interval = args.pgie_interval or 0
+        # frames the osd probe has to map to draw the styles and masks nvdsosd cannot, or to measure motion
+        self.map_frames = bool(self.settings.pixel_styles) or args.runtime_config is not None or \
+            self.regions is not None and any(r is not None and r.masks for r in self.regions) or self.motion_gates is not None
+        # resolution of the batched frames, in which nvinfer reports the boxes
+        self.muxer_width, self.muxer_height = parse_resolution(args.muxer_resolution)
+        # built-in tracker per source, which carries the boxes over the frames the detector skips
+        self.trackers = None
+        self.reset_trackers()
+        # fragments of the output written so far and the input position to continue from
+        self.checkpoint = None
+        self.reached_eos = False
+        if args.checkpoint is not None:
+            self.checkpoint = Checkpoint.open(args.checkpoint, self.inputs[0], args.output_mp4)
+            self.checkpoint.remove_stale_fragments()
+            if self.checkpoint.resuming():
+                print("Resuming at frame %d (%.1f s) from checkpoint %s" % (self.checkpoint.frame, self.checkpoint.pts / 1e9, args.checkpoint))
+                self.frame_number = self.source_frame_numbers[0] = self.checkpoint.frame
+                if args.output_kitti is not None:
+                    truncate_export(args.output_kitti, args.export_format, self.checkpoint.frame)
+        self.open_detection_writer(args.output_kitti)
+        # rolling segments of the file outputs, with their manifest
+        self.segmenting = (args.segment_seconds is not None or args.segment_size_mb is not None) and not args.fakesink
+        self.segments = None
+        self.open_segment_log(args.output_mp4)
+        # state the pipeline is left in at end of stream, READY when it is reused for another input
+        self.idle_state = Gst.State.NULL
         # Create gstreamer loop
         self.loop = GObject.MainLoop()
         # Create gstreamer pipeline
         self.pipeline = Gst.Pipeline.new("ds-redaction-pipeline")
-        # Create components for decoding the input source
-        if args.input_mp4:
-            self.source = Gst.ElementFactory.make("filesrc", "file-source")
-            self.source.set_property("location", args.input_mp4)
-            self.decoder = Gst.ElementFactory.make("decodebin", "decoder")
-            self.decoder.connect("pad-added", self.cb_newpad, self)
-            self.pipeline.add(self.source)
-            self.pipeline.add(self.decoder) # add decode bin into the pipeline
-            self.source.link(self.decoder)
-        else:
-            self.source = Gst.ElementFactory.make("v4l2src", "camera-source")
-            self.source.set_property("device", "/dev/video0")
-            self.vidconv_src = Gst.ElementFactory.make("videoconvert", "vidconv_src")
-            self.nvvidconv_src = Gst.ElementFactory.make("nvvideoconvert", "nvvidconv_src")
-            self.filter_src = Gst.ElementFactory.make("capsfilter", "filter_src")
-            self.nvvidconv_src.set_property("nvbuf-memory-type", 0)
-            caps_filter_src = Gst.Caps.from_string("video/x-raw(memory:NVMM), format=NV12, width=1280, height=720, framerate=30/1")
-            self.filter_src.set_property("caps", caps_filter_src)
-            self.pipeline.add(self.source)
-            self.pipeline.add(self.vidconv_src)
-            self.pipeline.add(self.nvvidconv_src)
-            self.pipeline.add(self.filter_src)
-            self.source.link(self.vidconv_src)
-            self.vidconv_src.link(self.nvvidconv_src)
-            self.nvvidconv_src.link(self.filter_src)
-            # caps_filter_src.unref() or gst_caps_unref
+        if self.pipeline is None:
+            print("pipeline could not be created. Exiting.")
+            return
         # Create main processing bin
         self.video_full_processing_bin = Gst.Bin.new("video-process-bin")
+        if self.video_full_processing_bin is None:
+            print("video_full_processing_bin could not be created. Exiting.")
+            return
+        if self.cpu_mode:
+            if not self.create_cpu_processing():
+                return
+        elif not self.create_deepstream_processing():
+            return
+        self.video_full_processing_bin_sink_pad = self.video_full_processing_bin_sink_pads[0]
+        self.pipeline.add(self.video_full_processing_bin)
+
+        # Create components for decoding the input sources
+        if self.inputs:
+            for index, location in enumerate(self.inputs):
+                if not self.create_source(index, location):
+                    return
+        else:
+            if not self.create_camera_source(0):
+                return
+
+        if self.checkpoint is not None and self.checkpoint.resuming():
+            # drops the frames decoded before the seek to the checkpoint position
+            self.resume_seeked = False
+            self.resume_seek_done = False
+            self.video_full_processing_bin_sink_pads[0].add_probe(Gst.PadProbeType.BUFFER, self.resume_probe, None)
+
+        if args.profile is not None:
+            # element properties of the profile override the defaults set above
+            apply_element_properties(load_profile(args.profile), self.pipeline)
+
+        # we add a message handler
+        # PyGObject owns the references of the wrappers, unref()ing them by hand frees objects
+        # still in use and leaks or crashes on long runs
+        self.bus = self.pipeline.get_bus()
+        self.bus.add_signal_watch()
+        self.bus_watch_id = self.bus.connect ("message", self.bus_call, self.loop)
+        # Set up the pipeline
+
+        self.built = True
+        if run:
+            self.run()
+
+    def reset_trackers(self):
+        if self.args.tracker == "iou" and self.replay is None:
+            self.trackers = [IouTracker(max_age=self.args.tracker_max_age, margin=self.args.tracker_margin) for i in range(self.num_sources)]
+        self.last_detections = [[] for i in range(self.num_sources)]
+        # boxes of the last frame nvinfer ran on, reused on the frames the motion gates find unchanged
+        self.last_inferred = [[] for i in range(self.num_sources)]
+        if self.motion_gates is not None:
+            for gate in self.motion_gates:
+                gate.reset()
+
+    def open_detection_writer(self, output_kitti):
+        """Closes the current detection writer and starts one writing to output_kitti, if it is set"""
+        self.close_detection_writer()
+        self.detection_writer = None
+        if output_kitti is not None and not os.path.isdir(output_kitti):
+            print("Warning: kitti folder", output_kitti, "does not exist, detections are not written")
+            output_kitti = None
+        self.source_kitti_dirs = [kitti_dir_for_source(output_kitti, i, self.num_sources) for i in range(self.num_sources)]
+        if output_kitti is None:
+            return
+        sources = [{"input": location, "fingerprint": input_fingerprint(location)} for location in self.inputs] or \
+            [{"input": "webcam", "fingerprint": None}]
+        self.detection_writer = DetectionWriter(output_kitti, self.source_kitti_dirs, self.pgie_classes_str,
+            self.args.export_format, self.args.export_queue_size, sources=sources,
+            append=self.checkpoint is not None and self.checkpoint.resuming())
+        if not self.cpu_mode:
+            # nvinfer reports the boxes in streammux coordinates, the cpu path records the frame size on the first frame
+            for index in range(self.num_sources):
+                self.detection_writer.set_frame_size(index, self.muxer_width, self.muxer_height)
+
+    def close_detection_writer(self):
+        """Closes the detection writer, a failed write fails the run. The closed writer is kept for its counters"""
+        if self.detection_writer is None:
+            return
+        error = self.detection_writer.close()
+        if error is not None and self.error is None:
+            self.error = "detection writer: " + error
+
+    def open_segment_log(self, output_location):
+        """Closes the current segment manifest and starts the one of output_location, when segmenting"""
+        if self.segments is not None:
+            self.segments.close()
+            self.segments = None
+        if not self.segmenting or output_location is None:
+            return
+        self.segments = SegmentLog(self.args.segment_manifest or default_manifest(output_location), self.args.segment_command)
+
+    def retarget(self, location, output_location=None, output_kitti=None):
+        """Points the idle pipeline of a single file input at another input file and outputs, so the
+        same graph, detector and engine serve several runs. The pipeline must be in READY or NULL."""
+        self.inputs = [location]
+        self.sources[0].set_property("location", location)
+        if output_location is not None:
+            self.sinks[0].set_property("location", segment_pattern(output_location) if self.segmenting else output_location)
+            self.open_segment_log(output_location)
+        self.open_detection_writer(output_kitti)
+        self.error = None
+        self.eos_requested = False
+        self.reached_eos = False
+        self.frame_number = 0
+        self.source_frame_numbers = [0] * self.num_sources
+        self.source_obj_counts = [0] * self.num_sources
+        self.probe_seconds = 0.0
+        self.source_reconnects = [0] * self.num_sources
+        for name in self.dropped_frames:
+            self.dropped_frames[name] = 0
+        # the previous input may have ended on a static scene, with the motion gates holding nvinfer back
+        self.motion_idle = False
+        if self.pgie is not None:
+            self.set_inference_interval(self.pgie_start_interval)
+        # also forgets the boxes of the last inferred frames and the reference frames of the motion gates
+        self.reset_trackers()
+        if self.cpu_mode:
+            for stage in self.cpu_stages:
+                stage.reset()
+
+    def run(self):
+        """Plays the pipeline until end of stream or error, then tears it down"""
+        if not self.built:
+            return
+        self.play()
+        self.finish()
+
+    def finish(self):
+        """Tears the pipeline down, and writes the output of a checkpointed job that reached its end"""
+        self.teardown()
+        if self.checkpoint is not None and self.reached_eos and self.error is None:
+            print("Writing", self.args.output_mp4, "from", len(self.checkpoint.segments), "fragments")
+            self.checkpoint.finish(output_encoders.CONTAINERS[self.args.container])
+
+    def play(self):
+        """Plays the pipeline until end of stream or error, and leaves it in idle_state"""
+        self.start_playing()
+        try:
+            self.loop.run()
+            #GST_DEBUG_BIN_TO_DOT_FILE_WITH_TS (GST_BIN (pipeline), GST_DEBUG_GRAPH_SHOW_ALL, "ds-app-playing");
+        except:
+            traceback.print_exc()
+        self.stop_playing()
+
+    def start_playing(self):
+        """Sets the pipeline playing with its stats and qos timers, without running a main loop. The bus
+        and the timers are served by whichever loop runs the default GLib context."""
+        # Set the pipeline to "playing" state
+        if self.inputs:
+            print("Now playing: ", ", ".join(self.inputs))
+        else:
+            print("Now playing from webcam")
+
+        if self.args.stats_interval > 0:
+            self.stats = StageStats(self.stage_elements, self.entry_elements, self.dropped_frames, self.motion_gates,
+                self.stage_sources)
+            self.stats_exporter = StatsExporter(self.stats, self.args.stats_file, self.args.stats_format, self.args.stats_interval,
+                self.stats_listeners)
+
+        self.start = time.time()
+        self.pipeline.set_state(Gst.State.PLAYING)
+        if self.qos_enabled:
+            self.qos = QosController(self, self.args)
+            self.qos.start()
+
+    def stop_playing(self):
+        """Stops the timers started by start_playing once the stream ended, and reports the run"""
+        # Out of the main loop, clean up nicely
+        self.end = computeDiffInMillis(self.start, time.time())
+        print ("Returned, stopping playback, time to execute:", str(self.end), "ms")
+        self.print_source_stats()
+        if self.qos is not None:
+            self.qos.stop()
+            self.qos = None
+        if self.stats_exporter is not None:
+            self.stats_snapshot = self.stats_exporter.stop()
+            self.stats.remove()
+            self.stats_exporter = None
+            print_summary(self.stats_snapshot)
+        self.pipeline.set_state(self.idle_state)
+
+    def teardown(self):
+        """Releases the pipeline, the detector workers and the detection writer"""
+        self.pipeline.set_state(Gst.State.NULL)
+        if self.cpu_mode:
+            self.cpu_executor.shutdown(wait=False)
+        self.close_detection_writer()
+        if self.segments is not None:
+            # waits for the segment commands of the last segments
+            self.segments.close()
+        if self.config_watcher is not None:
+            self.config_watcher.stop()
+        #self.osd_sink_pad.remove_probe(self.osd_probe_id)
+        print ("Deleting pipeline")
+        # the watch holds a reference on the bus and the handler one on this object
+        self.bus.disconnect(self.bus_watch_id)
+        self.bus.remove_signal_watch()
+
+    def create_deepstream_processing(self):
+        """Creates the streammux, nvinfer and nvdsosd components of video_full_processing_bin"""
         self.streammux = Gst.ElementFactory.make("nvstreammux", "stream-muxer")
-        self.streammux.set_property("width", 1280)
-        self.streammux.set_property("height", 720)
-        self.streammux.set_property("batch-size", 1)
-        self.streammux.set_property("batched-push-timeout", 40000)
+        if self.streammux is None:
+            print("streammux could not be created. Exiting.")
+            return False
+        self.streammux.set_property("width", self.muxer_width)
+        self.streammux.set_property("height", self.muxer_height)
+        # one batch slot per source, so all the sources share a single inference call
+        self.streammux.set_property("batch-size", self.num_sources)
+        self.streammux.set_property("batched-push-timeout", self.args.batched_push_timeout)
+        if self.has_live_sources():
+            self.streammux.set_property("live-source", True)
         self.streammux.set_property("nvbuf-memory-type", 0)
+        self.video_full_processing_bin.add(self.streammux)
 
-        pad_name_sink = "sink_0"
-        self.videopad = self.streammux.get_request_pad(pad_name_sink)
+        # request one streammux sink pad per source and expose it on the bin as sink_%u
+        self.video_full_processing_bin_sink_pads = []
+        for index in range(self.num_sources):
+            pad_name_sink = "sink_%u" % index
+            videopad = self.streammux.get_request_pad(pad_name_sink)
+            if videopad is None:
+                print("streammux request sink pad", pad_name_sink, "failed. Exiting.")
+                return False
+            ghost_pad = Gst.GhostPad.new(pad_name_sink, videopad)
+            self.video_full_processing_bin.add_pad(ghost_pad)
+            self.video_full_processing_bin_sink_pads.append(ghost_pad)
+            if index == 0:
+                self.videopad = videopad
+        self.video_full_processing_bin_sink_pad = self.video_full_processing_bin_sink_pads[0]
 
         # Use nvinfer to run inferencing on decoder's output,
         # behaviour of inferencing is set through config file.
         # Create components for the detection
         self.queue_pgie = Gst.ElementFactory.make("queue", "queue_pgie")
-        self.pgie = Gst.ElementFactory.make("nvinfer", "primary-nvinference-engine")
-        self.pgie.set_property("config-file-path", args.pgie_config)
-        #self.videopad = self.queue_pgie.get_static_pad("sink")
+        if self.queue_pgie is None:
+            print("queue_pgie could not be created. Exiting.")
+            return False
+        self.configure_latency_queue(self.queue_pgie)
+        if self.replay is None:
+            self.pgie = Gst.ElementFactory.make("nvinfer", "primary-nvinference-engine")
+            if self.pgie is None:
+                print("pgie could not be created. Exiting.")
+                return False
+            self.pgie.set_property("config-file-path", self.pgie_config_path())
+            # the batch size set on the element overrides the one in the config file
+            self.pgie.set_property("batch-size", self.num_sources)
+            if self.args.pgie_interval is not None:
+                self.pgie.set_property("interval", self.args.pgie_interval)
+            self.pgie_base_interval = self.pgie.get_property("interval")
+            # restored for every input of a retargeted pipeline
+            self.pgie_start_interval = self.pgie_base_interval
+        if self.args.tracker == "nvtracker" and self.replay is None:
+            self.tracker = Gst.ElementFactory.make("nvtracker", "tracker")
+            if self.tracker is None:
+                print("tracker could not be created. Exiting.")
+                return False
+            self.tracker.set_property("ll-lib-file", self.args.tracker_lib)
+            self.tracker.set_property("tracker-width", 640)
+            self.tracker.set_property("tracker-height", 368)
+            if self.tracker.find_property("enable-batch-process") is not None:
+                self.tracker.set_property("enable-batch-process", True)
 
         # Use nvosd to render bbox/text on top of the input video.
         # Create components for the rendering
         self.nvvidconv_osd = Gst.ElementFactory.make ("nvvideoconvert", "nvvidconv_osd")
         self.osd = Gst.ElementFactory.make("nvdsosd", "nv-onscreendisplay")
+        if self.nvvidconv_osd is None:
+            print("nvvidconv_osd could not be created. Exiting.")
+            return False
+        if self.osd is None:
+            print("osd could not be created. Exiting.")
+            return False
+        if self.map_frames and platform.machine() != "aarch64":
+            # the osd probe maps the frames on the cpu, which needs unified memory on dGPU
+            self.nvvidconv_osd.set_property("nvbuf-memory-type", NVBUF_MEM_CUDA_UNIFIED)
 
         #self.queue_osd = Gst.ElementFactory.make("queue", "queue_osd")
 
@@ -99,169 +468,49 @@ class Redaction_Main(object):
         #self.filter_osd.set_property("caps", caps_filter_osd)
         # caps_filter_osd.unref() or gst_caps_unref
         # self.osd.set_property("gpu-id", 0)
-        # Create components for the output
-        if args.output_mp4 is not None:
-            # If output file is set, then create components for encoding and exporting to mp4 file
-            print("Sending output to ", args.output_mp4)
-            self.queue_sink = Gst.ElementFactory.make("queue", "queue_sink")
-            self.nvvidconv_sink = Gst.ElementFactory.make("nvvideoconvert", "nvvidconv_sink")
-            self.filter_sink = Gst.ElementFactory.make("capsfilter", "filter_sink")
-            caps_filter_sink = Gst.Caps.from_string("video/x-raw, format=I420")
-            self.filter_sink.set_property("caps", caps_filter_sink)
-            # caps_filter_sink.unref() or gst_caps_unref
-            self.videoconvert = Gst.ElementFactory.make("videoconvert", "videoconverter")
-            self.encoder = Gst.ElementFactory.make("avenc_mpeg4", "mp4-encoder")
-            self.encoder.set_property("bitrate", 1000000)
-            self.muxer = Gst.ElementFactory.make("qtmux", "muxer")
-            self.sink = Gst.ElementFactory.make("filesink", "nvvideo-renderer")
-            self.sink.set_property("location", args.output_mp4)
-        else:
-            if os.uname().machine == 'aarch64': # PLATFORM_TEGRA
-                self.transform = Gst.ElementFactory.make("nvegltransform", "nvegl-transform")
-                if self.transform is None:
-                    print("One tegra element could not be created. Exiting.")
-                    return
-
-                self.sink = Gst.ElementFactory.make("nveglglessink", "nvvideo-renderer")
-                self.sink.set_property("sync", False)
-                self.sink.set_property("max-lateness", -1)
-                self.sink.set_property("async", False)
-                self.sink.set_property("qos", True)
-            else:
-                self.sink = Gst.ElementFactory.make("nveglglessink", "nvvideo-renderer")
-                self.sink.set_property("sync", False)
-                self.sink.set_property("max-lateness", -1)
-                self.sink.set_property("async", False)
-                self.sink.set_property("qos", True)
-                if args.input_mp4:
-                    self.sink.set_property("sync", True)
 
-
-        # Check all components
-        if self.pipeline is None:
-            print("pipeline could not be created. Exiting.")
-            return
-        if self.source is None:
-            print("source could not be created. Exiting.")
-            return
-        if args.input_mp4 is not None and self.decoder is None:
-            print("decoder could not be created. Exiting.")
-            return
-        if self.video_full_processing_bin is None:
-            print("video_full_processing_bin could not be created. Exiting.")
-            return
-        if self.queue_pgie is None:
-            print("queue_pgie could not be created. Exiting.")
-            return
-        if self.pgie is None:
-            print("pgie could not be created. Exiting.")
-            return
-        if args.output_mp4 is not None and self.queue_sink is None:
-            print("queue_sink could not be created. Exiting.")
-            return
-        if self.nvvidconv_osd is None:
-            print("nvvidconv_osd could not be created. Exiting.")
-            return
-        if args.input_mp4 is None and self.filter_src is None:
-            print("filter_src could not be created. Exiting.")
-            return
-        if self.osd is None:
-            print("osd could not be created. Exiting.")
-            return
-        if self.sink is None:
-            print("sink could not be created. Exiting.")
-            return
-
-
-        # we add a message handler
-        bus = self.pipeline.get_bus()
-        bus.add_signal_watch()
-        self.bus_watch_id = bus.connect ("message", self.bus_call, self.loop)
-        bus.unref() #Gst.Object.unref(bus)
-        # Set up the pipeline
-        
         # Set up the video_full_processing_bin
-        # add all the elements to the bin
-        self.video_full_processing_bin.add(self.streammux)
-        self.video_full_processing_bin.add(self.queue_pgie)
-        self.video_full_processing_bin.add(self.pgie)
-        self.video_full_processing_bin.add(self.nvvidconv_osd)
-        #self.video_full_processing_bin.add(self.filter_osd)
-        self.video_full_processing_bin.add(self.osd)
-        # link the elements together
-        self.streammux.link(self.queue_pgie)
-        self.queue_pgie.link(self.pgie)
-        self.pgie.link(self.nvvidconv_osd)
+        # add all the elements to the bin and link them together. A replay has no pgie,
+        # the stored boxes are attached in the osd probe.
+        elements = [e for e in (self.streammux, self.queue_pgie, self.pgie, self.tracker, self.nvvidconv_osd, self.osd) if e is not None]
+        for element in elements[1:]:
+            self.video_full_processing_bin.add(element)
+        for upstream, downstream in zip(elements, elements[1:]):
+            upstream.link(downstream)
         #self.nvvidconv_osd.link(self.filter_osd)
         #self.filter_osd.link(self.osd)
-        self.nvvidconv_osd.link(self.osd)
-
-        if args.output_mp4 is not None:
-            print("Sending output to ", args.output_mp4)
-            self.video_full_processing_bin.add(self.queue_sink)
-            self.video_full_processing_bin.add(self.nvvidconv_sink)
-            self.video_full_processing_bin.add(self.filter_sink)
-            self.video_full_processing_bin.add(self.videoconvert)
-            self.video_full_processing_bin.add(self.encoder)
-            self.video_full_processing_bin.add(self.muxer)
-            self.video_full_processing_bin.add(self.sink)
-            # link the elements together
-            self.osd.link(self.queue_sink)
-            self.queue_sink.link(self.nvvidconv_sink)
-            self.nvvidconv_sink.link(self.filter_sink)
-            self.filter_sink.link(self.videoconvert)
-            self.videoconvert.link(self.encoder)
-            self.encoder.link(self.muxer)
-            self.muxer.link(self.sink)
-        else:
-            self.video_full_processing_bin.add(self.sink)
-            self.osd.link(self.sink)
+        self.stage_elements.extend(elements)
+        self.entry_elements.append(self.streammux)
 
-        # add the video_full_processing_bin into the pipeline
-        self.video_full_processing_bin_sink_pad = Gst.GhostPad.new("sink", self.videopad)
-        self.video_full_processing_bin.add_pad(self.video_full_processing_bin_sink_pad)
-        #Gst.Object.unref(self.videopad)
-        self.pipeline.add(self.video_full_processing_bin)
+        # Create components for the output. With several sources the batched buffer
+        # is split back into per-source streams, each with its own output branch.
+        if self.num_sources > 1:
+            self.demux = Gst.ElementFactory.make("nvstreamdemux", "stream-demuxer")
+            if self.demux is None:
+                print("demux could not be created. Exiting.")
+                return False
+            self.video_full_processing_bin.add(self.demux)
+            self.osd.link(self.demux)
+        for index in range(self.num_sources):
+            branch = self.create_output_branch(index)
+            if branch is None:
+                return False
+            if self.num_sources > 1:
+                srcpad = self.demux.get_request_pad("src_%u" % index)
+                sinkpad = branch.get_static_pad("sink")
+                if srcpad is None or sinkpad is None or srcpad.link(sinkpad) != Gst.PadLinkReturn.OK:
+                    print("Failed to link demux to output branch", index, ". Exiting.")
+                    return False
+            elif not self.osd.link(branch):
+                print("Failed to link osd to output branch. Exiting.")
+                return False
 
-        # link soure and video_full_processing_bin
-        if args.input_mp4 is None:
-            sinkpad = self.video_full_processing_bin.get_static_pad("sink")
-            if sinkpad is None:
-                print("video_full_processing_bin request sink pad failed. Exiting.")
-                return
-            srcpad = self.filter_src.get_static_pad("src")
-            if srcpad is None:
-                print("filter_src request src pad failed. Exiting.")
-                return
-            if srcpad.link(sinkpad) != Gst.PadLinkReturn.OK:
-                print("Failed to link pads. Exiting.")
-                return
-            sinkpad.unref()
-            srcpad.unref()
-        if args.output_mp4:
-            self.video_full_processing_bin.add(self.queue_sink)
-            self.video_full_processing_bin.add(self.nvvidconv_sink)
-            self.video_full_processing_bin.add(self.filter_sink)
-            self.video_full_processing_bin.add(self.videoconvert)
-            self.video_full_processing_bin.add(self.encoder)
-            self.video_full_processing_bin.add(self.muxer)
-            self.video_full_processing_bin.add(self.sink)
-            self.osd.link(self.queue_sink)
-            self.queue_sink.link(self.nvvidconv_sink)
-            self.nvvidconv_sink.link(self.filter_sink)
-            self.filter_sink.link(self.videoconvert)
-            self.videoconvert.link(self.encoder)
-            self.encoder.link(self.muxer)
-            self.muxer.link(self.sink)
+        walker_disabled = self.native_walker_disabled()
+        if walker_disabled is None:
+            print("Using the native batch metadata walker")
+            self.batch_walker = nvds_batch_walker.BatchMetaWalker(self.settings.fill_colors(), len(self.pgie_classes_str), self.num_sources)
         else:
-            if os.uname().machine == 'aarch64': # PLATFORM_TEGRA
-                self.video_full_processing_bin.add(self.transform)
-                self.video_full_processing_bin.add(self.sink)
-                self.osd.link(self.transform)
-                self.transform.link(self.sink)
-            else:
-                self.video_full_processing_bin.add(self.sink)
-                self.osd.link(self.sink)
+            logger.info("walking the batch metadata through pyds: %s", walker_disabled)
 
         # add probe to get informed of the meta data generated, we add probe to
         # the sink pad of the osd element, since by that time, the buffer would have
@@ -272,34 +521,475 @@ class Redaction_Main(object):
         else:
             print("Adding probe for sink pad of osd")
             self.osd_probe_id = self.osd_sink_pad.add_probe(Gst.PadProbeType.BUFFER, self.osd_sink_pad_buffer_probe, None)
+        return True
 
-        # Set the pipeline to "playing" state
-        if args.input_mp4:
-            print("Now playing: ", args.input_mp4)
+    def native_walker_disabled(self):
+        """Returns why the batch metadata can not be walked by the compiled walker, or None when it can"""
+        if self.args.no_native_walker:
+            return "--no_native_walker is set"
+        if nvds_batch_walker is None or not nvds_batch_walker.available():
+            return "the walker is not built, see nvds_batch_walker_builder.py"
+        # the walker only styles and exports, everything rewriting or filtering the object metadata needs pyds
+        if self.args.tracker != "none":
+            return "the tracker rewrites the object metadata"
+        if self.replay is not None:
+            return "replayed detections are added to the metadata"
+        if self.map_frames:
+            return "the frames are mapped for pixel styles, masks or motion gating"
+        if self.regions is not None:
+            return "privacy regions are added to the metadata"
+        if self.args.runtime_config is not None:
+            return "--runtime_config can set class thresholds and disable classes"
+        return None
+
+    def pgie_config_path(self):
+        """The pgie config, or with --engine_cache a copy of it pointing at the cached engine for this batch size"""
+        if self.args.engine_cache is None:
+            return self.args.pgie_config
+        import engine_cache
+        cache = engine_cache.EngineCache(self.args.engine_cache, self.args.engine_cache_size)
+        return cache.ensure(self.args.pgie_config, self.num_sources, engine_cache.build_with_nvinfer)
+
+    def create_cpu_processing(self):
+        """Creates the cpu replacement of streammux, nvinfer and nvdsosd: one appsink/appsrc pair per source
+        around a detector shared by all the sources"""
+        import cpu_inference
+        if self.replay is not None:
+            # stages without a detector pass every frame through as skipped
+            self.cpu_detector = None
+        elif self.args.detector == "stub":
+            self.cpu_detector = cpu_inference.StubDetector(self.args.stub_objects)
         else:
-            print("Now playing from webcam")
+            self.cpu_detector = cpu_inference.OpenCVDetector(self.args.pgie_config, self.args.cpu_workers)
+        self.cpu_executor = cpu_inference.create_executor(self.args.cpu_workers)
+        self.cpu_stages = []
+        self.video_full_processing_bin_sink_pads = []
+        for index in range(self.num_sources):
+            queue_infer = None
+            if self.args.latency_budget_ms > 0 or self.qos_enabled:
+                queue_infer = Gst.ElementFactory.make("queue", "queue_infer_%u" % index)
+                if queue_infer is None:
+                    print("queue_infer could not be created. Exiting.")
+                    return False
+                self.configure_latency_queue(queue_infer)
+            vidconv_infer = Gst.ElementFactory.make("videoconvert", "vidconv_infer_%u" % index)
+            filter_infer = Gst.ElementFactory.make("capsfilter", "filter_infer_%u" % index)
+            appsink = Gst.ElementFactory.make("appsink", "cpu-infer-sink-%u" % index)
+            appsrc = Gst.ElementFactory.make("appsrc", "cpu-infer-src-%u" % index)
+            if None in (vidconv_infer, filter_infer, appsink, appsrc):
+                print("cpu inference components for source", index, "could not be created. Exiting.")
+                return False
+            filter_infer.set_property("caps", Gst.Caps.from_string("video/x-raw, format=RGBA"))
+            for element in (vidconv_infer, filter_infer, appsink, appsrc):
+                self.video_full_processing_bin.add(element)
+            vidconv_infer.link(filter_infer)
+            filter_infer.link(appsink)
+            first = vidconv_infer
+            if queue_infer is not None:
+                # drops frames ahead of the detector instead of letting the latency grow
+                self.video_full_processing_bin.add(queue_infer)
+                queue_infer.link(vidconv_infer)
+                first = queue_infer
+            self.stage_elements.extend([first, vidconv_infer, appsink] if queue_infer is not None else [vidconv_infer, appsink])
+            for element in (first, vidconv_infer, appsink):
+                self.stage_sources[element] = index
+            self.entry_elements.append(first)
+            ghost_pad = Gst.GhostPad.new("sink_%u" % index, first.get_static_pad("sink"))
+            self.video_full_processing_bin.add_pad(ghost_pad)
+            self.video_full_processing_bin_sink_pads.append(ghost_pad)
 
-        self.start = time.time()
-        self.pipeline.set_state(Gst.State.PLAYING)
+            branch = self.create_output_branch(index)
+            if branch is None:
+                return False
+            if not appsrc.link(branch):
+                print("Failed to link appsrc to output branch", index, ". Exiting.")
+                return False
+            self.cpu_stages.append(cpu_inference.CpuInferenceStage(self.cpu_detector, appsink, appsrc, index,
+                self.cpu_executor, self.args.cpu_workers, self.args.cpu_batch_size, self.cpu_frame_redacted,
+                self.args.pgie_interval or 0, self.regions[index] if self.regions is not None else None,
+                self.motion_gates[index] if self.motion_gates is not None else None))
+        return True
 
-        try:
-            self.loop.run()
-            #GST_DEBUG_BIN_TO_DOT_FILE_WITH_TS (GST_BIN (pipeline), GST_DEBUG_GRAPH_SHOW_ALL, "ds-app-playing");
-        except:
-            traceback.print_exc()
-        # Out of the main loop, clean up nicely
-        self.end = computeDiffInMillis(self.start, time.time())
-        print ("Returned, stopping playback, time to execute:", str(self.end), "ms")
-        self.pipeline.set_state(Gst.State.NULL)
-        #self.osd_sink_pad.remove_probe(self.osd_probe_id)
-        print ("Deleting pipeline")
-        self.pipeline.unref()
-        # GObject.Source.remove(self.bus_watch_id)
-        self.loop.unref()
+    def create_source(self, index, location):
+        """Creates the decoding components for one input and links them to sink_<index> of video_full_processing_bin"""
+        if location.startswith(TEST_SOURCE):
+            # software stand-in for a camera or file, used for testing the source wiring
+            source = Gst.ElementFactory.make("videotestsrc", "test-source-%u" % index)
+            if source is None:
+                print("source could not be created. Exiting.")
+                return False
+            num_buffers = location[len(TEST_SOURCE) + 1:]
+            if num_buffers:
+                source.set_property("num-buffers", int(num_buffers))
+            filter_test = Gst.ElementFactory.make("capsfilter", "filter_test_%u" % index)
+            if filter_test is None:
+                print("source could not be created. Exiting.")
+                return False
+            width, height = parse_resolution(self.args.test_resolution)
+            filter_test.set_property("caps", Gst.Caps.from_string("video/x-raw, width=%d, height=%d, framerate=30/1" % (width, height)))
+            self.pipeline.add(source)
+            self.sources.append(source)
+            if not self.link_raw_source(index, filter_test):
+                return False
+            return source.link(filter_test)
+        if "://" in location:
+            source = self.create_uri_source(index, location)
+            if source is None:
+                return False
+            self.sources.append(source)
+            self.decoders.append(source)
+            if is_live_uri(location):
+                # drops the end of stream of a live source and reconnects it instead
+                self.video_full_processing_bin_sink_pads[index].add_probe(
+                    Gst.PadProbeType.BUFFER | Gst.PadProbeType.EVENT_DOWNSTREAM, self.live_source_probe, index)
+            return True
+        source = Gst.ElementFactory.make("filesrc", "file-source-%u" % index)
+        decoder = Gst.ElementFactory.make("decodebin", "decoder-%u" % index)
+        if source is None:
+            print("source could not be created. Exiting.")
+            return False
+        if decoder is None:
+            print("decoder could not be created. Exiting.")
+            return False
+        source.set_property("location", location)
+        decoder.connect("pad-added", self.cb_newpad, index)
+        self.pipeline.add(source)
+        self.pipeline.add(decoder) # add decode bin into the pipeline
+        source.link(decoder)
+        self.sources.append(source)
+        self.decoders.append(decoder)
+        return True
+
+    def create_uri_source(self, index, location):
+        """Creates a uridecodebin for location and adds it to the pipeline, its pads are linked by cb_newpad"""
+        source = Gst.ElementFactory.make("uridecodebin", "uri-decode-bin-%u" % index)
+        if source is None:
+            print("source could not be created. Exiting.")
+            return None
+        source.set_property("uri", location)
+        source.connect("pad-added", self.cb_newpad, index)
+        source.connect("source-setup", self.on_source_setup)
+        self.pipeline.add(source)
+        return source
+
+    def on_source_setup(self, uridecodebin, source):
+        """Configures the network source created by uridecodebin"""
+        if source.find_property("latency") is not None:
+            source.set_property("latency", self.args.rtsp_latency)
+        if self.args.rtsp_tcp and source.find_property("protocols") is not None:
+            Gst.util_set_object_arg(source, "protocols", "tcp")
+        if self.args.latency_budget_ms > 0 and source.find_property("drop-on-latency") is not None:
+            source.set_property("drop-on-latency", True)
+
+    def create_camera_source(self, index):
+        """Creates the webcam components and links them to sink_<index> of video_full_processing_bin"""
+        source = Gst.ElementFactory.make("v4l2src", "camera-source")
+        filter_camera = Gst.ElementFactory.make("capsfilter", "filter_camera")
+        if source is None or filter_camera is None:
+            print("source could not be created. Exiting.")
+            return False
+        source.set_property("device", self.args.camera_device)
+        width, height = parse_resolution(self.args.camera_resolution)
+        filter_camera.set_property("caps", Gst.Caps.from_string("video/x-raw, width=%d, height=%d, framerate=%d/1" % (width, height, self.args.camera_fps)))
+        self.pipeline.add(source)
+        self.sources.append(source)
+        if not self.link_raw_source(index, filter_camera):
+            return False
+        return source.link(filter_camera)
+
+    def has_live_sources(self):
+        return not self.inputs or any(is_live_uri(location) for location in self.inputs)
+
+    def configure_latency_queue(self, queue):
+        """Registers a queue in front of the detector. With --latency_budget_ms it is bounded to that
+        much video and drops frames by --drop_policy once full"""
+        self.inference_queues.append(queue)
+        self.dropped_frames[queue.get_name()] = 0
+        queue.connect("overrun", self.on_queue_overrun)
+        if self.args.latency_budget_ms <= 0:
+            return
+        queue.set_property("max-size-time", int(self.args.latency_budget_ms * Gst.MSECOND))
+        queue.set_property("max-size-bytes", 0)
+        queue.set_property("leaky", DROP_POLICIES[self.args.drop_policy])
+
+    def on_queue_overrun(self, queue):
+        # a full leaky queue drops one frame for each incoming one, a full non leaky queue blocks
+        if queue.get_property("leaky") != 0:
+            self.dropped_frames[queue.get_name()] += 1
+
+    def inference_interval(self):
+        """Frames currently skipped by the detector between two detections"""
+        if self.pgie is not None:
+            # the property is raised by the motion gates while the scene is static
+            return self.pgie_base_interval
+        return self.args.pgie_interval or 0
+
+    def set_inference_interval(self, interval):
+        self.pgie_base_interval = interval
+        if self.pgie is not None and not self.motion_idle:
+            self.pgie.set_property("interval", interval)
+        if self.cpu_mode:
+            for stage in self.cpu_stages:
+                stage.interval = interval
+
+    def set_overload_drops(self, policy):
+        """"oldest" makes the queues in front of the detector drop the oldest frames once full,
+        "configured" restores --drop_policy"""
+        for queue in self.inference_queues:
+            if policy == "oldest":
+                queue.set_property("leaky", DROP_POLICIES["oldest"])
+                if self.args.latency_budget_ms <= 0 and self.args.qos_target_latency_ms is not None:
+                    queue.set_property("max-size-time", int(self.args.qos_target_latency_ms * Gst.MSECOND))
+            else:
+                queue.set_property("leaky", DROP_POLICIES[self.args.drop_policy] if self.args.latency_budget_ms > 0 else 0)
+                if self.args.latency_budget_ms <= 0:
+                    queue.set_property("max-size-time", Gst.SECOND)
+
+    def live_source_probe(self, pad, info, index):
+        if info.type & Gst.PadProbeType.BUFFER:
+            self.source_failures[index] = 0
+            return Gst.PadProbeReturn.OK
+        event = info.get_event()
+        if event is not None and event.type == Gst.EventType.EOS and self.args.reconnect_attempts != 0 and not self.eos_requested:
+            logger.warning("source %d (%s) ended, reconnecting", index, self.inputs[index])
+            self.schedule_reconnect(index)
+            return Gst.PadProbeReturn.DROP
+        return Gst.PadProbeReturn.OK
+
+    def live_source_of(self, element):
+        """Index of the live uri source element belongs to, or None"""
+        while element is not None:
+            if element in self.sources:
+                index = self.sources.index(element)
+                return index if index < len(self.inputs) and is_live_uri(self.inputs[index]) else None
+            element = element.get_parent()
+        return None
+
+    def schedule_reconnect(self, index):
+        """Recreates a live source after an exponential backoff. Safe to call from streaming threads"""
+        if self.reconnect_timers[index] is not None:
+            return
+        if 0 <= self.args.reconnect_attempts <= self.source_failures[index]:
+            logger.error("source %d (%s) failed %d times, giving up", index, self.inputs[index], self.source_failures[index])
+            self.error = "source %d lost" % index
+            GLib.idle_add(self.loop.quit)
+            return
+        delay = min(self.args.reconnect_max_delay, self.args.reconnect_delay * (2 ** self.source_failures[index]))
+        self.source_failures[index] += 1
+        self.reconnect_timers[index] = GLib.timeout_add(int(delay * 1000), self.reconnect_source, index)
+
+    def reconnect_source(self, index):
+        self.reconnect_timers[index] = None
+        old_source = self.sources[index]
+        old_source.set_state(Gst.State.NULL)
+        self.pipeline.remove(old_source)
+        source = self.create_uri_source(index, self.inputs[index])
+        if source is None:
+            self.schedule_reconnect(index)
+            return False
+        self.sources[index] = source
+        self.decoders[self.decoders.index(old_source)] = source
+        self.source_reconnects[index] += 1
+        logger.info("reconnecting source %d (%s), attempt %d", index, self.inputs[index], self.source_failures[index])
+        source.sync_state_with_parent()
+        return False
+
+    def link_raw_source(self, index, source):
+        """Converts raw frames from source into NVMM memory and links them to sink_<index> of video_full_processing_bin"""
+        if self.cpu_mode:
+            # the cpu processing converts the frames itself
+            self.pipeline.add(source)
+            srcpad = source.get_static_pad("src")
+            if srcpad.link(self.video_full_processing_bin_sink_pads[index]) != Gst.PadLinkReturn.OK:
+                print("Failed to link pads. Exiting.")
+                return False
+            return True
+        vidconv_src = Gst.ElementFactory.make("videoconvert", "vidconv_src_%u" % index)
+        nvvidconv_src = Gst.ElementFactory.make("nvvideoconvert", "nvvidconv_src_%u" % index)
+        filter_src = Gst.ElementFactory.make("capsfilter", "filter_src_%u" % index)
+        if vidconv_src is None or nvvidconv_src is None or filter_src is None:
+            print("filter_src could not be created. Exiting.")
+            return False
+        nvvidconv_src.set_property("nvbuf-memory-type", 0)
+        caps_filter_src = Gst.Caps.from_string("video/x-raw(memory:NVMM), format=NV12, width=%d, height=%d" % (self.muxer_width, self.muxer_height))
+        filter_src.set_property("caps", caps_filter_src)
+        # caps_filter_src.unref() or gst_caps_unref
+        self.pipeline.add(source)
+        self.pipeline.add(vidconv_src)
+        self.pipeline.add(nvvidconv_src)
+        self.pipeline.add(filter_src)
+        source.link(vidconv_src)
+        vidconv_src.link(nvvidconv_src)
+        nvvidconv_src.link(filter_src)
+
+        # link source and video_full_processing_bin
+        sinkpad = self.video_full_processing_bin.get_static_pad("sink_%u" % index)
+        if sinkpad is None:
+            print("video_full_processing_bin request sink pad failed. Exiting.")
+            return False
+        srcpad = filter_src.get_static_pad("src")
+        if srcpad is None:
+            print("filter_src request src pad failed. Exiting.")
+            return False
+        if srcpad.link(sinkpad) != Gst.PadLinkReturn.OK:
+            print("Failed to link pads. Exiting.")
+            return False
+        return True
+
+    def create_output_branch(self, index):
+        """Creates and links the output components for one source, returns the first element of the branch"""
+        suffix = "" if self.num_sources == 1 else "_%u" % index
+        output_location = output_location_for_source(self.args.output_mp4, index, self.num_sources)
+        if self.args.fakesink:
+            sink = Gst.ElementFactory.make("fakesink", "fakesink" + suffix)
+            if sink is None:
+                print("sink could not be created. Exiting.")
+                return None
+            sink.set_property("sync", False)
+            sink.set_property("async", False)
+            self.video_full_processing_bin.add(sink)
+            self.sinks.append(sink)
+            self.stage_elements.append(sink)
+            self.stage_sources[sink] = index
+            return sink
+        if output_location is not None:
+            print("Sending output to ", output_location)
+            elements, encoder = self.create_file_output(suffix, output_location)
+            if elements is None:
+                print("output components for source", index, "could not be created. Exiting.")
+                return None
+            sink = elements[-1]
+        elif self.cpu_mode:
+            videoconvert = Gst.ElementFactory.make("videoconvert", "videoconverter" + suffix)
+            sink = Gst.ElementFactory.make("autovideosink", "video-renderer" + suffix)
+            if videoconvert is None or sink is None:
+                print("sink could not be created. Exiting.")
+                return None
+            sink.set_property("sync", bool(self.inputs))
+            elements = [videoconvert, sink]
+        elif os.uname().machine == 'aarch64': # PLATFORM_TEGRA
+            transform = Gst.ElementFactory.make("nvegltransform", "nvegl-transform" + suffix)
+            if transform is None:
+                print("One tegra element could not be created. Exiting.")
+                return None
+            sink = Gst.ElementFactory.make("nveglglessink", "nvvideo-renderer" + suffix)
+            if sink is None:
+                print("sink could not be created. Exiting.")
+                return None
+            sink.set_property("sync", False)
+            sink.set_property("max-lateness", -1)
+            sink.set_property("async", False)
+            sink.set_property("qos", True)
+            elements = [transform, sink]
+        else:
+            sink = Gst.ElementFactory.make("nveglglessink", "nvvideo-renderer" + suffix)
+            if sink is None:
+                print("sink could not be created. Exiting.")
+                return None
+            sink.set_property("sync", False)
+            sink.set_property("max-lateness", -1)
+            sink.set_property("async", False)
+            sink.set_property("qos", True)
+            if self.inputs:
+                sink.set_property("sync", True)
+            elements = [sink]
+
+        # add the elements to the bin and link them together
+        for element in elements:
+            self.video_full_processing_bin.add(element)
+        for upstream, downstream in zip(elements, elements[1:]):
+            upstream.link(downstream)
+        self.sinks.append(sink)
+        if output_location is not None:
+            self.encoders.append(encoder)
+            self.stage_elements.append(encoder)
+            self.stage_sources[encoder] = index
+        self.stage_elements.append(sink)
+        self.stage_sources[sink] = index
+        return elements[0]
+
+    def create_file_output(self, suffix, output_location):
+        """Creates the conversion, encoder, parser, muxer and filesink of a file output.
+        The frames are converted once, straight into the caps the selected encoder takes.
+        Returns the elements in link order and the encoder, or (None, None)."""
+        encoder_name = output_encoders.resolve_encoder(self.args.encoder, allow_hardware=not self.cpu_mode)
+        spec = output_encoders.ENCODERS[encoder_name]
+        queue_sink = Gst.ElementFactory.make("queue", "queue_sink" + suffix)
+        if self.cpu_mode:
+            # RGBA frames in system memory from the appsrc
+            conversion = [Gst.ElementFactory.make("videoconvert", "videoconverter" + suffix)]
+            if spec.input_caps != output_encoders.SYSTEM_MEMORY_I420:
+                conversion.append(Gst.ElementFactory.make("nvvideoconvert", "nvvidconv_sink" + suffix))
+        else:
+            conversion = [Gst.ElementFactory.make("nvvideoconvert", "nvvidconv_sink" + suffix)]
+        filter_sink = Gst.ElementFactory.make("capsfilter", "filter_sink" + suffix)
+        encoder = Gst.ElementFactory.make(encoder_name, "encoder" + suffix)
+        elements = [queue_sink] + conversion + [filter_sink]
+        if not output_encoders.accepts(encoder_name, spec.input_caps):
+            # the encoder does not take these caps directly, let videoconvert negotiate the format
+            elements.append(Gst.ElementFactory.make("videoconvert", "videoconverter_enc" + suffix))
+        elements.append(encoder)
+        if spec.parser is not None:
+            elements.append(Gst.ElementFactory.make(spec.parser, "parser" + suffix))
+        muxer = Gst.ElementFactory.make(output_encoders.CONTAINERS[self.args.container], "muxer" + suffix)
+        if self.checkpoint is not None:
+            # fragments closed every --checkpoint_interval, each one is complete on disk once closed
+            sink = Gst.ElementFactory.make("splitmuxsink", "fragment-sink" + suffix)
+            if sink is not None and muxer is not None:
+                sink.set_property("muxer", muxer)
+                sink.set_property("max-size-time", int(self.args.checkpoint_interval * Gst.SECOND))
+                sink.set_property("start-index", len(self.checkpoint.segments))
+                if sink.find_property("send-keyframe-requests") is not None:
+                    sink.set_property("send-keyframe-requests", True)
+                output_location = self.checkpoint.segment_pattern()
+            elements.append(sink)
+        elif self.segmenting:
+            # a new file at the first keyframe past the limits, each one complete once closed
+            sink = Gst.ElementFactory.make("splitmuxsink", "segment-sink" + suffix)
+            if sink is not None and muxer is not None:
+                sink.set_property("muxer", muxer)
+                if self.args.segment_seconds is not None:
+                    sink.set_property("max-size-time", int(self.args.segment_seconds * Gst.SECOND))
+                    if sink.find_property("send-keyframe-requests") is not None:
+                        sink.set_property("send-keyframe-requests", True)
+                if self.args.segment_size_mb is not None:
+                    sink.set_property("max-size-bytes", int(self.args.segment_size_mb * 1024 * 1024))
+                output_location = segment_pattern(output_location)
+            elements.append(sink)
+        else:
+            elements.append(muxer)
+            elements.append(Gst.ElementFactory.make("filesink", "nvvideo-renderer" + suffix))
+        if None in elements:
+            return None, None
+        filter_sink.set_property("caps", Gst.Caps.from_string(spec.input_caps))
+        spec.configure(encoder, self.args)
+        elements[-1].set_property("location", output_location)
+        print("Encoding with", encoder_name)
+        return elements, encoder
+
+    def print_source_stats(self):
+        seconds = max(self.end, 1) / 1000.0
+        for index in range(self.num_sources):
+            name = self.inputs[index] if self.inputs else "webcam"
+            print("source %d (%s): %d frames, %d objects, %.2f fps, %d reconnects" % (index, name,
+                self.source_frame_numbers[index], self.source_obj_counts[index],
+                self.source_frame_numbers[index] / seconds, self.source_reconnects[index]))
+        for name, count in self.dropped_frames.items():
+            print("%s: %d frames dropped" % (name, count))
+        if self.motion_gates is not None:
+            for index, gate in enumerate(self.motion_gates):
+                print("source %d: detection skipped on %d of %d frames (%.1f%%) by the motion gate" % (index,
+                    gate.skipped, gate.frames, 100.0 * gate.skip_ratio()))
 
     def osd_sink_pad_buffer_probe(self, pad, info, u_data):
-        print("sink pad probe invoked", "pad", pad, "info", info, "info.data", hex(info.data), "hash of get_buffer", hex(hash(info.get_buffer())), "info.get_buffer", info.get_buffer(), "u_data", u_data, "self", self)
-        #pdb.set_trace()
+        probe_start = time.perf_counter()
+        try:
+            return self.process_batch_meta(pad, info, u_data)
+        finally:
+            self.probe_seconds += time.perf_counter() - probe_start
+
+    def process_batch_meta(self, pad, info, u_data):
+        self.probe_log.log(logging.DEBUG, "sink pad probe invoked pad %s info.data %s batch %d", pad.get_name(), hex(info.data), self.frame_number)
         #Intiallizing object counter with 0.
         obj_counter = {
             PGIE_CLASS_ID_VEHICLE:0,
@@ -311,15 +1001,21 @@ class Redaction_Main(object):
 
         gst_buffer = info.get_buffer()
         if not gst_buffer:
-            print("Unable to get GstBuffer ")
-            return
+            logger.warning("Unable to get GstBuffer")
+            return Gst.PadProbeReturn.OK
+
+        if self.batch_walker is not None:
+            self.walk_batch_native(info.data)
+            self.frame_number += 1
+            return Gst.PadProbeReturn.OK
 
         # Retrieve batch metadata from the gst_buffer
         # Note that pyds.gst_buffer_get_nvds_batch_meta() expects the
         # C address of gst_buffer as input, which is obtained with hash(gst_buffer)
-        bbox_params_dump_file = None
         #batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
         batch_meta = pyds.gst_buffer_get_nvds_batch_meta(info.data)
+        # whether a frame of the batch moved since the last frame nvinfer ran on for its source
+        batch_changed = False
         l_frame = batch_meta.frame_meta_list
         while l_frame is not None:
             try:
@@ -330,20 +1026,20 @@ class Redaction_Main(object):
                 # it alone.
                 frame_meta = pyds.glist_get_nvds_frame_meta(l_frame.data)
             except StopIteration:
-                print("NvDS Meta contained NULL meta")
                 break
-            if self.args.output_kitti is not None:
-                bbox_file = "%s/%06d.txt" % (self.args.output_kitti, self.frame_number)
-                bbox_params_dump_file = open(bbox_file, "w")
+            # route outputs and stats by the streammux sink pad the frame arrived on
+            source_index = frame_meta.pad_index
+            settings = self.settings
             batch_frame_number = frame_meta.frame_num
             num_rects = frame_meta.num_obj_meta
+            detections = []
+            obj_metas = []
             l_obj = frame_meta.obj_meta_list
             while l_obj is not None:
                 try:
                     # Casting l_obj.data to pyds.NvDsObjectMeta
                     obj_meta = pyds.glist_get_nvds_object_meta(l_obj.data)
                 except StopIteration:
-                    print("NvDsObjectMeta Meta contained NULL meta")
                     break
                 obj_counter[obj_meta.class_id] += 1
                 rect_params = obj_meta.rect_params
@@ -352,123 +1048,271 @@ class Redaction_Main(object):
                     text_params.set_bg_clr = 0
                     text_params.font_params.font_size = 0
 
-                # Draw black patch to cover license plates (class_id = 1)
-                if obj_meta.class_id == 1:
-                    rect_params.border_width = 0
-                    rect_params.has_bg_color = 1
-                    rect_params.bg_color.set(0.5, 0.0, 0.5, 1.0)
-                    #rect_params.bg_color.red = 0.0
-                    #rect_params.bg_color.green = 0.0
-                    #rect_params.bg_color.blue = 0.0
-                    #rect_params.bg_color.alpha = 1.0
-                # Draw skin-color patch to cover faces (class_id = 0)
-                if obj_meta.class_id == 0:
-                    rect_params.border_width = 0
-                    rect_params.has_bg_color = 1
-                    rect_params.bg_color.set(0.92, 0.75, 0.56, 1.0)
-                    #rect_params.bg_color.red = 0.92
-                    #rect_params.bg_color.green = 0.75
-                    #rect_params.bg_color.blue = 0.56
-                    #rect_params.bg_color.alpha = 1.0
-                if bbox_params_dump_file is not None:
-                    left = rect_params.left
-                    top = rect_params.top
-                    right = left + rect_params.width
-                    bottom = top + rect_params.height
-                    class_index = obj_meta.class_id
-                    text = self.pgie_classes_str[obj_meta.class_id]
-                    bbox_params_dump_file.write("%s 0.0 0 0.0 %d.00 %d.00 %d.00 %d.00 0.0 0.0 0.0 0.0 0.0 0.0 0.0\n" % (text, left, top, right, bottom))
-
-                try: 
+                self.style_rect(rect_params, obj_meta.class_id)
+                track_id = -1
+                if self.args.tracker == "nvtracker":
+                    track_id = obj_meta.object_id if obj_meta.object_id != UNTRACKED_OBJECT_ID else -1
+                    if self.args.tracker_margin > 0:
+                        # boxes carried by nvtracker lag behind the object, grow them by the safety margin
+                        box = expand((rect_params.left, rect_params.top, rect_params.width, rect_params.height),
+                            self.args.tracker_margin, self.muxer_width, self.muxer_height)
+                        rect_params.left, rect_params.top, rect_params.width, rect_params.height = [int(v) for v in box]
+                detections.append(Detection(obj_meta.class_id, rect_params.left, rect_params.top,
+                    rect_params.width, rect_params.height, obj_meta.confidence, track_id))
+                obj_metas.append(obj_meta)
+
+                try:
                     l_obj = l_obj.next
                 except StopIteration:
-                    print("NvDsObjectMeta next contained NULL meta")
                     break
-            if bbox_params_dump_file is not None:
-                bbox_params_dump_file.close()
-                bbox_params_dump_file = None
+            regions = self.regions[source_index] if self.regions is not None else None
+            if (regions is not None or settings.disabled or settings.thresholds) and self.replay is None:
+                # drop the disabled classes, the boxes under the runtime thresholds and the ones
+                # outside the ROIs before they are tracked or drawn
+                kept = [settings.accepts(d.class_id, d.confidence) for d in detections]
+                if regions is not None:
+                    kept = [a and b for a, b in zip(kept, regions.inside(detections, self.muxer_width, self.muxer_height))]
+                for obj_meta, keep in zip(obj_metas, kept):
+                    if not keep:
+                        pyds.nvds_remove_obj_meta_from_frame(frame_meta, obj_meta)
+                detections = [d for d, keep in zip(detections, kept) if keep]
+                obj_metas = [o for o, keep in zip(obj_metas, kept) if keep]
+            frame = None
+            if settings.pixel_styles or regions is not None and regions.masks or self.motion_gates is not None:
+                # RGBA view of the frame in the batch, written in place
+                frame = pyds.get_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
+                if regions is not None:
+                    regions.apply_masks(frame)
+            inferred = frame_meta.bInferDone
+            if self.motion_gates is not None:
+                changed, inferred, detections, obj_metas = self.gate_frame(batch_meta, frame_meta, frame, obj_metas, detections)
+                batch_changed = batch_changed or changed
+            if self.replay is not None:
+                detections = self.replay_frame(batch_meta, frame_meta)
+            elif self.trackers is not None:
+                detections = self.track_frame(batch_meta, frame_meta, obj_metas, detections, inferred)
+            if settings.pixel_styles:
+                redaction_styles.redact_boxes(frame, detections, settings.pixel_styles, settings.colors)
+            self.record_frame(source_index, frame_meta.buf_pts, detections)
             try:
                 l_frame = l_frame.next
             except StopIteration:
                 break
 
-        """
-        buf = ffi.cast("void *", info.data)
-        gst_meta = lib.gst_buffer_iterate_meta(buf, self.statePtr)
-        while gst_meta != ffi.NULL:
-            print("****got metadata....", gst_meta)
-            if lib.gst_meta_has_tag(gst_meta, self._nvdsmeta_quark):
-                nvdsmeta = ffi.cast("NvDsMeta *", gst_meta)
-                print("*********got deepstream metadata....", nvdsmeta, nvdsmeta.meta_type)
-                # We are interested only in intercepting Meta of type
-                # "NVDS_META_FRAME_INFO" as they are from our infer elements.
-                if nvdsmeta.meta_type == lib.NVDS_META_FRAME_INFO:
-                    frame_meta = ffi.cast("NvDsFrameMeta *", nvdsmeta.meta_data)
-                    if frame_meta == ffi.NULL:
-                        print("NvDS Meta contained NULL meta")
-                        self.frame_number += 1
-                        return Gst.PadProbeReturn.OK
-                    if self.args.output_kitti is not None:
-                        bbox_file = "%s/%06d.txt" % (self.args.output_kitti, self.frame_number)
-                        bbox_params_dump_file = open(bbox_file, "w")
-
-                    num_rects = frame_meta.num_rects
-                    print("num rects", num_rects)
-                    # This means we have num_rects in frame_meta->obj_params,
-                    # now lets iterate through them
-                    for rect_index in range(0, num_rects):
-                        # Now using above information we need to form a color patch that should
-                        # be displayed on the original video to cover object of interests for redaction purpose
-                        obj_meta = frame_meta.obj_params[rect_index]
-                        rect_params = obj_meta.rect_params
-                        text_params = obj_meta.text_params
-                        if text_params.display_text != ffi.NULL:
-                            lib.g_free(text_params.display_text)
-
-                        # Draw black patch to cover license plates (class_id = 1)
-                        if obj_meta.class_id == 1:
-                            rect_params.border_width = 0
-                            rect_params.has_bg_color = 1
-                            rect_params.bg_color.red = 0.0
-                            rect_params.bg_color.green = 0.0
-                            rect_params.bg_color.blue = 0.0
-                            rect_params.bg_color.alpha = 1.0
-                        # Draw skin-color patch to cover faces (class_id = 0)
-                        if obj_meta.class_id == 0:
-                            rect_params.border_width = 0
-                            rect_params.has_bg_color = 1
-                            rect_params.bg_color.red = 0.92
-                            rect_params.bg_color.green = 0.75
-                            rect_params.bg_color.blue = 0.56
-                            rect_params.bg_color.alpha = 1.0
-                        if bbox_params_dump_file is not None:
-                            left = rect_params.left
-                            top = rect_params.top
-                            right = left + rect_params.width
-                            bottom = top + rect_params.height
-                            class_index = obj_meta.class_id
-                            text = self.pgie_classes_str[obj_meta.class_id]
-                            bbox_params_dump_file.write("%s 0.0 0 0.0 %d.00 %d.00 %d.00 %d.00 0.0 0.0 0.0 0.0 0.0 0.0 0.0\n" % (text, left, top, right, bottom))
-                    if bbox_params_dump_file is not None:
-                        bbox_params_dump_file.close()
-                        bbox_params_dump_file = None
-            gst_meta = lib.gst_buffer_iterate_meta(buf, self.statePtr)
-        """
+        if self.motion_gates is not None:
+            self.gate_pgie(batch_changed)
         self.frame_number += 1
         return Gst.PadProbeReturn.OK
 
+    def style_rect(self, rect_params, class_id):
+        """Draws a patch of the class colour to cover faces (class_id = 0) and license plates (class_id = 1),
+        the blurred and pixelated classes are left to the osd probe"""
+        settings = self.settings
+        style = settings.styles.get(class_id)
+        if style is None:
+            return
+        rect_params.border_width = 0
+        if style.kind == "fill":
+            rect_params.has_bg_color = 1
+            rect_params.bg_color.set(*settings.colors.get(class_id, (0.0, 0.0, 0.0, 1.0)))
+        else:
+            rect_params.has_bg_color = 0
+
+    def track_frame(self, batch_meta, frame_meta, obj_metas, detections, inferred):
+        """Replaces the objects of the frame with the boxes of the built-in tracker. On the frames
+        nvinfer skipped (interval > 0) the tracker predicts the boxes from the previous detections."""
+        tracker = self.trackers[frame_meta.pad_index]
+        tracked = tracker.update(detections if inferred else None, self.muxer_width, self.muxer_height)
+        for obj_meta in obj_metas:
+            pyds.nvds_remove_obj_meta_from_frame(frame_meta, obj_meta)
+        for detection in tracked:
+            self.add_object_meta(batch_meta, frame_meta, detection)
+        return tracked
+
+    def gate_frame(self, batch_meta, frame_meta, frame, obj_metas, detections):
+        """Measures the motion of a frame against the last one nvinfer ran on. The unchanged frames nvinfer
+        skipped get the boxes of that frame and count as inferred. The moving ones stay skipped, for the
+        tracker to carry the boxes over. Returns (changed, inferred, detections, obj_metas)."""
+        source_index = frame_meta.pad_index
+        inferred = bool(frame_meta.bInferDone)
+        changed = self.motion_gates[source_index].observe(frame, inferred)
+        if inferred:
+            self.last_inferred[source_index] = detections
+            return changed, True, detections, obj_metas
+        if changed:
+            return changed, False, detections, obj_metas
+        for obj_meta in obj_metas:
+            pyds.nvds_remove_obj_meta_from_frame(frame_meta, obj_meta)
+        detections = self.last_inferred[source_index]
+        obj_metas = [self.add_object_meta(batch_meta, frame_meta, detection) for detection in detections]
+        return changed, True, detections, obj_metas
+
+    def gate_pgie(self, changed):
+        """Lets nvinfer skip the batches while no source moves, a detection is still forced every
+        --motion_force_interval batches. The interval only drops back once the moving frames reach
+        this probe, the tracker carries the boxes over the frames in between."""
+        idle = not changed
+        if idle == self.motion_idle:
+            return
+        self.motion_idle = idle
+        interval = max(self.pgie_base_interval, self.args.motion_force_interval - 1) if idle else self.pgie_base_interval
+        self.probe_log.log(logging.DEBUG, "motion gates set the inference interval to %d", interval)
+        self.pgie.set_property("interval", interval)
+
+    def replay_frame(self, batch_meta, frame_meta):
+        """Attaches the stored detections of the frame as object metadata, for nvdsosd to draw"""
+        source_index = frame_meta.pad_index
+        detections = self.replay.lookup(source_index, self.source_frame_numbers[source_index], frame_meta.buf_pts,
+            self.muxer_width, self.muxer_height)
+        if self.regions is not None and self.regions[source_index] is not None:
+            detections = self.regions[source_index].select(detections, self.muxer_width, self.muxer_height)
+        settings = self.settings
+        detections = [d for d in detections if settings.accepts(d.class_id, d.confidence)]
+        for detection in detections:
+            self.add_object_meta(batch_meta, frame_meta, detection)
+        return detections
+
+    def add_object_meta(self, batch_meta, frame_meta, detection):
+        obj_meta = pyds.nvds_acquire_obj_meta_from_pool(batch_meta)
+        obj_meta.unique_component_id = TRACKER_COMPONENT_ID
+        obj_meta.class_id = detection.class_id
+        obj_meta.confidence = detection.confidence
+        obj_meta.object_id = detection.track_id
+        rect_params = obj_meta.rect_params
+        rect_params.left = int(detection.left)
+        rect_params.top = int(detection.top)
+        rect_params.width = int(detection.width)
+        rect_params.height = int(detection.height)
+        self.style_rect(rect_params, detection.class_id)
+        pyds.nvds_add_obj_meta_to_frame(frame_meta, obj_meta, None)
+        return obj_meta
+
+    def walk_batch_native(self, buffer_address):
+        """Native equivalent of the pyds walk in osd_sink_pad_buffer_probe: a single call styles
+        every object of the batch and packs the boxes into one structured array"""
+        frames, objects = self.batch_walker.walk(buffer_address, self.source_frame_numbers)
+        offset = 0
+        for frame in frames:
+            count = int(frame["num_objects"])
+            self.record_frame(int(frame["source"]), int(frame["pts"]), objects[offset:offset + count])
+            offset += count
+
+    def record_frame(self, source_index, pts, detections):
+        """Queues the detections of one frame of one source for export and updates the counters.
+        Runs in the streaming thread, so it must never wait on the disk."""
+        if self.detection_writer is not None:
+            self.detection_writer.put(source_index, self.source_frame_numbers[source_index], pts, detections)
+        if self.frame_listener is not None:
+            self.frame_listener(source_index, self.source_frame_numbers[source_index], pts, detections)
+        if self.checkpoint is not None:
+            self.checkpoint.frame_seen(pts, self.source_frame_numbers[source_index])
+        self.source_obj_counts[source_index] += len(detections)
+        self.source_frame_numbers[source_index] += 1
+        if self.args.max_frames and not self.eos_requested and min(self.source_frame_numbers) >= self.args.max_frames:
+            self.eos_requested = True
+            GLib.idle_add(self.request_eos)
+
+    def request_eos(self):
+        """Ends the run cleanly, the outputs are finalized as on a normal end of stream"""
+        print("Reached", self.args.max_frames, "frames, stopping")
+        self.pipeline.send_event(Gst.Event.new_eos())
+        return False
+
+    def update_settings(self, settings):
+        """Swaps in new class settings, picked up from the next frame on"""
+        if settings.pixel_styles and not self.cpu_mode and not self.map_frames:
+            # the frames of this pipeline are not in memory the probe can map
+            logger.warning("blur and pixelate need --runtime_config or --redaction_style at startup on the deepstream path, using fill")
+            fill = redaction_styles.RedactionStyle("fill", 0)
+            settings = RuntimeSettings(dict((class_id, fill if style.kind != "fill" else style) for class_id, style in settings.styles.items()),
+                settings.colors, settings.thresholds, settings.disabled)
+        if self.batch_walker is not None:
+            if settings.thresholds or settings.disabled:
+                # the native walker styles and exports every object, the pyds walk filters them
+                logger.info("class thresholds or disabled classes set, walking the batch metadata through pyds")
+                self.batch_walker = None
+            else:
+                self.batch_walker.set_colors(settings.fill_colors())
+        self.settings = settings
+
+    def resume_probe(self, pad, info, u_data):
+        """Drops the frames before the checkpoint position, and asks for an accurate seek there on the first one.
+        Removed once the frames reach the position."""
+        buffer = info.get_buffer()
+        if buffer.pts != Gst.CLOCK_TIME_NONE and buffer.pts >= self.checkpoint.pts:
+            # until the requested seek has flushed, frames before the position can still come
+            if self.resume_seeked and not self.resume_seek_done:
+                return Gst.PadProbeReturn.OK
+            return Gst.PadProbeReturn.REMOVE
+        if not self.resume_seeked:
+            self.resume_seeked = True
+            GLib.idle_add(self.seek_to_checkpoint, pad)
+        return Gst.PadProbeReturn.DROP
+
+    def seek_to_checkpoint(self, pad):
+        # the demuxer starts from the keyframe before the position, the decoder drops the frames up to it
+        if not pad.push_event(Gst.Event.new_seek(1.0, Gst.Format.TIME, Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE,
+                Gst.SeekType.SET, self.checkpoint.pts, Gst.SeekType.NONE, -1)):
+            logger.warning("seeking to the checkpoint failed, skipping the frames up to it instead")
+        self.resume_seek_done = True
+        return False
+
+    def cpu_frame_redacted(self, source_index, frame, pts, detections):
+        """Called by the cpu inference stages with each frame and its detections, before the frame is encoded.
+        detections is None on the frames skipped by the detector."""
+        probe_start = time.perf_counter()
+        settings = self.settings
+        height, width = frame.shape[:2]
+        if self.replay is not None:
+            detections = self.replay.lookup(source_index, self.source_frame_numbers[source_index], pts, width, height)
+            if self.regions is not None and self.regions[source_index] is not None:
+                # the stages mask the frames and filter the detector boxes themselves
+                detections = self.regions[source_index].select(detections, width, height)
+        if detections is not None and (settings.disabled or settings.thresholds):
+            detections = [d for d in detections if settings.accepts(d.class_id, d.confidence)]
+        if self.detection_writer is not None and self.source_frame_numbers[source_index] == 0:
+            self.detection_writer.set_frame_size(source_index, width, height)
+        if self.trackers is not None:
+            detections = self.trackers[source_index].update(detections, width, height)
+        elif detections is None:
+            # without a tracker, skipped frames keep the boxes of the last detection
+            detections = self.last_detections[source_index]
+        self.last_detections[source_index] = detections
+        redaction_styles.redact_boxes(frame, detections, settings.styles, settings.colors)
+        self.record_frame(source_index, pts, detections)
+        self.frame_number += 1
+        self.probe_seconds += time.perf_counter() - probe_start
+
     def bus_call(self, bus, message, loop):
         t = message.type
         if t == Gst.MessageType.EOS:
+            self.reached_eos = True
             self.end = computeDiffInMillis(self.start, time.time())
             print("End-of-stream\n")
-            self.pipeline.set_state(Gst.State.NULL)
+            self.pipeline.set_state(self.idle_state)
             self.loop.quit()
         elif t == Gst.MessageType.ERROR:
             err, debug = message.parse_error()
+            source_index = self.live_source_of(message.src)
+            if source_index is not None and self.args.reconnect_attempts != 0:
+                logger.warning("source %d (%s) failed: %s", source_index, self.inputs[source_index], err)
+                self.schedule_reconnect(source_index)
+                return True
             sys.stderr.write("Error: %s: %s\n" % (err, debug))
-            self.pipeline.set_state(Gst.State.NULL)
+            self.error = str(err)
+            self.pipeline.set_state(self.idle_state)
             self.loop.quit()
+        elif t == Gst.MessageType.ELEMENT:
+            structure = message.get_structure()
+            if self.checkpoint is not None and structure is not None and structure.get_name() == "splitmuxsink-fragment-closed":
+                self.checkpoint.fragment_closed(structure.get_string("location"), structure.get_value("running-time"))
+                logger.info("checkpoint at frame %d (%.1f s)", self.checkpoint.frame, self.checkpoint.pts / 1e9)
+            elif self.segments is not None and structure is not None and message.src in self.sinks:
+                if structure.get_name() == "splitmuxsink-fragment-opened":
+                    self.segments.fragment_opened(self.sinks.index(message.src), structure.get_value("running-time"))
+                elif structure.get_name() == "splitmuxsink-fragment-closed":
+                    self.segments.fragment_closed(self.sinks.index(message.src), structure.get_string("location"),
+                        structure.get_value("running-time"))
         elif t == Gst.MessageType.STATE_CHANGED:
             old_state, new_state, pending_state = message.parse_state_changed()
             if isinstance(message.src, Gst.Pipeline):
@@ -489,16 +1333,15 @@ class Redaction_Main(object):
 
     """
     The callback function is called when the decoder_bin establishes video source from the input mp4 file,
-    then connects the src pad to the following video_full_processing_bin.
+    then connects the src pad to the matching sink pad of the following video_full_processing_bin.
     The connection is dynamic.
     """
-    def cb_newpad(self, decodebin, pad, data):
+    def cb_newpad(self, decodebin, pad, index):
         # only link once
-        # videopad = self.video_full_processing_bin.get_static_pad("sink")
-        print("New pad event captured for sinkpad...")
-        if self.video_full_processing_bin_sink_pad.is_linked():
+        sinkpad = self.video_full_processing_bin_sink_pads[index]
+        print("New pad event captured for sinkpad", sinkpad.get_name(), "...")
+        if sinkpad.is_linked():
             print("sinkpad already linked...")
-            # videopad.unref()
             return;
         # check media type
         caps = pad.query_caps(None)
@@ -511,27 +1354,122 @@ class Redaction_Main(object):
 
         # caps.unref()
         # link'n'play
-        # pad.link(videopad)
-        pad.link(self.video_full_processing_bin_sink_pad)
-        # videopad.unref()
-
-def computeDiffInMillis(start, end):
-    return int(1000*(end-start))
+        pad.link(sinkpad)
 
-if __name__ == '__main__':
+def build_arg_parser():
     parser = argparse.ArgumentParser(description="script to run image redaction")
     parser.add_argument('-c', '--pgie_config', default = "pgie_config_fd_lpd.txt", help='(required) configuration file for the nvinfer detector (primary gie)')
-    parser.add_argument('-i', '--input_mp4', help='(required) path to input mp4 file')
-    parser.add_argument('-o', '--output_mp4', help='(optional) path to output mp4 file. If this is unset then on-screen display will be used')
-    parser.add_argument('-k', '--output_kitti', help = "(optional) path to the folder for containing output kitti files. If this is unset or the path does not exist then app won't output kitti files")
+    parser.add_argument('-i', '--input_mp4', nargs='+', help='(optional) paths to input mp4 files or URIs, batched through a single streammux. "%s[:num_buffers]" creates a test source. If this is unset then the webcam will be used' % TEST_SOURCE)
+    parser.add_argument('--input_list', help='(optional) manifest file listing one input mp4 file or URI per line, appended to --input_mp4')
+    parser.add_argument('-o', '--output_mp4', help='(optional) path to output mp4 file. If this is unset then on-screen display will be used. With several inputs, the source index is appended to the file name')
+    parser.add_argument('-k', '--output_kitti', help = "(optional) path to the folder for containing output kitti files. If this is unset or the path does not exist then app won't output kitti files. With several inputs, each source writes to a source_<index> sub folder")
+    parser.add_argument('--export_format', choices=EXPORT_FORMATS, default='kitti', help='(optional) layout of the detections written to the --output_kitti folder: one kitti file per frame (default), a single detections.jsonl, or a columnar detections.bin with a detections.idx frame index')
+    parser.add_argument('--export_queue_size', type=int, default=4096, help='(optional) number of frames the background detection writer can hold before it starts dropping records')
+    parser.add_argument('--replay_detections', help='(optional) -k folder of a previous run. Its detections are redacted again instead of running the detector, so re-exporting with another style, resolution or codec costs decode and encode only')
+    parser.add_argument('--redaction_style', help='(optional) comma separated [<class>=]fill|blur[:<kernel>]|pixelate[:<cell>] entries, e.g. "face=blur:31,license_plate=pixelate:12". Without a class the entry applies to faces and license plates. Default fills them with their colour')
+    parser.add_argument('--privacy_regions', help='(optional) JSON file of per-source polygon masks, always redacted without inference, and inclusion ROIs outside of which detections are dropped (see privacy_masks.py)')
+    parser.add_argument('--engine_cache', help='(optional) folder of TensorRT engines keyed by model, batch size, precision, platform and TensorRT version. The matching engine is used, or built once on a miss (see engine_cache.py prebuild)')
+    parser.add_argument('--engine_cache_size', type=int, default=8, help='(optional) number of engines kept in --engine_cache, the least recently used are evicted')
+    parser.add_argument('--segment_seconds', type=float, help='(optional) write the -o output as rolling segments <output>_00000.mp4, <output>_00001.mp4, ... of about this many seconds')
+    parser.add_argument('--segment_size_mb', type=float, help='(optional) write the -o output as rolling segments of at most about this many megabytes, alone or with --segment_seconds')
+    parser.add_argument('--segment_manifest', help='(optional) JSON lines file the closed segments are appended to, defaults to <output>.segments.jsonl')
+    parser.add_argument('--segment_command', help='(optional) command run in the background on each closed segment, e.g. "upload {location}". {location}, {source}, {index}, {start_ns} and {duration_ns} are replaced')
+    parser.add_argument('--checkpoint', help='(optional) checkpoint file of a long single file job. The output is written in fragments of --checkpoint_interval seconds and a restarted job continues after the last complete one')
+    parser.add_argument('--checkpoint_interval', type=float, default=300, help='(optional) seconds of video between two checkpoints')
+    parser.add_argument('--runtime_config', help='(optional) INI file of per-class threshold, enabled, style and color settings, applied to the running pipeline whenever it changes or on SIGHUP (see runtime_config.py)')
+    parser.add_argument('--runtime_config_interval', type=float, default=1.0, help='(optional) seconds between two checks of --runtime_config for changes')
+    parser.add_argument('--no_native_walker', action='store_true', help='(optional) walk the batch metadata through pyds even when the compiled walker from nvds_batch_walker_builder.py is available')
+    parser.add_argument('--stats_interval', type=float, default=0, help='(optional) seconds between exports of per-stage latency percentiles, fps and queue levels. 0 (default) disables the instrumentation probes')
+    parser.add_argument('--stats_file', help='(optional) file rewritten with the stats every --stats_interval seconds. If this is unset the stats are logged')
+    parser.add_argument('--stats_format', choices=STATS_FORMATS, default='json', help='(optional) format of --stats_file')
+    parser.add_argument('--log_level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='(optional) logging level, per-frame messages are logged at DEBUG')
+    parser.add_argument('--log_interval', type=float, default=1.0, help='(optional) minimum seconds between two per-frame log messages')
+    parser.add_argument('--pgie_interval', type=int, help='(optional) number of frames the detector skips between two detections, overrides interval in the pgie config. Use with --tracker so the skipped frames stay redacted')
+    parser.add_argument('--motion_threshold', type=float, nargs='+', help='(optional) skip the detector on the frames where less than this fraction of the pixels changed since the last detection, and redact the last boxes again. With nvinfer a --tracker is required, it carries the boxes over the frames that moved until the detector runs again. One value per source, the last one applies to the remaining sources, e.g. 0.002')
+    parser.add_argument('--motion_force_interval', type=int, default=30, help='(optional) with --motion_threshold, frames after which a detection runs even on a static scene')
+    parser.add_argument('--motion_step', type=int, default=8, help='(optional) with --motion_threshold, the luma plane is compared on every n-th pixel of every n-th row')
+    parser.add_argument('--tracker', choices=['none', 'nvtracker', 'iou'], default='none', help='(optional) carry the boxes across skipped frames with nvtracker (between pgie and osd) or with the built-in IoU tracker, which also works with the cpu detector')
+    parser.add_argument('--tracker_lib', default=DEFAULT_TRACKER_LIB, help='(optional) low level library loaded by nvtracker')
+    parser.add_argument('--tracker_margin', type=float, default=0.1, help='(optional) safety margin added around tracked boxes, as a fraction of their size')
+    parser.add_argument('--tracker_max_age', type=int, default=5, help='(optional) detections in a row the built-in tracker may miss before it stops redacting an object, also the largest --pgie_interval it coasts over')
+    parser.add_argument('--chunk_workers', type=int, default=0, help='(optional) cut each input file at keyframes into chunks, redact the chunks on this many worker processes and stitch the outputs and detections back together. 0 (default) processes the inputs in this process')
+    parser.add_argument('--chunk_seconds', type=float, default=60, help='(optional) approximate length of a chunk, chunks start on the first keyframe after this duration')
+    parser.add_argument('--chunk_retries', type=int, default=2, help='(optional) number of times a failed chunk is run again')
+    parser.add_argument('--chunk_dir', help='(optional) folder for the temporary chunks, defaults to the system temporary folder')
+    parser.add_argument('--encoder', choices=['auto'] + sorted(output_encoders.ENCODERS), default='avenc_mpeg4', help='(optional) encoder of the -o output. "auto" picks the first installed of %s' % ", ".join(output_encoders.AUTO_ENCODERS))
+    parser.add_argument('--bitrate', type=int, default=1000, help='(optional) target bitrate of the -o output in kbit/s')
+    parser.add_argument('--rate_control', choices=output_encoders.RATE_CONTROLS, help='(optional) rate control of the encoder: constant bitrate, variable bitrate/constant quality, or constant quantizer. Unset keeps the encoder default')
+    parser.add_argument('--quality', type=int, default=23, help='(optional) quantizer used by --rate_control vbr and cqp, lower is better')
+    parser.add_argument('--preset', choices=output_encoders.PRESETS, help='(optional) speed preset, mapped onto the closest preset of encoders other than x264enc and x265enc')
+    parser.add_argument('--tune', help='(optional) x264enc/x265enc tune, e.g. zerolatency or fastdecode')
+    parser.add_argument('--encoder_threads', type=int, default=0, help='(optional) encoder threads, 0 (default) lets the encoder decide')
+    parser.add_argument('--container', choices=sorted(output_encoders.CONTAINERS), default='mp4', help='(optional) container of the -o output')
+    parser.add_argument('--muxer_resolution', default='1280x720', help='(optional) resolution the sources are scaled to before inference')
+    parser.add_argument('--camera_device', default='/dev/video0', help='(optional) v4l2 device used when no input is given')
+    parser.add_argument('--camera_resolution', default='1280x720', help='(optional) resolution requested from the camera')
+    parser.add_argument('--camera_fps', type=int, default=30, help='(optional) frame rate requested from the camera')
+    parser.add_argument('--latency_budget_ms', type=float, default=0, help='(optional) bound the queue in front of the detector to this much video. Once it is full, frames are dropped by --drop_policy instead of letting the latency grow. 0 (default) keeps the queues unbounded in time')
+    parser.add_argument('--drop_policy', choices=sorted(DROP_POLICIES), default='oldest', help='(optional) frames dropped when the --latency_budget_ms queue is full: the oldest queued (default), the newest arriving, or none (block the sources)')
+    parser.add_argument('--reconnect_attempts', type=int, default=-1, help='(optional) consecutive reconnects of a failed or ended live source (rtsp, rtmp, udp, srt, http) before giving up, -1 (default) retries forever, 0 disables reconnecting')
+    parser.add_argument('--reconnect_delay', type=float, default=1.0, help='(optional) seconds before the first reconnect, doubled after every failed attempt')
+    parser.add_argument('--reconnect_max_delay', type=float, default=30.0, help='(optional) maximum seconds between two reconnects')
+    parser.add_argument('--rtsp_latency', type=int, default=200, help='(optional) jitter buffer of rtsp sources in ms')
+    parser.add_argument('--rtsp_tcp', action='store_true', help='(optional) receive rtsp streams over tcp instead of udp')
+    parser.add_argument('--batched_push_timeout', type=int, default=40000, help='(optional) microseconds streammux waits for a full batch before pushing a partial one')
+    parser.add_argument('--qos_target_fps', type=float, help='(optional) per-source output fps the QoS controller holds by adjusting the batch timeout, the inference interval and frame dropping at runtime')
+    parser.add_argument('--qos_target_latency_ms', type=float, help='(optional) maximum video queued in front of the detector that the QoS controller holds')
+    parser.add_argument('--qos_interval', type=float, default=2.0, help='(optional) seconds between two QoS samples')
+    parser.add_argument('--qos_max_interval', type=int, default=2, help='(optional) largest inference interval the QoS controller may set. Frames skipped by the detector are only redacted through a tracker, so the interval is never raised in the deepstream path without --tracker')
+    parser.add_argument('--qos_min_push_timeout', type=int, default=5000, help='(optional) smallest streammux batch timeout in microseconds the QoS controller may set')
+    parser.add_argument('--qos_allow_drops', action='store_true', help='(optional) let the QoS controller drop the oldest queued frames as a last resort')
+    parser.add_argument('--qos_log', help='(optional) JSONL audit file receiving every QoS adjustment with the metrics that triggered it')
+    parser.add_argument('--profile', help='(optional) pipeline profile: an INI file with an [app] section of option defaults and [element:<name-glob>] / [factory:<factory>] sections of element properties, see pipeline_profiles.py')
+    parser.add_argument('--max_frames', type=int, default=0, help='(optional) stop once every source delivered this many frames, 0 (default) runs to the end of the inputs')
+    parser.add_argument('--fakesink', action='store_true', help='(optional) discard the output frames instead of displaying or encoding them')
+    parser.add_argument('--detector', choices=['nvinfer', 'cpu', 'stub'], default='nvinfer', help='(optional) run the detector with nvinfer on the GPU (default) or with OpenCV DNN on the CPU, using the model files listed in the pgie config. "stub" runs the cpu pipeline with a detector that injects --stub_objects boxes per frame, for benchmarks')
+    parser.add_argument('--stub_objects', type=int, default=4, help='(optional) number of boxes per frame injected by the stub detector')
+    parser.add_argument('--test_resolution', default='1280x720', help='(optional) resolution of the videotestsrc inputs')
+    parser.add_argument('--cpu_batch_size', type=int, default=4, help='(optional) number of frames per cpu detector call')
+    parser.add_argument('--cpu_workers', type=int, default=2, help='(optional) number of cpu detector worker threads')
+    return parser
 
-    args = parser.parse_args()
+if __name__ == '__main__':
+    parser = build_arg_parser()
+    args = parse_args_with_profile(parser)
+    logging.basicConfig(level=getattr(logging, args.log_level), format="%(asctime)s %(name)s %(levelname)s %(message)s")
 
     # Check input arguments
     if args.pgie_config is None:
         parser.print_help()
         exit(1)
+    if args.input_list is not None:
+        args.input_mp4 = (args.input_mp4 or []) + read_input_manifest(args.input_list)
+
+    if args.chunk_workers > 0 and args.replay_detections is not None:
+        parser.error("--replay_detections can not be combined with --chunk_workers")
+    if args.checkpoint is not None and (args.output_mp4 is None or args.fakesink or args.chunk_workers > 0 or
+            len(args.input_mp4 or []) != 1 or not os.path.isfile(args.input_mp4[0])):
+        parser.error("--checkpoint needs a single input file, an -o output and no --chunk_workers")
+    if args.tracker == "iou" and max(args.pgie_interval or 0, args.qos_max_interval if args.qos_target_fps is not None or
+            args.qos_target_latency_ms is not None else 0) > args.tracker_max_age:
+        parser.error("--pgie_interval and --qos_max_interval can not exceed --tracker_max_age, the built-in tracker would coast over more frames than its lifetime")
+    if (args.segment_seconds is not None or args.segment_size_mb is not None) and (args.output_mp4 is None or
+            args.checkpoint is not None or args.chunk_workers > 0):
+        parser.error("--segment_seconds and --segment_size_mb need an -o output, and can not be combined with --checkpoint or --chunk_workers")
+    if args.motion_threshold is not None and (not all(0.0 <= t <= 1.0 for t in args.motion_threshold) or
+            args.motion_force_interval < 1 or args.motion_step < 1):
+        parser.error("--motion_threshold takes fractions between 0 and 1, --motion_force_interval and --motion_step positive integers")
+    if args.motion_threshold is not None and args.detector == "nvinfer" and args.tracker == "none":
+        parser.error("--motion_threshold needs a --tracker with nvinfer, which is only gated once the frames are past it")
+    try:
+        redaction_styles.parse_styles(args.redaction_style, PGIE_CLASSES_STR)
+    except ValueError as e:
+        parser.error(str(e))
 
     GObject.threads_init()
     Gst.init(None) # sys.argv
-    Redaction_Main(args)
+    if args.chunk_workers > 0:
+        import chunked_processing
+        sys.exit(chunked_processing.run_chunked(args, PGIE_CLASSES_STR))
+    app = Redaction_Main(args)
+    sys.exit(0 if app.built and app.error is None else 1)
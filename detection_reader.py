@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# Reads back the detections exported by DetectionWriter, for --replay_detections.
+# A replay re-renders the redaction of an already processed input from the stored boxes,
+# so re-exporting with another style, resolution or codec costs decode and encode only.
+
+import os
+import os.path
+import json
+import glob
+
+import numpy as np
+
+from detections import Detection
+from detection_writer import JSONL_FILE, COLUMNAR_FILE, COLUMNAR_INDEX_FILE, SOURCES_FILE, input_fingerprint
+from nvds_batch_walker import OBJECT_DTYPE
+
+# same layout as COLUMNAR_INDEX_RECORD
+COLUMNAR_INDEX_DTYPE = np.dtype([
+    ("source", "<u4"),
+    ("frame", "<u4"),
+    ("pts", "<i8"),
+    ("first", "<u8"),
+    ("count", "<u4"),
+])
+
+class StoredSource(object):
+    """Detections of one stored source, by frame number and by PTS"""
+    def __init__(self, info=None):
+        info = info or {}
+        self.input = info.get("input")
+        self.fingerprint = info.get("fingerprint")
+        # size of the frames the boxes were measured on, None when unknown
+        self.width = info.get("width")
+        self.height = info.get("height")
+        self.frames = {}
+        self.pts_frames = {}
+
+    def add(self, frame_number, pts, detections):
+        self.frames[frame_number] = detections
+        if pts is not None and pts >= 0:
+            self.pts_frames[pts] = frame_number
+
+class DetectionStore(object):
+    """All the detections of a -k folder, in any of the export formats"""
+    def __init__(self, path, class_names):
+        self.path = path
+        self.class_names = class_names
+        self.stored = {}
+        infos = []
+        sources_path = os.path.join(path, SOURCES_FILE)
+        if os.path.exists(sources_path):
+            with open(sources_path) as sources_file:
+                infos = json.load(sources_file)["sources"]
+        for index, info in enumerate(infos):
+            self.stored[index] = StoredSource(info)
+        if os.path.exists(os.path.join(path, JSONL_FILE)):
+            self.load_jsonl(os.path.join(path, JSONL_FILE))
+        elif os.path.exists(os.path.join(path, COLUMNAR_INDEX_FILE)):
+            self.load_columnar(os.path.join(path, COLUMNAR_FILE), os.path.join(path, COLUMNAR_INDEX_FILE))
+        else:
+            self.load_kitti(path)
+        # current source index -> stored source, assigned by match_inputs
+        self.mapping = {}
+
+    def source(self, index):
+        stored = self.stored.get(index)
+        if stored is None:
+            stored = self.stored[index] = StoredSource()
+        return stored
+
+    def load_jsonl(self, jsonl_path):
+        with open(jsonl_path) as jsonl_file:
+            for line in jsonl_file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self.source(record["source"]).add(record["frame"], record.get("pts"),
+                    [Detection(*row) for row in record["objects"]])
+
+    def load_columnar(self, records_path, index_path):
+        index = np.fromfile(index_path, dtype=COLUMNAR_INDEX_DTYPE)
+        records = np.fromfile(records_path, dtype=OBJECT_DTYPE)
+        for source_index, frame_number, pts, first, count in index.tolist():
+            rows = records[first:first + count]
+            self.source(source_index).add(frame_number, pts, [Detection(*row) for row in zip(rows["class_id"].tolist(),
+                rows["left"].tolist(), rows["top"].tolist(), rows["width"].tolist(), rows["height"].tolist(),
+                rows["confidence"].tolist())])
+
+    def load_kitti(self, path):
+        # with several sources the kitti files are in source_<index> sub folders
+        source_dirs = sorted(glob.glob(os.path.join(path, "source_*")), key=lambda d: int(d.rsplit("_", 1)[1]))
+        if not source_dirs:
+            source_dirs = [path]
+        for source_index, kitti_dir in enumerate(source_dirs):
+            stored = self.source(source_index)
+            for kitti_path in glob.glob(os.path.join(kitti_dir, "*.txt")):
+                stored.add(int(os.path.splitext(os.path.basename(kitti_path))[0]), None, read_kitti_file(kitti_path, self.class_names))
+
+    def match_inputs(self, inputs):
+        """Assigns a stored source to each current input: the one recorded with the same input
+        fingerprint when the export has a sources file, otherwise the one with the same index"""
+        by_fingerprint = dict((s.fingerprint, i) for i, s in self.stored.items() if s.fingerprint is not None)
+        for index, location in enumerate(inputs):
+            stored_index = by_fingerprint.get(input_fingerprint(location), index)
+            self.mapping[index] = self.stored.get(stored_index, StoredSource())
+            if stored_index not in self.stored:
+                print("Warning: no stored detections for", location)
+
+    def lookup(self, source_index, frame_number, pts, width, height):
+        """Returns the stored detections of a frame, scaled to width x height. Frames are matched by PTS
+        when the export recorded it, and by frame number otherwise."""
+        stored = self.mapping.get(source_index)
+        if stored is None:
+            stored = self.mapping[source_index] = self.stored.get(source_index, StoredSource())
+        frame_number = stored.pts_frames.get(pts, frame_number)
+        detections = stored.frames.get(frame_number, [])
+        if not detections or stored.width is None or (stored.width, stored.height) == (width, height):
+            return detections
+        scale_x = width / float(stored.width)
+        scale_y = height / float(stored.height)
+        return [d._replace(left=d.left * scale_x, top=d.top * scale_y, width=d.width * scale_x, height=d.height * scale_y)
+            for d in detections]
+
+def read_kitti_file(kitti_path, class_names):
+    """Parses the boxes of one kitti label file written by kitti_line"""
+    detections = []
+    with open(kitti_path) as kitti_file:
+        for line in kitti_file:
+            fields = line.split()
+            if len(fields) < 8 or fields[0] not in class_names:
+                continue
+            left, top, right, bottom = [float(v) for v in fields[4:8]]
+            detections.append(Detection(class_names.index(fields[0]), left, top, right - left, bottom - top, 1.0))
+    return detections
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+# Background writer for the detections of the redaction app.
+# The pad probe only enqueues one record per frame; a writer thread drains the queue
+# in batches and writes either the legacy KITTI layout (one file per frame) or a
+# consolidated file for the whole run.
+
+import os
+import os.path
+import sys
+import json
+import struct
+import hashlib
+import threading
+import queue
+
+from detections import kitti_line
+
+EXPORT_FORMATS = ["kitti", "jsonl", "columnar"]
+
+JSONL_FILE = "detections.jsonl"
+# columnar export: fixed size object records plus a frame index pointing into them
+COLUMNAR_FILE = "detections.bin"
+COLUMNAR_INDEX_FILE = "detections.idx"
+# source, frame, class_id, left, top, width, height, confidence
+COLUMNAR_RECORD = struct.Struct("<IIifffff")
+# source, frame, pts, first record, record count
+COLUMNAR_INDEX_RECORD = struct.Struct("<IIqQI")
+# inputs of the run and the frame size the boxes refer to, read back by --replay_detections
+SOURCES_FILE = "sources.json"
+# bytes hashed at each end of an input file to fingerprint it
+FINGERPRINT_CHUNK = 1 << 20
+
+class DetectionWriter(object):
+    """Writes per-frame detections from a bounded queue on a background thread"""
+    def __init__(self, output_dir, kitti_dirs, class_names, export_format="kitti", queue_size=4096, batch_size=256, flush_interval=1.0, sources=None, append=False):
+        self.output_dir = output_dir
+        # one {"input", "fingerprint", "width", "height"} dict per source
+        self.sources = sources or []
+        self.kitti_dirs = kitti_dirs
+        self.class_names = class_names
+        self.export_format = export_format
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.written = 0
+        # first write failure, the writer keeps draining the queue after it
+        self.error = None
+        self.failed = 0
+        self.jsonl_file = None
+        self.columnar_file = None
+        self.columnar_index_file = None
+        self.columnar_records = 0
+        # append continues the export of an interrupted run, see truncate_export
+        if export_format == "jsonl":
+            self.jsonl_file = open(os.path.join(output_dir, JSONL_FILE), "a" if append else "w")
+        elif export_format == "columnar":
+            self.columnar_file = open(os.path.join(output_dir, COLUMNAR_FILE), "ab" if append else "wb")
+            self.columnar_index_file = open(os.path.join(output_dir, COLUMNAR_INDEX_FILE), "ab" if append else "wb")
+            if append:
+                self.columnar_records = os.path.getsize(os.path.join(output_dir, COLUMNAR_FILE)) // COLUMNAR_RECORD.size
+        self.thread = threading.Thread(target=self.run, name="detection-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, source_index, frame_number, pts, detections, block=False):
+        """Enqueues the detections of one frame, never blocks unless block is set (offline merges).
+        Returns False when the record was dropped"""
+        if block:
+            self.queue.put((source_index, frame_number, pts, detections))
+            return True
+        try:
+            self.queue.put_nowait((source_index, frame_number, pts, detections))
+        except queue.Full:
+            if self.dropped == 0:
+                sys.stderr.write("Warning: detection writer queue is full, dropping records\n")
+            self.dropped += 1
+            return False
+        return True
+
+    def set_frame_size(self, source_index, width, height):
+        """Records the size of the frames the boxes of a source are measured on"""
+        if source_index < len(self.sources):
+            self.sources[source_index]["width"] = width
+            self.sources[source_index]["height"] = height
+
+    def close(self):
+        """Writes out everything still queued and closes the output files. Returns the first write
+        error, or None"""
+        # a full queue only waits for a writer thread that is still there to drain it
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=self.flush_interval)
+                break
+            except queue.Full:
+                pass
+        self.thread.join()
+        for output_file in (self.jsonl_file, self.columnar_file, self.columnar_index_file):
+            if output_file is not None:
+                output_file.close()
+        if self.sources:
+            with open(os.path.join(self.output_dir, SOURCES_FILE), "w") as sources_file:
+                json.dump({"format": self.export_format, "sources": self.sources}, sources_file, indent=2)
+        if self.dropped:
+            sys.stderr.write("Warning: detection writer dropped %d frames\n" % self.dropped)
+        if self.failed:
+            sys.stderr.write("Error: detection writer failed to write %d frames: %s\n" % (self.failed, self.error))
+        return self.error
+
+    def run(self):
+        done = False
+        while not done:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # drain what is already queued so the disk sees one batch instead of many small writes
+            batch = []
+            while record is not None:
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if record is None:
+                done = True
+            if batch:
+                try:
+                    self.write_batch(batch)
+                except Exception as e:
+                    # a full disk or a removed folder loses this batch, not the rest of the run
+                    if self.error is None:
+                        sys.stderr.write("Error: detection writer: %s\n" % e)
+                        self.error = str(e)
+                    self.failed += len(batch)
+
+    def write_batch(self, batch):
+        if self.export_format == "jsonl":
+            lines = []
+            for source_index, frame_number, pts, detections in batch:
+                lines.append(json.dumps({
+                    "source": source_index,
+                    "frame": frame_number,
+                    "pts": pts,
+                    "objects": object_rows(detections),
+                }))
+            self.jsonl_file.write("\n".join(lines) + "\n")
+            self.jsonl_file.flush()
+        elif self.export_format == "columnar":
+            records = []
+            index = []
+            for source_index, frame_number, pts, detections in batch:
+                # GST_CLOCK_TIME_NONE does not fit the signed pts column
+                pts = pts if 0 <= pts < (1 << 63) else -1
+                index.append(COLUMNAR_INDEX_RECORD.pack(source_index, frame_number, pts, self.columnar_records, len(detections)))
+                if hasattr(detections, "dtype"):
+                    # arrays from the native walker already have the record layout
+                    records.append(detections.tobytes())
+                else:
+                    for d in detections:
+                        records.append(COLUMNAR_RECORD.pack(source_index, frame_number, d.class_id, d.left, d.top, d.width, d.height, d.confidence))
+                self.columnar_records += len(detections)
+            self.columnar_file.write(b"".join(records))
+            self.columnar_index_file.write(b"".join(index))
+            self.columnar_file.flush()
+            self.columnar_index_file.flush()
+        else:
+            for source_index, frame_number, pts, detections in batch:
+                bbox_file = "%s/%06d.txt" % (self.kitti_dirs[source_index], frame_number)
+                with open(bbox_file, "w") as bbox_params_dump_file:
+                    bbox_params_dump_file.write("".join(kitti_line(self.class_names[d.class_id], d) for d in detections))
+        self.written += len(batch)
+
+def truncate_export(output_dir, export_format, frame_number):
+    """Cuts the consolidated export of a single source back to the frames before frame_number, so a
+    resumed run can append from there. KITTI files are simply overwritten."""
+    if export_format == "jsonl":
+        path = os.path.join(output_dir, JSONL_FILE)
+        if not os.path.exists(path):
+            return
+        offset = 0
+        with open(path, "rb") as jsonl_file:
+            for line in jsonl_file:
+                if not line.endswith(b"\n") or json.loads(line.decode("utf-8"))["frame"] >= frame_number:
+                    break
+                offset += len(line)
+        with open(path, "r+b") as jsonl_file:
+            jsonl_file.truncate(offset)
+    elif export_format == "columnar":
+        index_path = os.path.join(output_dir, COLUMNAR_INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, "rb") as index_file:
+            data = index_file.read()
+        count = len(data) // COLUMNAR_INDEX_RECORD.size
+        records = 0
+        for position in range(count):
+            _, frame, _, first, _ = COLUMNAR_INDEX_RECORD.unpack_from(data, position * COLUMNAR_INDEX_RECORD.size)
+            if frame >= frame_number:
+                count = position
+                records = first
+                break
+        else:
+            if count:
+                _, _, _, first, objects = COLUMNAR_INDEX_RECORD.unpack_from(data, (count - 1) * COLUMNAR_INDEX_RECORD.size)
+                records = first + objects
+        with open(index_path, "r+b") as index_file:
+            index_file.truncate(count * COLUMNAR_INDEX_RECORD.size)
+        with open(os.path.join(output_dir, COLUMNAR_FILE), "r+b") as columnar_file:
+            columnar_file.truncate(records * COLUMNAR_RECORD.size)
+
+def object_rows(detections):
+    """Returns [class_id, left, top, width, height, confidence, track_id] lists of plain python numbers
+    for a list of Detection records or a structured array from the native walker"""
+    if hasattr(detections, "dtype"):
+        return [list(row) + [-1] for row in zip(detections["class_id"].tolist(), detections["left"].tolist(),
+            detections["top"].tolist(), detections["width"].tolist(), detections["height"].tolist(),
+            detections["confidence"].tolist())]
+    return [[d.class_id, d.left, d.top, d.width, d.height, d.confidence, d.track_id] for d in detections]
+
+def input_fingerprint(location):
+    """Identifies an input file by its size and the hash of its first and last megabyte, so stored
+    detections still match after the file is renamed or moved. URIs and test sources use their name."""
+    digest = hashlib.sha1()
+    if not os.path.isfile(location):
+        digest.update(location.encode("utf-8"))
+        return digest.hexdigest()
+    size = os.path.getsize(location)
+    digest.update(str(size).encode("ascii"))
+    with open(location, "rb") as input_file:
+        digest.update(input_file.read(FINGERPRINT_CHUNK))
+        if size > FINGERPRINT_CHUNK:
+            input_file.seek(max(FINGERPRINT_CHUNK, size - FINGERPRINT_CHUNK))
+            digest.update(input_file.read(FINGERPRINT_CHUNK))
+    return digest.hexdigest()
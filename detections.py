@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+
+# Detection records shared by the deepstream and the cpu paths of the redaction app
+
+import collections
+
+# One redaction target in frame coordinates. This is what osd_sink_pad_buffer_probe reads
+# from NvDsObjectMeta.rect_params and what the cpu detectors produce.
+# track_id is -1 for untracked detections.
+Detection = collections.namedtuple("Detection", ["class_id", "left", "top", "width", "height", "confidence", "track_id"])
+# namedtuple only takes defaults from python 3.7 on
+Detection.__new__.__defaults__ = (-1,)
+
+# solid fill colour (red, green, blue, alpha) used to redact each class id
+REDACTION_COLORS = {
+    0: (0.92, 0.75, 0.56, 1.0), # skin-color patch to cover faces
+    1: (0.5, 0.0, 0.5, 1.0), # purple patch to cover license plates
+}
+
+def kitti_line(text, detection):
+    """Formats one detection as a line of a KITTI label file"""
+    left = detection.left
+    top = detection.top
+    right = left + detection.width
+    bottom = top + detection.height
+    return "%s 0.0 0 0.0 %d.00 %d.00 %d.00 %d.00 0.0 0.0 0.0 0.0 0.0 0.0 0.0\n" % (text, left, top, right, bottom)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+# TensorRT engine cache for nvinfer.
+# nvinfer only reuses the engine named by model-engine-file, and silently rebuilds it for
+# minutes whenever the batch size, precision, platform or TensorRT version no longer match.
+# Engines are kept in a cache folder keyed by a hash of the model files and those settings;
+# at startup the app looks up the engine matching its config and batch size, builds it on a
+# miss, and hands nvinfer a copy of the config patched to point at it. The least recently
+# used engines are evicted beyond --engine_cache_size entries.
+#
+# python3 engine_cache.py prebuild -c configs/pgie_config_fd_lpd.txt --engine_cache engines --batch_sizes 1 2 4 --precisions fp32 fp16
+# python3 engine_cache.py list --engine_cache engines
+
+import os
+import os.path
+import sys
+import json
+import glob
+import time
+import fcntl
+import shutil
+import hashlib
+import argparse
+import platform
+import subprocess
+import configparser
+
+INDEX_FILE = "index.json"
+LOCK_FILE = ".lock"
+# nvinfer network-mode values
+PRECISIONS = {"fp32": "0", "int8": "1", "fp16": "2"}
+# config keys naming files, resolved against the folder of the config like nvinfer does
+PATH_KEYS = ("model-file", "proto-file", "model-engine-file", "labelfile-path", "int8-calib-file",
+    "uff-file", "onnx-file", "custom-lib-path", "tlt-encoded-model")
+# files the engine is built from
+MODEL_KEYS = ("model-file", "proto-file", "uff-file", "onnx-file", "tlt-encoded-model", "int8-calib-file")
+HASH_CHUNK = 1 << 20
+
+def read_config(config_path):
+    """Reads an nvinfer config with the file paths made absolute, so it can be written elsewhere"""
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.optionxform = str
+    if not parser.read(config_path):
+        raise IOError("could not read pgie config %s" % config_path)
+    config_dir = os.path.dirname(os.path.abspath(config_path))
+    for key in PATH_KEYS:
+        if parser.has_option("property", key):
+            parser["property"][key] = os.path.normpath(os.path.join(config_dir, parser["property"][key]))
+    return parser
+
+def precision_of(parser):
+    mode = parser["property"].get("network-mode", "0")
+    return dict((value, name) for name, value in PRECISIONS.items()).get(mode, "fp32")
+
+def model_hash(parser):
+    """Hash of the contents of the files the engine is built from"""
+    digest = hashlib.sha256()
+    for key in MODEL_KEYS:
+        path = parser["property"].get(key)
+        if path is None:
+            continue
+        digest.update(key.encode("utf-8"))
+        with open(path, "rb") as model_file:
+            for block in iter(lambda: model_file.read(HASH_CHUNK), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+def platform_tag():
+    """The GPU engines are built for: the Jetson model or the dGPU name"""
+    try:
+        with open("/proc/device-tree/model") as model_file:
+            return model_file.read().strip("\0\n ")
+    except (IOError, OSError):
+        pass
+    try:
+        output = subprocess.check_output(["nvidia-smi", "--query-gpu=name", "--format=csv,noheader", "-i", "0"])
+        return output.decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return platform.machine()
+
+def library_version():
+    """TensorRT version, engines do not load across versions"""
+    try:
+        import tensorrt
+        return tensorrt.__version__
+    except ImportError:
+        pass
+    for header in glob.glob("/usr/include/*/NvInferVersion.h") + glob.glob("/usr/include/NvInfer.h"):
+        version = {}
+        with open(header) as header_file:
+            for line in header_file:
+                parts = line.split()
+                if len(parts) == 3 and parts[0] == "#define" and parts[1] in ("NV_TENSORRT_MAJOR", "NV_TENSORRT_MINOR", "NV_TENSORRT_PATCH"):
+                    version[parts[1]] = parts[2]
+        if len(version) == 3:
+            return "%s.%s.%s" % (version["NV_TENSORRT_MAJOR"], version["NV_TENSORRT_MINOR"], version["NV_TENSORRT_PATCH"])
+    return "unknown"
+
+def engine_key(parser, batch_size, platform_name, version):
+    """Cache key of the engine of a config for a batch size, platform and TensorRT version"""
+    fields = [model_hash(parser), "b%d" % batch_size, precision_of(parser), platform_name, version]
+    return hashlib.sha256("|".join(fields).encode("utf-8")).hexdigest()[:32]
+
+def patch_config(parser, output_path, batch_size, engine_path=None):
+    """Writes a copy of the config for batch_size, pointing at engine_path when given. Without an engine
+    the model-engine-file line is dropped so nvinfer builds from the model files."""
+    patched = configparser.ConfigParser(interpolation=None)
+    patched.optionxform = str
+    patched.read_dict(parser)
+    patched["property"]["batch-size"] = str(batch_size)
+    if engine_path is not None:
+        patched["property"]["model-engine-file"] = os.path.abspath(engine_path)
+    else:
+        patched.remove_option("property", "model-engine-file")
+    with open(output_path, "w") as config_file:
+        patched.write(config_file)
+    return output_path
+
+class EngineCache(object):
+    """Engines in a folder with a JSON index, shared by the processes of a host through a lock file"""
+    def __init__(self, cache_dir, max_entries=8, platform_name=None, version=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.platform_name = platform_name if platform_name is not None else platform_tag()
+        self.version = version if version is not None else library_version()
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def read_index(self):
+        path = os.path.join(self.cache_dir, INDEX_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as index_file:
+            return json.load(index_file)
+
+    def write_index(self, index):
+        path = os.path.join(self.cache_dir, INDEX_FILE)
+        with open(path + ".tmp", "w") as index_file:
+            json.dump(index, index_file, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def lock(self):
+        lock_file = open(os.path.join(self.cache_dir, LOCK_FILE), "w")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def lookup(self, key, index=None):
+        """Path of the cached engine of key, None on a miss. Marks the engine as used."""
+        lock_file = self.lock() if index is None else None
+        try:
+            index = self.read_index() if index is None else index
+            entry = index.get(key)
+            if entry is None or not os.path.exists(os.path.join(self.cache_dir, entry["file"])):
+                return None
+            entry["last_used"] = time.time()
+            self.write_index(index)
+            return os.path.join(self.cache_dir, entry["file"])
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+
+    def ensure(self, config_path, batch_size, builder, precision=None):
+        """Returns the path of a config for nvinfer pointing at a cached engine, building the engine with
+        builder(config_path, batch_size) -> built engine path on a miss"""
+        parser = read_config(config_path)
+        if precision is not None:
+            parser["property"]["network-mode"] = PRECISIONS[precision]
+        key = engine_key(parser, batch_size, self.platform_name, self.version)
+        patched_path = os.path.join(self.cache_dir, "%s.txt" % key)
+        # held during a build, so concurrent processes wait for the engine instead of building it again
+        with self.lock():
+            index = self.read_index()
+            engine_path = self.lookup(key, index)
+            if engine_path is None:
+                print("No cached engine for batch size %d (%s), building it, this can take minutes" % (batch_size, precision_of(parser)))
+                build_config = patch_config(parser, os.path.join(self.cache_dir, "%s.build.txt" % key), batch_size)
+                try:
+                    built = builder(build_config, batch_size)
+                finally:
+                    os.remove(build_config)
+                engine_path = self.add(index, key, built, parser, batch_size)
+            return patch_config(parser, patched_path, batch_size, engine_path)
+
+    def add(self, index, key, built_path, parser, batch_size):
+        """Moves a built engine into the cache and evicts the least recently used ones"""
+        file_name = "%s.engine" % key
+        shutil.move(built_path, os.path.join(self.cache_dir, file_name))
+        index[key] = {
+            "file": file_name,
+            "model": os.path.basename(parser["property"].get("model-file", parser["property"].get("onnx-file", ""))),
+            "batch_size": batch_size,
+            "precision": precision_of(parser),
+            "platform": self.platform_name,
+            "version": self.version,
+            "created": time.time(),
+            "last_used": time.time(),
+        }
+        for stale in sorted(index, key=lambda k: index[k]["last_used"])[:max(0, len(index) - self.max_entries)]:
+            print("Evicting engine", stale)
+            for path in (os.path.join(self.cache_dir, index[stale]["file"]), os.path.join(self.cache_dir, "%s.txt" % stale)):
+                if os.path.exists(path):
+                    os.remove(path)
+            del index[stale]
+        self.write_index(index)
+        return os.path.join(self.cache_dir, file_name)
+
+def build_with_nvinfer(config_path, batch_size):
+    """Builds the engine of a config by running nvinfer on a few test frames, returns the engine file
+    nvinfer serialized next to the model"""
+    import gi
+    gi.require_version("Gst", "1.0")
+    from gi.repository import Gst
+    Gst.init(None)
+    parser = read_config(config_path)
+    model_path = parser["property"].get("model-file") or parser["property"].get("onnx-file") or parser["property"].get("uff-file")
+    started = time.time()
+    pipeline = Gst.parse_launch("videotestsrc num-buffers=%d ! nvvideoconvert ! video/x-raw(memory:NVMM), format=NV12 ! "
+        "m.sink_0 nvstreammux name=m batch-size=%d width=1280 height=720 ! nvinfer config-file-path=%s batch-size=%d ! fakesink"
+        % (batch_size, batch_size, config_path, batch_size))
+    pipeline.set_state(Gst.State.PLAYING)
+    message = pipeline.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    if message.type == Gst.MessageType.ERROR:
+        err, debug = message.parse_error()
+        raise RuntimeError("building the engine failed: %s: %s" % (err, debug))
+    # <model>_b<batch>_[gpu<id>_]<precision>.engine
+    built = [path for path in glob.glob("%s_b%d_*%s.engine" % (model_path, batch_size, precision_of(parser)))
+        if os.path.getmtime(path) >= started - 1]
+    if not built:
+        raise RuntimeError("nvinfer did not serialize an engine next to %s" % model_path)
+    return built[0]
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="TensorRT engine cache of the redaction app")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    prebuild_parser = subparsers.add_parser("prebuild", help="build the engines of a config ahead of deployment")
+    prebuild_parser.add_argument('-c', '--pgie_config', required=True, help='configuration file for the nvinfer detector')
+    prebuild_parser.add_argument('--engine_cache', required=True, help='cache folder')
+    prebuild_parser.add_argument('--engine_cache_size', type=int, default=8, help='(optional) number of engines kept')
+    prebuild_parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1], help='(optional) batch sizes, the number of sources the app is run with')
+    prebuild_parser.add_argument('--precisions', choices=sorted(PRECISIONS), nargs='+', help='(optional) precisions, defaults to the network-mode of the config')
+    list_parser = subparsers.add_parser("list", help="list the cached engines")
+    list_parser.add_argument('--engine_cache', required=True, help='cache folder')
+    return parser
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    if args.command == "prebuild":
+        cache = EngineCache(args.engine_cache, args.engine_cache_size)
+        for precision in args.precisions or [None]:
+            for batch_size in args.batch_sizes:
+                config_path = cache.ensure(args.pgie_config, batch_size, build_with_nvinfer, precision)
+                print("batch size %d %s: %s" % (batch_size, precision or "", read_config(config_path)["property"]["model-engine-file"]))
+    elif args.command == "list":
+        cache = EngineCache(args.engine_cache, platform_name="", version="")
+        for key, entry in sorted(cache.read_index().items(), key=lambda item: -item[1]["last_used"]):
+            print("%s %s b%d %s %s TensorRT %s, last used %s" % (key, entry["model"], entry["batch_size"], entry["precision"],
+                entry["platform"], entry["version"], time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["last_used"]))))
+    sys.exit(0)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+# Lightweight CPU tracker that carries redaction boxes across the frames the detector skips
+# (pgie interval > 0) and across short detection misses. Tracks are matched greedily by IoU,
+# move with a smoothed constant velocity, and are grown by a safety margin that increases
+# while a track coasts without a detection.
+
+from detections import Detection
+
+class Track(object):
+    def __init__(self, track_id, detection):
+        self.track_id = track_id
+        self.class_id = detection.class_id
+        self.confidence = detection.confidence
+        self.box = [float(detection.left), float(detection.top), float(detection.width), float(detection.height)]
+        self.velocity = [0.0, 0.0]
+        # position at the last matching detection, and frames since then
+        self.anchor = (self.box[0], self.box[1])
+        self.age = 0
+        # detector runs in a row that did not match the track, the frames it skipped do not count
+        self.misses = 0
+
+    def predict(self):
+        self.box[0] += self.velocity[0]
+        self.box[1] += self.velocity[1]
+        self.age += 1
+
+    def correct(self, detection, smoothing):
+        # velocity measured over all the frames since the last detection, not just the last one
+        elapsed = max(1, self.age)
+        measured_x = (detection.left - self.anchor[0]) / elapsed
+        measured_y = (detection.top - self.anchor[1]) / elapsed
+        self.velocity[0] = smoothing * self.velocity[0] + (1.0 - smoothing) * measured_x
+        self.velocity[1] = smoothing * self.velocity[1] + (1.0 - smoothing) * measured_y
+        self.box = [float(detection.left), float(detection.top), float(detection.width), float(detection.height)]
+        self.anchor = (self.box[0], self.box[1])
+        self.confidence = detection.confidence
+        self.age = 0
+        self.misses = 0
+
+def iou(a, b):
+    """Intersection over union of two (left, top, width, height) boxes"""
+    left = max(a[0], b[0])
+    top = max(a[1], b[1])
+    right = min(a[0] + a[2], b[0] + b[2])
+    bottom = min(a[1] + a[3], b[1] + b[3])
+    if right <= left or bottom <= top:
+        return 0.0
+    intersection = (right - left) * (bottom - top)
+    union = a[2] * a[3] + b[2] * b[3] - intersection
+    return intersection / union if union > 0 else 0.0
+
+def expand(box, margin, frame_width=None, frame_height=None):
+    """Grows a box by margin (fraction of its size) on every side, clipped to the frame"""
+    left, top, width, height = box
+    pad_x = width * margin
+    pad_y = height * margin
+    left = left - pad_x
+    top = top - pad_y
+    right = left + width + 2 * pad_x
+    bottom = top + height + 2 * pad_y
+    left = max(0.0, left)
+    top = max(0.0, top)
+    if frame_width is not None:
+        right = min(float(frame_width), right)
+    if frame_height is not None:
+        bottom = min(float(frame_height), bottom)
+    return left, top, max(0.0, right - left), max(0.0, bottom - top)
+
+# extra margin per coasted frame, the longer a box coasts the less we trust its position
+COAST_MARGIN = 0.05
+
+class IouTracker(object):
+    """Keeps redaction targets alive between detections, one instance per source"""
+    def __init__(self, iou_threshold=0.3, max_age=5, margin=0.1, coast_margin=COAST_MARGIN, smoothing=0.5):
+        self.iou_threshold = iou_threshold
+        # detections a track may miss and still be kept (and redacted), whatever the inference interval
+        self.max_age = max_age
+        self.margin = margin
+        self.coast_margin = coast_margin
+        self.smoothing = smoothing
+        self.tracks = []
+        self.next_id = 0
+
+    def update(self, detections, frame_width=None, frame_height=None):
+        """Advances the tracks by one frame. detections is None on frames the detector skipped.
+        Returns the boxes to redact, with stable track ids."""
+        for track in self.tracks:
+            track.predict()
+        if detections is not None:
+            for track in self.match(detections):
+                track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_age]
+        output = []
+        for track in self.tracks:
+            margin = self.margin + self.coast_margin * track.age
+            left, top, width, height = expand(track.box, margin, frame_width, frame_height)
+            output.append(Detection(track.class_id, left, top, width, height, track.confidence, track.track_id))
+        return output
+
+    def match(self, detections):
+        """Corrects the tracks with the detections they overlap, starts tracks for the others.
+        Returns the tracks left without a detection."""
+        pairs = []
+        for track_index, track in enumerate(self.tracks):
+            for detection_index, detection in enumerate(detections):
+                if detection.class_id != track.class_id:
+                    continue
+                overlap = iou(track.box, (detection.left, detection.top, detection.width, detection.height))
+                if overlap >= self.iou_threshold:
+                    pairs.append((overlap, track_index, detection_index))
+        pairs.sort(reverse=True)
+        matched_tracks = set()
+        matched_detections = set()
+        for overlap, track_index, detection_index in pairs:
+            if track_index in matched_tracks or detection_index in matched_detections:
+                continue
+            self.tracks[track_index].correct(detections[detection_index], self.smoothing)
+            matched_tracks.add(track_index)
+            matched_detections.add(detection_index)
+        unmatched = [track for index, track in enumerate(self.tracks) if index not in matched_tracks]
+        for detection_index, detection in enumerate(detections):
+            if detection_index not in matched_detections:
+                self.tracks.append(Track(self.next_id, detection))
+                self.next_id += 1
+        return unmatched
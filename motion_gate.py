@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+# Motion gating of the detector, for --motion_threshold.
+# Static scenes do not need a detection on every frame: each frame is reduced to a subsampled
+# luma plane and compared with the one of the last frame the detector ran on. When fewer than
+# threshold of its pixels changed by more than MOTION_PIXEL_DELTA grey levels, the detection is
+# skipped and the boxes of the last detection are redacted again. The comparison is always made
+# against the last detected frame, so slow changes add up instead of slipping through frame by
+# frame, and a detection is forced every force_interval frames whatever the gate says.
+
+import numpy as np
+
+# luma difference, in grey levels, over which a pixel counts as changed
+MOTION_PIXEL_DELTA = 24
+# BT.601 luma weights in 1/256
+LUMA_WEIGHTS = np.array([77, 150, 29], dtype=np.uint16)
+
+def luma(frame, step):
+    """Luma of every step-th pixel of an RGB(A) frame, as uint8"""
+    pixels = frame[::step, ::step, :3]
+    return ((pixels.astype(np.uint16) * LUMA_WEIGHTS).sum(axis=2, dtype=np.uint32) >> 8).astype(np.uint8)
+
+class MotionGate(object):
+    """Decides for one source whether a frame changed enough since the last detection to run the detector"""
+    def __init__(self, threshold, force_interval=30, step=8):
+        # fraction of the subsampled pixels that must change
+        self.threshold = threshold
+        self.force_interval = force_interval
+        self.step = step
+        self.reference = None
+        self.since_detection = 0
+        self.frames = 0
+        self.skipped = 0
+
+    def changed_fraction(self, frame):
+        current = luma(frame, self.step)
+        if self.reference is None or self.reference.shape != current.shape:
+            return 1.0, current
+        difference = np.abs(current.astype(np.int16) - self.reference)
+        return np.count_nonzero(difference > MOTION_PIXEL_DELTA) / float(difference.size), current
+
+    def should_detect(self, frame):
+        """True when the detector has to run on frame, which then becomes the reference"""
+        self.frames += 1
+        fraction, current = self.changed_fraction(frame)
+        if fraction < self.threshold and self.since_detection + 1 < self.force_interval:
+            self.since_detection += 1
+            self.skipped += 1
+            return False
+        self.detected(current)
+        return True
+
+    def detected(self, current):
+        self.reference = current
+        self.since_detection = 0
+
+    def observe(self, frame, inferred):
+        """For detectors that decide on their own (nvinfer): records whether frame was inferred, and
+        returns whether it changed since the last inferred one"""
+        self.frames += 1
+        fraction, current = self.changed_fraction(frame)
+        if inferred:
+            self.detected(current)
+        else:
+            self.since_detection += 1
+            self.skipped += 1
+        return fraction >= self.threshold
+
+    def skip_ratio(self):
+        return self.skipped / float(self.frames) if self.frames else 0.0
+
+    def reset(self):
+        self.reference = None
+        self.since_detection = 0
+        self.frames = 0
+        self.skipped = 0
+
+def create_gates(thresholds, num_sources, force_interval, step):
+    """One gate per source from the --motion_threshold values, the last value applies to the remaining sources"""
+    if not thresholds:
+        return None
+    return [MotionGate(thresholds[min(index, len(thresholds) - 1)], force_interval, step) for index in range(num_sources)]
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# Python side of the compiled batch metadata walker built by nvds_batch_walker_builder.py.
+# One call per batch returns NumPy structured arrays instead of walking the metadata lists
+# object by object through pyds.
+
+import numpy as np
+try:
+    from _nvds_batch_walker import ffi, lib
+except ImportError:
+    ffi = lib = None
+
+# C structs shared by the source and the cdef of nvds_batch_walker_builder.py; their layouts must match the dtypes below
+WALKER_STRUCTS = """
+    typedef struct {
+        unsigned int source;
+        unsigned int frame;
+        int class_id;
+        float left;
+        float top;
+        float width;
+        float height;
+        float confidence;
+    } RedactionObject;
+
+    typedef struct {
+        unsigned int source;
+        unsigned int frame;
+        unsigned int num_objects;
+        unsigned int reserved;
+        unsigned long long pts;
+    } RedactionFrame;
+
+    typedef struct {
+        int enabled;
+        int border_width;
+        int has_bg_color;
+        float red;
+        float green;
+        float blue;
+        float alpha;
+    } RedactionStyle;
+"""
+
+# same layout as RedactionObject, and as the columnar detection export records
+OBJECT_DTYPE = np.dtype([
+    ("source", "<u4"),
+    ("frame", "<u4"),
+    ("class_id", "<i4"),
+    ("left", "<f4"),
+    ("top", "<f4"),
+    ("width", "<f4"),
+    ("height", "<f4"),
+    ("confidence", "<f4"),
+])
+
+# same layout as RedactionFrame
+FRAME_DTYPE = np.dtype([
+    ("source", "<u4"),
+    ("frame", "<u4"),
+    ("num_objects", "<u4"),
+    ("reserved", "<u4"),
+    ("pts", "<u8"),
+])
+
+def available():
+    """True when the compiled helper has been built"""
+    return lib is not None
+
+class BatchMetaWalker(object):
+    """Walks the metadata of a whole batch in one native call"""
+    def __init__(self, colors, num_classes, max_frames, initial_capacity=256):
+        if lib is None:
+            raise ImportError("_nvds_batch_walker is not built, run nvds_batch_walker_builder.py")
+        self.num_classes = num_classes
+        self.styles = ffi.new("RedactionStyle[]", num_classes)
+        self.set_colors(colors)
+        self.frames = np.zeros(max_frames, dtype=FRAME_DTYPE)
+        self.objects = np.zeros(initial_capacity, dtype=OBJECT_DTYPE)
+        self.num_frames = ffi.new("int *")
+
+    def set_colors(self, colors):
+        """Fills the per-class style lookup table, classes without a colour keep their nvinfer style"""
+        for class_id in range(self.num_classes):
+            style = self.styles[class_id]
+            color = colors.get(class_id)
+            style.enabled = 1 if color is not None else 0
+            if color is not None:
+                style.border_width = 0
+                style.has_bg_color = 1
+                style.red, style.green, style.blue, style.alpha = color
+
+    def walk(self, gst_buffer_address, source_frame_numbers):
+        """Returns (frames, objects) for the batch attached to the buffer at gst_buffer_address.
+        Both are copies, safe to hand over to other threads."""
+        base_numbers = np.asarray(source_frame_numbers, dtype=np.uint32)
+        while True:
+            count = lib.walk_batch_meta(ffi.cast("void *", gst_buffer_address),
+                self.styles, self.num_classes,
+                ffi.cast("unsigned int *", ffi.from_buffer(base_numbers)), len(base_numbers),
+                ffi.cast("RedactionFrame *", ffi.from_buffer(self.frames)), len(self.frames),
+                ffi.cast("RedactionObject *", ffi.from_buffer(self.objects)), len(self.objects),
+                self.num_frames)
+            if count <= len(self.objects) and self.num_frames[0] <= len(self.frames):
+                break
+            # styling is idempotent and the frame numbers are not touched, so just walk again
+            if count > len(self.objects):
+                self.objects = np.zeros(max(count, 2 * len(self.objects)), dtype=OBJECT_DTYPE)
+            if self.num_frames[0] > len(self.frames):
+                self.frames = np.zeros(self.num_frames[0], dtype=FRAME_DTYPE)
+        frames = self.frames[:self.num_frames[0]].copy()
+        objects = self.objects[:count].copy().view(np.recarray)
+        return frames, objects
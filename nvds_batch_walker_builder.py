@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+# Builds _nvds_batch_walker, a compiled helper that walks all the frame and object
+# metadata of a DeepStream 4.0 batch in one call, applies the redaction style of each
+# class and packs the boxes into caller provided arrays (see nvds_batch_walker.py).
+#
+# run the following commands to install ffi:
+# sudo apt-get install libffi-dev
+# sudo sudo pip3 install cffi
+# then build the module with:
+# python3 nvds_batch_walker_builder.py
+
+from cffi import FFI
+# the struct layouts live next to the NumPy dtypes they must match
+from nvds_batch_walker import WALKER_STRUCTS
+ffibuilder = FFI()
+
+NVDS_VERSION = "4.0"
+NVDS_ROOT = "/opt/nvidia/deepstream/deepstream-%s" % NVDS_VERSION
+
+ffibuilder.set_source("_nvds_batch_walker",
+  WALKER_STRUCTS + r"""
+#include <gst/gst.h>
+#include <glib.h>
+#include "gstnvdsmeta.h"
+
+/* Walks frame_meta_list/obj_meta_list of the batch attached to buffer.
+ * Objects of class ids with an enabled style get that style applied to their rect_params.
+ * Up to max_frames frames and max_objects objects are written out, frame numbers continue
+ * from source_frame_numbers[pad_index]. Returns the total number of objects in the batch,
+ * which is larger than max_objects when the caller has to grow its array and call again. */
+int walk_batch_meta(void *buffer, const RedactionStyle *styles, int num_styles,
+    const unsigned int *source_frame_numbers, int num_sources,
+    RedactionFrame *frames, int max_frames, RedactionObject *objects, int max_objects,
+    int *num_frames)
+{
+  NvDsBatchMeta *batch_meta = gst_buffer_get_nvds_batch_meta ((GstBuffer *) buffer);
+  NvDsMetaList *l_frame = NULL;
+  NvDsMetaList *l_obj = NULL;
+  int frame_count = 0;
+  int object_count = 0;
+  int i;
+
+  *num_frames = 0;
+  if (batch_meta == NULL)
+    return 0;
+
+  for (l_frame = batch_meta->frame_meta_list; l_frame != NULL; l_frame = l_frame->next) {
+    NvDsFrameMeta *frame_meta = (NvDsFrameMeta *) (l_frame->data);
+    unsigned int source;
+    unsigned int frame_number;
+    int first_object = object_count;
+
+    if (frame_meta == NULL)
+      continue;
+    source = frame_meta->pad_index;
+    frame_number = (int) source < num_sources ? source_frame_numbers[source] : 0;
+    /* a source can have more than one frame in the batch */
+    for (i = 0; i < frame_count && i < max_frames; i++) {
+      if (frames[i].source == source)
+        frame_number++;
+    }
+
+    for (l_obj = frame_meta->obj_meta_list; l_obj != NULL; l_obj = l_obj->next) {
+      NvDsObjectMeta *obj_meta = (NvDsObjectMeta *) (l_obj->data);
+      NvOSD_RectParams *rect_params = &(obj_meta->rect_params);
+      NvOSD_TextParams *text_params = &(obj_meta->text_params);
+
+      if (text_params->display_text) {
+        text_params->set_bg_clr = 0;
+        text_params->font_params.font_size = 0;
+      }
+      if (obj_meta->class_id >= 0 && obj_meta->class_id < num_styles &&
+          styles[obj_meta->class_id].enabled) {
+        const RedactionStyle *style = &styles[obj_meta->class_id];
+        rect_params->border_width = style->border_width;
+        rect_params->has_bg_color = style->has_bg_color;
+        rect_params->bg_color.red = style->red;
+        rect_params->bg_color.green = style->green;
+        rect_params->bg_color.blue = style->blue;
+        rect_params->bg_color.alpha = style->alpha;
+      }
+      if (object_count < max_objects) {
+        RedactionObject *object = &objects[object_count];
+        object->source = source;
+        object->frame = frame_number;
+        object->class_id = obj_meta->class_id;
+        object->left = rect_params->left;
+        object->top = rect_params->top;
+        object->width = rect_params->width;
+        object->height = rect_params->height;
+        object->confidence = obj_meta->confidence;
+      }
+      object_count++;
+    }
+
+    if (frame_count < max_frames) {
+      frames[frame_count].source = source;
+      frames[frame_count].frame = frame_number;
+      frames[frame_count].num_objects = object_count - first_object;
+      frames[frame_count].reserved = 0;
+      frames[frame_count].pts = frame_meta->buf_pts;
+    }
+    frame_count++;
+  }
+  *num_frames = frame_count;
+  return object_count;
+}
+   """,
+  libraries=["nvdsgst_meta", "nvds_meta", "gstreamer-1.0", "gobject-2.0", "glib-2.0"],
+  library_dirs=[NVDS_ROOT + "/lib"],
+  runtime_library_dirs=[NVDS_ROOT + "/lib"],
+  include_dirs=[".", "../../includes", NVDS_ROOT + "/sources/includes", "/usr/include/gstreamer-1.0", "/usr/local/include/gstreamer-1.0", "/usr/lib/x86_64-linux-gnu/gstreamer-1.0/include", "/usr/include/glib-2.0", "/usr/local/include/glib-2.0", "/usr/lib/aarch64-linux-gnu/glib-2.0/include", "/usr/lib/x86_64-linux-gnu/glib-2.0/include", "/usr/local/lib/glib-2.0/include"]
+  )
+
+ffibuilder.cdef(WALKER_STRUCTS + """
+    int walk_batch_meta(void *buffer, const RedactionStyle *styles, int num_styles,
+        const unsigned int *source_frame_numbers, int num_sources,
+        RedactionFrame *frames, int max_frames, RedactionObject *objects, int max_objects,
+        int *num_frames);
+""")
+
+if __name__ == "__main__":
+    ffibuilder.compile(verbose=True)
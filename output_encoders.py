@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+# Encoders and containers selectable for the file output of the redaction app.
+# Each encoder declares the raw caps it is fed with, the parser its stream goes through
+# before the muxer, and how the common --bitrate/--rate_control/--preset/--tune/
+# --encoder_threads options map to its own properties.
+
+SYSTEM_MEMORY_I420 = "video/x-raw, format=I420"
+NVMM_I420 = "video/x-raw(memory:NVMM), format=I420"
+
+CONTAINERS = {"mp4": "qtmux", "mkv": "matroskamux", "ts": "mpegtsmux"}
+RATE_CONTROLS = ["cbr", "vbr", "cqp"]
+# x264 preset names, also mapped onto the coarser presets of the other encoders
+PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+
+def import_gst():
+    """GStreamer is imported when an output is built, so the encoder and container tables load without it"""
+    import gi
+    gi.require_version("Gst", "1.0")
+    from gi.repository import Gst
+    return Gst
+
+def set_option(encoder, name, value):
+    """Sets a property from its string form (enum nicks, flags), skipped when this version of the element lacks it"""
+    if value is None or encoder.find_property(name) is None:
+        return
+    import_gst().util_set_object_arg(encoder, name, str(value))
+
+def preset_level(preset, levels):
+    """Maps a x264 preset name onto one of levels, ordered from fastest to slowest"""
+    position = PRESETS.index(preset) / float(len(PRESETS) - 1)
+    return levels[min(len(levels) - 1, int(position * len(levels)))]
+
+def configure_avenc_mpeg4(encoder, options):
+    set_option(encoder, "bitrate", options.bitrate * 1000)
+    if options.rate_control == "cqp":
+        set_option(encoder, "pass", "quant")
+        set_option(encoder, "quantizer", options.quality)
+    if options.encoder_threads:
+        set_option(encoder, "threads", options.encoder_threads)
+
+def configure_x264enc(encoder, options):
+    set_option(encoder, "bitrate", options.bitrate)
+    # qual is x264's constant rate factor mode, the usual variable bitrate setting
+    set_option(encoder, "pass", {"cbr": "cbr", "vbr": "qual", "cqp": "quant"}.get(options.rate_control))
+    if options.rate_control in ("vbr", "cqp"):
+        set_option(encoder, "quantizer", options.quality)
+    set_option(encoder, "speed-preset", options.preset)
+    set_option(encoder, "tune", options.tune)
+    set_option(encoder, "threads", options.encoder_threads or None)
+
+def configure_x265enc(encoder, options):
+    set_option(encoder, "bitrate", options.bitrate)
+    if options.rate_control == "cqp":
+        set_option(encoder, "qp", options.quality)
+    set_option(encoder, "speed-preset", options.preset)
+    set_option(encoder, "tune", options.tune)
+    if options.encoder_threads:
+        set_option(encoder, "option-string", "pools=%d" % options.encoder_threads)
+
+def configure_openh264enc(encoder, options):
+    set_option(encoder, "bitrate", options.bitrate * 1000)
+    set_option(encoder, "rate-control", {"cbr": "bitrate", "vbr": "quality", "cqp": "off"}.get(options.rate_control))
+    if options.preset is not None:
+        set_option(encoder, "complexity", preset_level(options.preset, ["low", "medium", "high"]))
+    set_option(encoder, "multi-thread", options.encoder_threads or None)
+
+def configure_nvv4l2(encoder, options):
+    set_option(encoder, "bitrate", options.bitrate * 1000)
+    set_option(encoder, "control-rate", {"cbr": 1, "vbr": 0}.get(options.rate_control))
+    if options.preset is not None:
+        set_option(encoder, "preset-level", preset_level(options.preset, ["UltraFastPreset", "FastPreset", "MediumPreset", "SlowPreset"]))
+
+def configure_omx(encoder, options):
+    set_option(encoder, "bitrate", options.bitrate * 1000)
+    set_option(encoder, "control-rate", {"cbr": "constant", "vbr": "variable"}.get(options.rate_control))
+    if options.preset is not None:
+        set_option(encoder, "preset-level", preset_level(options.preset, ["UltraFastPreset", "FastPreset", "MediumPreset", "SlowPreset"]))
+
+class EncoderSpec(object):
+    def __init__(self, input_caps, parser, configure, hardware=False):
+        # raw caps the encoder is fed with, chosen so that no extra conversion is needed
+        self.input_caps = input_caps
+        self.parser = parser
+        self.configure = configure
+        self.hardware = hardware
+
+ENCODERS = {
+    "avenc_mpeg4": EncoderSpec(SYSTEM_MEMORY_I420, None, configure_avenc_mpeg4),
+    "x264enc": EncoderSpec(SYSTEM_MEMORY_I420, "h264parse", configure_x264enc),
+    "x265enc": EncoderSpec(SYSTEM_MEMORY_I420, "h265parse", configure_x265enc),
+    "openh264enc": EncoderSpec(SYSTEM_MEMORY_I420, "h264parse", configure_openh264enc),
+    "nvv4l2h264enc": EncoderSpec(NVMM_I420, "h264parse", configure_nvv4l2, hardware=True),
+    "nvv4l2h265enc": EncoderSpec(NVMM_I420, "h265parse", configure_nvv4l2, hardware=True),
+    "omxh264enc": EncoderSpec(NVMM_I420, "h264parse", configure_omx, hardware=True),
+    "omxh265enc": EncoderSpec(NVMM_I420, "h265parse", configure_omx, hardware=True),
+}
+# encoders tried by --encoder auto, hardware first
+AUTO_ENCODERS = ["nvv4l2h264enc", "omxh264enc", "x264enc", "openh264enc", "avenc_mpeg4"]
+
+def available(name):
+    return import_gst().ElementFactory.find(name) is not None
+
+def resolve_encoder(name, allow_hardware=True):
+    """Returns the encoder to use for --encoder name, picking the first installed one for auto"""
+    if name != "auto":
+        return name
+    for candidate in AUTO_ENCODERS:
+        if (allow_hardware or not ENCODERS[candidate].hardware) and available(candidate):
+            return candidate
+    return "avenc_mpeg4"
+
+def accepts(factory_name, caps_string):
+    """True when a sink pad template of the element can take caps_string as is"""
+    Gst = import_gst()
+    factory = Gst.ElementFactory.find(factory_name)
+    if factory is None:
+        return False
+    caps = Gst.Caps.from_string(caps_string)
+    for template in factory.get_static_pad_templates():
+        if template.direction == Gst.PadDirection.SINK and template.get_caps().can_intersect(caps):
+            return True
+    return False
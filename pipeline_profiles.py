@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+# Pipeline profiles: INI files tuning the redaction pipeline for a host without code changes.
+#
+# [app]                          command line options, used as defaults the command line overrides
+# batched_push_timeout = 20000
+# encoder = x264enc
+#
+# [element:queue_pgie]           properties of the elements whose name matches the glob pattern
+# max-size-buffers = 4
+#
+# [factory:nvvideoconvert]       properties of every element created from the factory
+# nvbuf-memory-type = 0
+#
+# Element properties are set from their string form once the pipeline is built, so enum
+# nicks and flags can be used. benchmark.py autotune writes profiles in this format.
+
+import shlex
+import fnmatch
+import logging
+import argparse
+import configparser
+
+logger = logging.getLogger("redaction.profile")
+
+APP_SECTION = "app"
+ELEMENT_PREFIX = "element:"
+FACTORY_PREFIX = "factory:"
+
+class Profile(object):
+    def __init__(self, app_options=None, element_rules=None):
+        # option dest -> value
+        self.app_options = app_options or {}
+        # (prefix, pattern, {property: value}) in file order, later rules win
+        self.element_rules = element_rules or []
+
+    def matching_properties(self, element):
+        factory = element.get_factory()
+        factory_name = factory.get_name() if factory is not None else None
+        properties = {}
+        for prefix, pattern, rule_properties in self.element_rules:
+            if prefix == ELEMENT_PREFIX and fnmatch.fnmatchcase(element.get_name(), pattern) or \
+                    prefix == FACTORY_PREFIX and factory_name is not None and fnmatch.fnmatchcase(factory_name, pattern):
+                properties.update(rule_properties)
+        return properties
+
+# values of the flag options
+FLAG_VALUES = {"true": True, "yes": True, "on": True, "1": True, "false": False, "no": False, "off": False, "0": False}
+
+def read_profile(parser):
+    profile = Profile()
+    for section in parser.sections():
+        if section == APP_SECTION:
+            for key, value in parser[section].items():
+                profile.app_options[key.replace("-", "_")] = value.strip()
+        elif section.startswith(ELEMENT_PREFIX) or section.startswith(FACTORY_PREFIX):
+            prefix = ELEMENT_PREFIX if section.startswith(ELEMENT_PREFIX) else FACTORY_PREFIX
+            profile.element_rules.append((prefix, section[len(prefix):], dict(parser[section])))
+        else:
+            logger.warning("ignoring unknown profile section [%s]", section)
+    return profile
+
+def load_profile(path):
+    parser = configparser.ConfigParser(interpolation=None)
+    # keep the case of element properties
+    parser.optionxform = str
+    if not parser.read(path):
+        raise IOError("could not read profile %s" % path)
+    return read_profile(parser)
+
+def save_profile(profile, path, comments=()):
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.optionxform = str
+    if profile.app_options:
+        parser[APP_SECTION] = dict((key, str(value).lower() if isinstance(value, bool) else str(value)) for key, value in profile.app_options.items())
+    for prefix, pattern, properties in profile.element_rules:
+        parser[prefix + pattern] = dict((key, str(value)) for key, value in properties.items())
+    with open(path, "w") as profile_file:
+        for comment in comments:
+            profile_file.write("# %s\n" % comment)
+        parser.write(profile_file)
+
+def option_value(action, value):
+    """Converts the profile value of an option like the command line would: flags take true or false,
+    the others are split like shell words and go through the type, choices and nargs of the option"""
+    if action.nargs == 0:
+        flag = FLAG_VALUES.get(str(value).strip().lower())
+        if flag is None:
+            raise ValueError("%s takes true or false, got %s" % (action.dest, value))
+        return action.const if flag else action.default
+    words = shlex.split(str(value))
+    values = []
+    for word in words:
+        try:
+            converted = action.type(word) if action.type is not None else word
+        except (TypeError, ValueError, argparse.ArgumentTypeError):
+            raise ValueError("invalid %s value: %s" % (action.dest, word))
+        if action.choices is not None and converted not in action.choices:
+            raise ValueError("invalid %s value: %s, expected one of %s" % (action.dest, word, ", ".join(map(str, action.choices))))
+        values.append(converted)
+    if action.nargs in (None, argparse.OPTIONAL):
+        if len(values) != 1:
+            raise ValueError("%s takes a single value, got %s" % (action.dest, value))
+        return values[0]
+    if action.nargs == argparse.ONE_OR_MORE and not values or isinstance(action.nargs, int) and len(values) != action.nargs:
+        raise ValueError("wrong number of values for %s: %s" % (action.dest, value))
+    return values
+
+def profile_defaults(parser, app_options):
+    """Returns the parser defaults of the [app] options of a profile. Raises ValueError for the options
+    the parser does not have and for the values it would reject."""
+    actions = dict((action.dest, action) for action in parser._actions if action.option_strings)
+    defaults = {}
+    for key, value in app_options.items():
+        action = actions.get(key)
+        if action is None or isinstance(action, argparse._HelpAction):
+            raise ValueError("unknown option %s" % key)
+        defaults[key] = option_value(action, value)
+    return defaults
+
+def parse_args_with_profile(parser, argv=None):
+    """Parses argv with the [app] options of --profile as defaults, so the command line still overrides them"""
+    known, _ = parser.parse_known_args(argv)
+    if known.profile is not None:
+        try:
+            parser.set_defaults(**profile_defaults(parser, load_profile(known.profile).app_options))
+        except ValueError as e:
+            parser.error("profile %s: %s" % (known.profile, e))
+    return parser.parse_args(argv)
+
+def apply_element_properties(profile, pipeline):
+    """Sets the properties of the profile on the matching elements of the pipeline, returns the number set"""
+    # imported here so the profiles can be read and checked without GStreamer
+    import gi
+    gi.require_version("Gst", "1.0")
+    from gi.repository import Gst
+    count = 0
+    iterator = pipeline.iterate_recurse()
+    while True:
+        result, element = iterator.next()
+        if result != Gst.IteratorResult.OK:
+            break
+        for name, value in profile.matching_properties(element).items():
+            if element.find_property(name) is None:
+                logger.warning("%s has no property %s", element.get_name(), name)
+                continue
+            Gst.util_set_object_arg(element, name, value)
+            logger.info("%s.%s = %s", element.get_name(), name, value)
+            count += 1
+    return count
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+# Static privacy masks and inclusion ROIs of fixed cameras, for --privacy_regions.
+#
+# {
+#   "grid_cell": 16,
+#   "sources": {
+#     "*": {"rois": [[[0, 300], [1280, 300], [1280, 720], [0, 720]]]},
+#     "0": {"size": [1280, 720], "masks": [[[900, 40], [1200, 40], [1200, 260], [900, 260]]], "color": [0, 0, 0]},
+#     "rtsp://10.0.0.12/stream": {"masks": [...]}
+#   }
+# }
+#
+# Sources are given by index or by input location, "*" applies to the others. Polygons are in
+# pixels of "size" (defaults to the frame size) and are rasterised once per frame size: the
+# masks are always redacted without inference, and the ROIs bound the detector input and
+# drop the detections outside them through a coarse grid of the ROI cells.
+
+import json
+import numpy as np
+
+DEFAULT_GRID_CELL = 16
+
+def rasterize(polygons, width, height, scale_x=1.0, scale_y=1.0):
+    """Returns the (height, width) bool raster of the polygons, even-odd filled at the pixel centres"""
+    raster = np.zeros((height, width), dtype=bool)
+    centers_x = np.arange(width) + 0.5
+    for polygon in polygons:
+        points = np.array(polygon, dtype=np.float64) * [scale_x, scale_y]
+        x0, y0 = points[:, 0], points[:, 1]
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+        top = max(0, int(np.floor(points[:, 1].min())))
+        bottom = min(height, int(np.ceil(points[:, 1].max())) + 1)
+        for row in range(top, bottom):
+            y = row + 0.5
+            # x of the crossings of the edges spanning this scanline
+            crossing = (y0 <= y) != (y1 <= y)
+            if not crossing.any():
+                continue
+            xs = np.sort(x0[crossing] + (y - y0[crossing]) * (x1[crossing] - x0[crossing]) / (y1[crossing] - y0[crossing]))
+            inside = (np.searchsorted(xs, centers_x) % 2) == 1
+            raster[row] |= inside
+    return raster
+
+class SourceRegions(object):
+    """Masks and ROIs of one source, rasterised on first use for each frame size"""
+    def __init__(self, masks=(), rois=(), size=None, color=(0, 0, 0), grid_cell=DEFAULT_GRID_CELL):
+        self.masks = list(masks)
+        self.rois = list(rois)
+        self.size = size
+        self.color = list(color)
+        self.grid_cell = grid_cell
+        self.rasters = {}
+
+    def raster(self, width, height):
+        """Returns ((rows, columns) of the masked pixels, roi bounds, roi cell summed-area table) for a frame size"""
+        rasters = self.rasters.get((width, height))
+        if rasters is not None:
+            return rasters
+        scale_x, scale_y = (width / float(self.size[0]), height / float(self.size[1])) if self.size else (1.0, 1.0)
+        masked = None
+        if self.masks:
+            masked = np.nonzero(rasterize(self.masks, width, height, scale_x, scale_y))
+        bounds = None
+        cells = None
+        if self.rois:
+            roi = rasterize(self.rois, width, height, scale_x, scale_y)
+            rows, columns = np.nonzero(roi)
+            if len(rows):
+                bounds = (int(columns.min()), int(rows.min()), int(columns.max()) + 1, int(rows.max()) + 1)
+            else:
+                bounds = (0, 0, 0, 0)
+            # a cell is in the ROI when any of its pixels is, summed so a box test is four lookups
+            cell = self.grid_cell
+            grid_h = (height + cell - 1) // cell
+            grid_w = (width + cell - 1) // cell
+            padded = np.zeros((grid_h * cell, grid_w * cell), dtype=bool)
+            padded[:height, :width] = roi
+            grid = padded.reshape(grid_h, cell, grid_w, cell).any(axis=(1, 3))
+            cells = np.zeros((grid_h + 1, grid_w + 1), dtype=np.int32)
+            cells[1:, 1:] = grid.cumsum(axis=0).cumsum(axis=1)
+        rasters = self.rasters[(width, height)] = (masked, bounds, cells)
+        return rasters
+
+    def apply_masks(self, frame):
+        """Fills the masked pixels of an RGB(A) frame in place"""
+        height, width = frame.shape[:2]
+        masked = self.raster(width, height)[0]
+        # indexed by row and column, mapped surfaces can have a pitch wider than the frame
+        if masked is not None:
+            frame[masked[0], masked[1], :3] = self.color
+
+    def roi_bounds(self, width, height):
+        """(left, top, right, bottom) around all the ROIs, None without ROIs"""
+        return self.raster(width, height)[1]
+
+    def inside(self, detections, width, height):
+        """One bool per detection, False for the boxes that touch no ROI cell"""
+        cells = self.raster(width, height)[2]
+        if cells is None or not detections:
+            return [True] * len(detections)
+        cell = self.grid_cell
+        boxes = np.array([(d.left, d.top, d.left + d.width, d.top + d.height) for d in detections], dtype=np.float64)
+        grid_h, grid_w = cells.shape[0] - 1, cells.shape[1] - 1
+        x0 = np.clip(np.floor(boxes[:, 0] / cell), 0, grid_w).astype(np.int64)
+        y0 = np.clip(np.floor(boxes[:, 1] / cell), 0, grid_h).astype(np.int64)
+        x1 = np.clip(np.ceil(boxes[:, 2] / cell), 0, grid_w).astype(np.int64)
+        y1 = np.clip(np.ceil(boxes[:, 3] / cell), 0, grid_h).astype(np.int64)
+        counts = cells[y1, x1] - cells[y0, x1] - cells[y1, x0] + cells[y0, x0]
+        return (counts > 0).tolist()
+
+    def select(self, detections, width, height):
+        """The detections touching an ROI"""
+        return [detection for detection, keep in zip(detections, self.inside(detections, width, height)) if keep]
+
+def load_regions(path, inputs):
+    """Returns the SourceRegions of each input (None for the inputs without any), from a --privacy_regions file"""
+    with open(path) as regions_file:
+        config = json.load(regions_file)
+    grid_cell = int(config.get("grid_cell", DEFAULT_GRID_CELL))
+    sources = config.get("sources", {})
+    regions = []
+    for index in range(max(1, len(inputs))):
+        location = inputs[index] if index < len(inputs) else None
+        source = sources.get(str(index), sources.get(location, sources.get("*")))
+        if source is None:
+            regions.append(None)
+            continue
+        regions.append(SourceRegions(source.get("masks", ()), source.get("rois", ()), source.get("size"),
+            source.get("color", (0, 0, 0)), grid_cell))
+    return regions
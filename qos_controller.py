@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+# Runtime QoS controller for the redaction pipeline.
+# Runs on the GLib main loop, samples the output fps, the fill level of the queue in front of
+# the detector and the per-frame probe cost, and moves a ladder of knobs one step at a time
+# to hold a target fps and/or latency: first the streammux batch timeout, then the inference
+# interval, then frame dropping. Every move stays within the configured limits and is logged,
+# also to an audit file, so redaction coverage can be checked afterwards.
+
+import json
+import time
+import logging
+
+logger = logging.getLogger("redaction.qos")
+
+# consecutive samples needed before degrading, and before restoring a knob
+OVERLOAD_SAMPLES = 2
+RECOVER_SAMPLES = 5
+
+def import_glib():
+    """GLib is imported when the sampling timer starts, so the controller can be driven without gi"""
+    import gi
+    gi.require_version("GLib", "2.0")
+    from gi.repository import GLib
+    return GLib
+
+class Knob(object):
+    """One adjustable setting, level 0 is the configured value and higher levels trade quality for speed"""
+    def __init__(self, name, values, apply):
+        self.name = name
+        self.values = values
+        self.apply = apply
+        self.level = 0
+
+    def value(self):
+        return self.values[self.level]
+
+    def step(self, direction):
+        """Moves one level up (direction 1) or down (-1), returns (old, new) or None at the limit"""
+        level = self.level + direction
+        if level < 0 or level >= len(self.values):
+            return None
+        old = self.value()
+        self.level = level
+        self.apply(self.value())
+        return old, self.value()
+
+class QosController(object):
+    def __init__(self, app, args):
+        self.app = app
+        self.target_fps = args.qos_target_fps
+        self.target_latency_ms = args.qos_target_latency_ms
+        self.audit_file = open(args.qos_log, "a") if args.qos_log is not None else None
+        self.knobs = []
+        if app.streammux is not None:
+            # a shorter timeout pushes partial batches sooner, trading batching for latency
+            timeouts = []
+            timeout = args.batched_push_timeout
+            while timeout >= args.qos_min_push_timeout:
+                timeouts.append(timeout)
+                timeout //= 2
+            self.knobs.append(Knob("batched-push-timeout", timeouts or [args.batched_push_timeout],
+                lambda value: app.streammux.set_property("batched-push-timeout", value)))
+        if app.trackers is None and app.tracker is None and not app.cpu_mode:
+            # without a tracker the frames nvinfer skips would not be redacted at all
+            logger.warning("no tracker, the inference interval is not adjusted")
+        else:
+            start = app.inference_interval()
+            max_interval = args.qos_max_interval
+            if app.trackers is not None and max_interval > args.tracker_max_age:
+                # the built-in tracker coasts over the skipped frames, not for longer than its lifetime
+                logger.warning("the inference interval is capped at --tracker_max_age %d", args.tracker_max_age)
+                max_interval = args.tracker_max_age
+            self.knobs.append(Knob("interval", list(range(start, max(start, max_interval) + 1)), app.set_inference_interval))
+        if args.qos_allow_drops and app.inference_queues:
+            self.knobs.append(Knob("drop-policy", ["configured", "oldest"], app.set_overload_drops))
+        self.overloaded = 0
+        self.recovered = 0
+        self.interval = args.qos_interval
+        self.last_time = time.monotonic()
+        self.last_frames = sum(app.source_frame_numbers)
+        self.last_probe_seconds = app.probe_seconds
+        self.timeout_id = None
+        logger.info("qos controller started, target fps %s, target latency %s ms, knobs %s", self.target_fps,
+            self.target_latency_ms, ", ".join("%s %s" % (k.name, k.values) for k in self.knobs))
+
+    def start(self):
+        """Samples every --qos_interval seconds from the GLib main loop"""
+        self.last_time = time.monotonic()
+        self.timeout_id = import_glib().timeout_add(int(self.interval * 1000), self.sample)
+
+    def measure(self):
+        now = time.monotonic()
+        frames = sum(self.app.source_frame_numbers)
+        elapsed = max(now - self.last_time, 1e-6)
+        fps = (frames - self.last_frames) / elapsed / max(1, self.app.num_sources)
+        probe_ms = (self.app.probe_seconds - self.last_probe_seconds) * 1000.0 / max(1, frames - self.last_frames)
+        latency_ms = None
+        if self.app.inference_queues:
+            latency_ms = max(q.get_property("current-level-time") for q in self.app.inference_queues) / 1e6
+        self.last_time = now
+        self.last_frames = frames
+        self.last_probe_seconds = self.app.probe_seconds
+        return {"fps": fps, "latency_ms": latency_ms, "probe_ms": probe_ms}
+
+    def sample(self):
+        metrics = self.measure()
+        too_slow = self.target_fps is not None and metrics["fps"] < 0.95 * self.target_fps
+        too_late = self.target_latency_ms is not None and metrics["latency_ms"] is not None and metrics["latency_ms"] > self.target_latency_ms
+        fast_enough = self.target_fps is None or metrics["fps"] >= 0.98 * self.target_fps
+        early_enough = self.target_latency_ms is None or metrics["latency_ms"] is None or metrics["latency_ms"] < 0.5 * self.target_latency_ms
+        if too_slow or too_late:
+            self.overloaded += 1
+            self.recovered = 0
+            if self.overloaded >= OVERLOAD_SAMPLES:
+                self.overloaded = 0
+                # degrade the cheapest knob first
+                for knob in self.knobs:
+                    if self.adjust(knob, 1, "fps below target" if too_slow else "latency above target", metrics):
+                        break
+        elif fast_enough and early_enough:
+            self.recovered += 1
+            self.overloaded = 0
+            if self.recovered >= RECOVER_SAMPLES:
+                self.recovered = 0
+                # restore in the reverse order
+                for knob in reversed(self.knobs):
+                    if self.adjust(knob, -1, "within target", metrics):
+                        break
+        else:
+            self.overloaded = 0
+            self.recovered = 0
+        return True
+
+    def adjust(self, knob, direction, reason, metrics):
+        change = knob.step(direction)
+        if change is None:
+            return False
+        logger.info("%s %s -> %s (%s, fps %.1f, latency %s ms, probe %.2f ms/frame)", knob.name, change[0], change[1], reason,
+            metrics["fps"], "-" if metrics["latency_ms"] is None else "%.0f" % metrics["latency_ms"], metrics["probe_ms"])
+        if self.audit_file is not None:
+            self.audit_file.write(json.dumps({"time": time.time(), "knob": knob.name, "old": change[0], "new": change[1],
+                "reason": reason, "metrics": metrics}) + "\n")
+            self.audit_file.flush()
+        return True
+
+    def stop(self):
+        if self.timeout_id is not None:
+            import_glib().source_remove(self.timeout_id)
+            self.timeout_id = None
+        if self.audit_file is not None:
+            self.audit_file.close()
+            self.audit_file = None
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+# asyncio API of the redaction app, for embedding pipelines in a service instead of running a
+# process per job. Every pipeline of the process is served by one GLib main loop on a
+# background thread; bus messages, per-frame detections and stats snapshots are handed to the
+# asyncio loop with call_soon_threadsafe, one wakeup per burst of events, never by polling.
+#
+# async def redact(path):
+#     pipeline = RedactionPipeline(["-c", "configs/pgie_config_fd_lpd.txt", "-i", path, "-o", path + ".redacted.mp4"])
+#     await pipeline.start()
+#     async for event in pipeline.events():
+#         if isinstance(event, FrameEvent):
+#             print(event.source, event.frame, len(event.detections))
+#     return await pipeline.wait()
+#
+# python3 redaction_async.py -c configs/pgie_config_fd_lpd.txt -i a.mp4 b.mp4 --fakesink --stats_interval 5
+
+import sys
+import time
+import asyncio
+import argparse
+import threading
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GObject, GLib
+
+import deepstream_redaction_app
+from deepstream_redaction_app import Redaction_Main, read_input_manifest, computeDiffInMillis
+from pipeline_profiles import parse_args_with_profile
+# the events and their queue are plain python, re-exported as part of the API
+from redaction_events import FrameEvent, StatsEvent, MessageEvent, EventStream, as_detections, DEFAULT_MAX_EVENTS
+
+_glib_lock = threading.Lock()
+_glib_loop = None
+
+def ensure_glib_loop():
+    """Starts the GLib main loop shared by all the pipelines of the process, on first use. Nothing
+    else may run a loop on the default GLib context meanwhile."""
+    global _glib_loop
+    with _glib_lock:
+        if _glib_loop is None:
+            GObject.threads_init()
+            Gst.init(None)
+            _glib_loop = GLib.MainLoop()
+            threading.Thread(target=_glib_loop.run, name="glib-main-loop", daemon=True).start()
+    return _glib_loop
+
+def parse_app_args(argv):
+    """deepstream_redaction_app.py options of a pipeline, from a command line split into a list"""
+    args = parse_args_with_profile(deepstream_redaction_app.build_arg_parser(), argv)
+    if args.input_list is not None:
+        args.input_mp4 = (args.input_mp4 or []) + read_input_manifest(args.input_list)
+    if args.chunk_workers > 0:
+        raise ValueError("--chunk_workers runs worker processes, it is not available in a pipeline")
+    return args
+
+class RedactionPipeline(object):
+    """One Redaction_Main driven from an asyncio loop. Several pipelines can run at once in a process,
+    they share the GLib loop thread and each keeps its own elements, detector and outputs."""
+    def __init__(self, argv=None, args=None, max_events=DEFAULT_MAX_EVENTS):
+        self.args = args if args is not None else parse_app_args(argv or [])
+        self.max_events = max_events
+        self.app = None
+        self.loop = None
+        self.stream = None
+        self.done = None
+        self.started = None
+        self.finishing = False
+        self.result = None
+
+    async def start(self):
+        """Builds the pipeline, without blocking the event loop on engine builds, and sets it playing"""
+        if self.app is not None:
+            raise RuntimeError("the pipeline was already started")
+        self.loop = asyncio.get_event_loop()
+        self.stream = EventStream(self.loop, self.max_events)
+        self.done = self.loop.create_future()
+        ensure_glib_loop()
+        app = await self.loop.run_in_executor(None, Redaction_Main, self.args, False)
+        if not app.built:
+            raise RuntimeError("the pipeline could not be built")
+        self.app = app
+        app.frame_listener = self.on_frame
+        app.stats_listeners.append(self.on_stats)
+        # connected after the handler of the app, which has handled the message when this one runs
+        self.bus_handler_id = app.bus.connect("message", self.on_message)
+        self.started = time.time()
+        app.start_playing()
+
+    def events(self):
+        """Async iterator of the FrameEvent, StatsEvent and MessageEvent of the run, ends after the pipeline did"""
+        if self.stream is None:
+            raise RuntimeError("the pipeline is not started")
+        return self.stream
+
+    async def wait(self):
+        """Waits for the end of the stream or an error, returns the result of the run"""
+        if self.done is None:
+            raise RuntimeError("the pipeline is not started")
+        return await asyncio.shield(self.done)
+
+    async def stop(self, timeout=None):
+        """Ends the stream so the outputs are finalized, and waits for the pipeline. After timeout seconds
+        the pipeline is stopped without waiting for the outputs."""
+        if self.done is None:
+            raise RuntimeError("the pipeline is not started")
+        if not self.done.done() and not self.app.eos_requested:
+            # live sources are not reconnected once the end of stream is requested
+            self.app.eos_requested = True
+            self.app.pipeline.send_event(Gst.Event.new_eos())
+        try:
+            return await asyncio.wait_for(asyncio.shield(self.done), timeout)
+        except asyncio.TimeoutError:
+            if not self.done.done():
+                self.app.error = "stopped before the end of stream"
+                self.ended()
+            return await asyncio.shield(self.done)
+
+    def configure(self, overrides):
+        """Applies {class: {setting: value}} runtime settings, from the next frame on"""
+        self.app.update_settings(self.app.settings.updated(overrides, self.app.pgie_classes_str))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.stop()
+
+    def on_frame(self, source_index, frame_number, pts, detections):
+        # streaming threads
+        self.stream.put(FrameEvent(source_index, frame_number, pts, as_detections(detections)))
+
+    def on_stats(self, snapshot):
+        # GLib loop thread
+        self.stream.put(StatsEvent(snapshot))
+
+    def on_message(self, bus, message):
+        # GLib loop thread
+        t = message.type
+        if t == Gst.MessageType.EOS:
+            self.stream.put(MessageEvent("eos", message.src.get_name(), None))
+        elif t == Gst.MessageType.ERROR:
+            err, debug = message.parse_error()
+            self.stream.put(MessageEvent("error", message.src.get_name(), str(err)))
+        elif t == Gst.MessageType.WARNING:
+            err, debug = message.parse_warning()
+            self.stream.put(MessageEvent("warning", message.src.get_name(), str(err)))
+        elif t == Gst.MessageType.ELEMENT and message.get_structure() is not None and \
+                message.get_structure().get_name() == "splitmuxsink-fragment-closed":
+            self.stream.put(MessageEvent("segment", message.src.get_name(), message.get_structure().get_string("location")))
+        elif t == Gst.MessageType.STATE_CHANGED and message.src == self.app.pipeline:
+            old_state, new_state, pending_state = message.parse_state_changed()
+            self.stream.put(MessageEvent("state-changed", message.src.get_name(), new_state.value_nick))
+        # errors of live sources being reconnected do not end the run
+        if t in (Gst.MessageType.EOS, Gst.MessageType.ERROR) and (self.app.reached_eos or self.app.error is not None):
+            self.loop.call_soon_threadsafe(self.ended)
+        return True
+
+    def ended(self):
+        if self.finishing:
+            return
+        self.finishing = True
+        self.loop.create_task(self.finish())
+
+    async def finish(self):
+        app = self.app
+        app.bus.disconnect(self.bus_handler_id)
+        # writing the outputs and the checkpointed remux can take a while
+        await self.loop.run_in_executor(None, self.finish_app)
+        self.result = {
+            "error": app.error,
+            "wall_ms": computeDiffInMillis(self.started, time.time()),
+            "frames": list(app.source_frame_numbers),
+            "objects": list(app.source_obj_counts),
+            "stats": app.stats_snapshot,
+            "dropped_events": self.stream.dropped,
+        }
+        self.stream.close()
+        self.done.set_result(self.result)
+
+    def finish_app(self):
+        self.app.stop_playing()
+        self.app.finish()
+
+async def run_pipelines(argv):
+    """Runs one pipeline per input of the command line at once, printing their events"""
+    args = parse_app_args(argv)
+    pipelines = []
+    for location in args.input_mp4 or [None]:
+        pipeline_args = argparse.Namespace(**vars(args))
+        pipeline_args.input_mp4 = [location] if location is not None else None
+        pipelines.append(RedactionPipeline(args=pipeline_args))
+
+    async def follow(index, pipeline):
+        await pipeline.start()
+        async for event in pipeline.events():
+            if isinstance(event, StatsEvent):
+                print("pipeline %d: stats at %.1f s" % (index, event.snapshot["uptime_s"]))
+            elif isinstance(event, MessageEvent) and event.kind != "state-changed":
+                print("pipeline %d: %s from %s %s" % (index, event.kind, event.source, event.text or ""))
+        return await pipeline.wait()
+
+    results = await asyncio.gather(*[follow(index, pipeline) for index, pipeline in enumerate(pipelines)])
+    for index, result in enumerate(results):
+        print("pipeline %d: %d frames, %d objects in %d ms%s" % (index, sum(result["frames"]), sum(result["objects"]),
+            result["wall_ms"], ", error: %s" % result["error"] if result["error"] else ""))
+    return 1 if any(result["error"] for result in results) else 0
+
+if __name__ == '__main__':
+    # every -i input runs in its own pipeline, all of them in this process
+    sys.exit(asyncio.get_event_loop().run_until_complete(run_pipelines(sys.argv[1:])))
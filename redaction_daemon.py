@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+# Long-running redaction service.
+# Builds one Redaction_Main and keeps its pipeline, detector and engine loaded between jobs:
+# after each input the pipeline goes back to READY, the filesrc and the output locations are
+# swapped for the next job, and it plays again. Jobs come from a watch folder and/or a local
+# HTTP endpoint, and their status and timings are reported on the endpoint and in a status file.
+#
+# python3 redaction_daemon.py -c configs/pgie_config_fd_lpd.txt --output_dir redacted --watch_dir incoming --http_port 8080
+# curl -X POST -d '{"input": "/data/clip.mp4"}' http://127.0.0.1:8080/jobs
+# curl http://127.0.0.1:8080/jobs
+# curl -X POST -d '{"face": {"threshold": 0.4, "style": "blur:31"}}' http://127.0.0.1:8080/config
+
+import os
+import os.path
+import sys
+import json
+import time
+import queue
+import signal
+import logging
+import argparse
+import threading
+import collections
+import http.server
+import socketserver
+
+from app_helpers import computeDiffInMillis
+from pipeline_profiles import parse_args_with_profile
+
+logger = logging.getLogger("redaction.daemon")
+
+# extensions picked up from the watch folder
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".avi", ".ts", ".h264", ".h265")
+
+def import_gst():
+    """GStreamer and the app are imported when the pipeline is built, so the job handling runs without them"""
+    import gi
+    gi.require_version("Gst", "1.0")
+    from gi.repository import Gst, GObject
+    return Gst, GObject
+
+class Job(object):
+    def __init__(self, job_id, input_path, output_path, kitti_dir):
+        self.job_id = job_id
+        self.input_path = input_path
+        self.output_path = output_path
+        self.kitti_dir = kitti_dir
+        self.status = "queued"
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.frames = 0
+        self.objects = 0
+
+    def to_dict(self):
+        run_ms = computeDiffInMillis(self.started, self.finished) if self.finished is not None else None
+        return {
+            "id": self.job_id,
+            "input": self.input_path,
+            "output": self.output_path,
+            "kitti": self.kitti_dir,
+            "status": self.status,
+            "error": self.error,
+            "queued_ms": computeDiffInMillis(self.submitted, self.started) if self.started is not None else None,
+            "run_ms": run_ms,
+            "frames": self.frames,
+            "objects": self.objects,
+            "fps": self.frames * 1000.0 / max(run_ms, 1) if run_ms is not None else None,
+        }
+
+class RedactionDaemon(object):
+    """Runs the submitted jobs one after the other on a single warm pipeline"""
+    def __init__(self, args, app=None):
+        self.args = args
+        self.lock = threading.Lock()
+        self.jobs = collections.OrderedDict()
+        self.queue = queue.Queue()
+        self.next_id = 1
+        self.stopping = False
+        if not os.path.isdir(args.output_dir):
+            os.makedirs(args.output_dir)
+        self.app = app if app is not None else self.create_app()
+
+    def create_app(self):
+        from deepstream_redaction_app import Redaction_Main
+        Gst, GObject = import_gst()
+        app_args = argparse.Namespace(**vars(self.args))
+        # the graph is built for a single file input, the locations are set by each job
+        app_args.input_mp4 = [os.path.join(self.args.output_dir, "idle.mp4")]
+        app_args.output_mp4 = None if self.args.fakesink else os.path.join(self.args.output_dir, "idle_redacted.mp4")
+        app_args.output_kitti = None
+        # jobs are short, they are not checkpointed
+        app_args.checkpoint = None
+        app = Redaction_Main(app_args, run=False)
+        app.idle_state = Gst.State.READY
+        return app
+
+    def submit(self, input_path, output_path=None, kitti_dir=None):
+        """Queues a job, the outputs default to <output_dir>/<name>_redacted.mp4 and <output_dir>/<name>_kitti"""
+        name = os.path.splitext(os.path.basename(input_path))[0]
+        if output_path is None and not self.args.fakesink:
+            output_path = os.path.join(self.args.output_dir, name + "_redacted.mp4")
+        if kitti_dir is None and self.args.export_detections:
+            kitti_dir = os.path.join(self.args.output_dir, name + "_kitti")
+        with self.lock:
+            job = Job(self.next_id, os.path.abspath(input_path), output_path, kitti_dir)
+            self.next_id += 1
+            self.jobs[job.job_id] = job
+        self.queue.put(job)
+        logger.info("queued job %d: %s", job.job_id, input_path)
+        self.write_status()
+        return job
+
+    def status(self, job_id=None):
+        with self.lock:
+            if job_id is not None:
+                job = self.jobs.get(job_id)
+                return job.to_dict() if job is not None else None
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def write_status(self):
+        if self.args.status_file is None:
+            return
+        tmp_path = self.args.status_file + ".tmp"
+        with open(tmp_path, "w") as status_file:
+            json.dump({"jobs": self.status()}, status_file, indent=2)
+        os.replace(tmp_path, self.args.status_file)
+
+    def serve(self):
+        """Runs jobs until stop() is called, then tears the pipeline down"""
+        if not self.app.built:
+            return 1
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            self.run_job(job)
+        self.app.teardown()
+        return 0
+
+    def configure(self, overrides):
+        """Applies {class: {setting: value}} runtime settings to the pipeline, from the next frame on"""
+        self.app.update_settings(self.app.settings.updated(overrides, self.app.pgie_classes_str))
+        logger.info("runtime settings updated: %s", overrides)
+
+    def stop(self):
+        self.stopping = True
+        self.queue.put(None)
+
+    def run_job(self, job):
+        if not os.path.isfile(job.input_path):
+            job.status = "failed"
+            job.error = "input file not found"
+            job.started = job.finished = time.time()
+            self.write_status()
+            return
+        if job.kitti_dir is not None and not os.path.isdir(job.kitti_dir):
+            os.makedirs(job.kitti_dir)
+        job.status = "running"
+        job.started = time.time()
+        self.write_status()
+        self.app.retarget(job.input_path, job.output_path, job.kitti_dir)
+        self.app.play()
+        # flushes the detections of this job before it is reported as done
+        self.app.open_detection_writer(None)
+        job.finished = time.time()
+        job.frames = self.app.source_frame_numbers[0]
+        job.objects = self.app.source_obj_counts[0]
+        if self.app.error is not None:
+            job.status = "failed"
+            job.error = self.app.error
+        else:
+            job.status = "done"
+        logger.info("job %d %s: %d frames in %d ms", job.job_id, job.status, job.frames, computeDiffInMillis(job.started, job.finished))
+        self.write_status()
+
+class WatchFolder(object):
+    """Submits the video files that appear in a folder, once their size stopped changing"""
+    def __init__(self, daemon, path, interval):
+        self.daemon = daemon
+        self.path = path
+        self.interval = interval
+        self.seen = set()
+        self.sizes = {}
+        self.thread = threading.Thread(target=self.run, name="watch-folder")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while not self.daemon.stopping:
+            self.scan()
+            time.sleep(self.interval)
+
+    def scan(self):
+        try:
+            names = sorted(os.listdir(self.path))
+        except OSError as e:
+            # an unmounted or removed folder is scanned again on the next interval
+            logger.warning("watch folder %s not readable: %s", self.path, e)
+            return
+        for name in names:
+            path = os.path.join(self.path, name)
+            if path in self.seen or not name.lower().endswith(VIDEO_EXTENSIONS) or not os.path.isfile(path):
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError as e:
+                # removed or renamed since the listing
+                logger.warning("watch folder file %s skipped: %s", path, e)
+                continue
+            # a file still being copied in grows between two scans
+            if self.sizes.get(path) == size:
+                self.seen.add(path)
+                self.daemon.submit(path)
+            else:
+                self.sizes[path] = size
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+class JobRequestHandler(http.server.BaseHTTPRequestHandler):
+    """POST /jobs {"input": ..., "output": ..., "kitti": ...} queues a job, GET /jobs and GET /jobs/<id> report status,
+    POST /config {"<class>": {"threshold": ..., "enabled": ..., "style": ..., "color": ...}} updates the class settings"""
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts[0] != "jobs" or len(parts) > 2:
+            self.reply(404, {"error": "not found"})
+        elif len(parts) == 2:
+            job = self.server.redaction_daemon.status(int(parts[1])) if parts[1].isdigit() else None
+            self.reply(200 if job is not None else 404, job if job is not None else {"error": "no such job"})
+        else:
+            self.reply(200, {"jobs": self.server.redaction_daemon.status()})
+
+    def do_POST(self):
+        if self.path.strip("/") == "config":
+            try:
+                overrides = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+                self.server.redaction_daemon.configure(overrides)
+            except (ValueError, TypeError, AttributeError) as e:
+                # TypeError: a null or non numeric value
+                self.reply(400, {"error": str(e)})
+                return
+            self.reply(200, {"config": overrides})
+            return
+        if self.path.strip("/") != "jobs":
+            self.reply(404, {"error": "not found"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+        except ValueError:
+            request = None
+        # the paths end up in os.path calls on the job thread, anything but strings would stop it
+        if not isinstance(request, dict) or not isinstance(request.get("input"), str) or \
+                any(request.get(key) is not None and not isinstance(request.get(key), str) for key in ("output", "kitti")):
+            self.reply(400, {"error": "expected a JSON object with an input path"})
+            return
+        job = self.server.redaction_daemon.submit(request["input"], request.get("output"), request.get("kitti"))
+        self.reply(202, job.to_dict())
+
+    def reply(self, code, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+def build_arg_parser():
+    import deepstream_redaction_app
+    parser = deepstream_redaction_app.build_arg_parser()
+    parser.description = "redaction service keeping a warm pipeline across jobs"
+    parser.add_argument('--output_dir', default="redacted", help='(optional) folder of the redacted outputs of the jobs')
+    parser.add_argument('--export_detections', action='store_true', help='(optional) export the detections of every job to <output_dir>/<name>_kitti, in --export_format')
+    parser.add_argument('--watch_dir', help='(optional) folder watched for new input files')
+    parser.add_argument('--watch_interval', type=float, default=2.0, help='(optional) seconds between two scans of --watch_dir')
+    parser.add_argument('--http_port', type=int, help='(optional) port of the local HTTP job endpoint')
+    parser.add_argument('--http_host', default="127.0.0.1", help='(optional) address the HTTP job endpoint listens on')
+    parser.add_argument('--status_file', help='(optional) JSON file rewritten with the status of all the jobs')
+    return parser
+
+if __name__ == '__main__':
+    parser = build_arg_parser()
+    args = parse_args_with_profile(parser)
+    logging.basicConfig(level=getattr(logging, args.log_level), format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    if args.watch_dir is None and args.http_port is None:
+        parser.error("give --watch_dir and/or --http_port")
+
+    Gst, GObject = import_gst()
+    GObject.threads_init()
+    Gst.init(None)
+    daemon = RedactionDaemon(args)
+    if args.watch_dir is not None:
+        WatchFolder(daemon, args.watch_dir, args.watch_interval)
+    if args.http_port is not None:
+        server = ThreadingHTTPServer((args.http_host, args.http_port), JobRequestHandler)
+        server.redaction_daemon = daemon
+        threading.Thread(target=server.serve_forever, name="job-endpoint", daemon=True).start()
+        print("Accepting jobs on http://%s:%d/jobs" % (args.http_host, args.http_port))
+    # finish the running job, then exit
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: daemon.stop())
+    sys.exit(daemon.serve())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+# Events of the asyncio API of the redaction app (see redaction_async.py), and the bounded
+# queue that hands them from the GLib and streaming threads to the asyncio consumer.
+
+import threading
+import collections
+
+from detections import Detection
+
+# events queued for a consumer that falls behind before the oldest frames are dropped
+DEFAULT_MAX_EVENTS = 1024
+
+# detections of one frame of one source, in the coordinates of the exported detections
+FrameEvent = collections.namedtuple("FrameEvent", ["source", "frame", "pts", "detections"])
+# snapshot of the stage stats, every --stats_interval seconds
+StatsEvent = collections.namedtuple("StatsEvent", ["snapshot"])
+# bus message of the pipeline: "eos", "error", "warning", "state-changed" or "segment" (a closed
+# output segment, with its location), with its text
+MessageEvent = collections.namedtuple("MessageEvent", ["kind", "source", "text"])
+
+def as_detections(detections):
+    """Detection tuples of a frame, the native walker hands out rows of an array it reuses"""
+    if hasattr(detections, "dtype"):
+        return [Detection(*row) for row in zip(detections["class_id"].tolist(), detections["left"].tolist(),
+            detections["top"].tolist(), detections["width"].tolist(), detections["height"].tolist(),
+            detections["confidence"].tolist())]
+    return list(detections)
+
+class EventStream(object):
+    """Bounded queue filled from any thread and drained by one asyncio consumer. A consumer that
+    falls behind loses the oldest events, counted in dropped."""
+    def __init__(self, loop, max_events):
+        self.loop = loop
+        self.events = collections.deque(maxlen=max_events)
+        self.lock = threading.Lock()
+        self.waiter = None
+        self.wakeup_scheduled = False
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, event):
+        with self.lock:
+            if self.closed:
+                return
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append(event)
+            self.schedule_wakeup()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.schedule_wakeup()
+
+    def schedule_wakeup(self):
+        # called with the lock held, a single wakeup serves all the events put until the consumer runs
+        if self.waiter is not None and not self.wakeup_scheduled:
+            self.wakeup_scheduled = True
+            self.loop.call_soon_threadsafe(self.wakeup)
+
+    def wakeup(self):
+        with self.lock:
+            self.wakeup_scheduled = False
+            waiter = self.waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            with self.lock:
+                if self.events:
+                    return self.events.popleft()
+                if self.closed:
+                    raise StopAsyncIteration
+                self.waiter = self.loop.create_future()
+            try:
+                await self.waiter
+            finally:
+                with self.lock:
+                    self.waiter = None
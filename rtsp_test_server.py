@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+# Local RTSP stand-in for a network camera, to try the live source handling of the
+# redaction app without real cameras. Serves a videotestsrc stream, and can drop all the
+# clients every --restart_every seconds to exercise the reconnects.
+#
+# run the following command to install the dependencies:
+# sudo apt install gir1.2-gst-rtsp-server-1.0
+#
+# python3 rtsp_test_server.py --port 8554 --restart_every 20
+# python3 deepstream_redaction_app.py -c configs/pgie_config_fd_lpd.txt -i rtsp://127.0.0.1:8554/test --latency_budget_ms 200
+
+import sys
+import argparse
+import gi
+gi.require_version("Gst", "1.0")
+gi.require_version("GstRtspServer", "1.0")
+from gi.repository import Gst, GObject, GLib, GstRtspServer
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="local RTSP test stream")
+    parser.add_argument('--port', type=int, default=8554, help='(optional) RTSP port')
+    parser.add_argument('--mount', default="/test", help='(optional) path of the stream')
+    parser.add_argument('--resolution', default="1280x720", help='(optional) resolution of the stream')
+    parser.add_argument('--fps', type=int, default=30, help='(optional) frame rate of the stream')
+    parser.add_argument('--restart_every', type=float, default=0, help='(optional) seconds between two disconnections of all the clients, 0 (default) never disconnects')
+    return parser
+
+def main(args):
+    width, height = [int(v) for v in args.resolution.lower().split("x")]
+    server = GstRtspServer.RTSPServer()
+    server.set_service(str(args.port))
+    factory = GstRtspServer.RTSPMediaFactory()
+    factory.set_launch("( videotestsrc is-live=true pattern=ball ! video/x-raw, width=%d, height=%d, framerate=%d/1 ! "
+        "x264enc tune=zerolatency speed-preset=ultrafast key-int-max=%d ! rtph264pay name=pay0 pt=96 )" % (width, height, args.fps, args.fps))
+    factory.set_shared(True)
+    server.get_mount_points().add_factory(args.mount, factory)
+    server.attach(None)
+    print("Serving rtsp://127.0.0.1:%d%s" % (args.port, args.mount))
+
+    def disconnect_clients():
+        print("Disconnecting all clients")
+        server.client_filter(lambda server, client: GstRtspServer.RTSPFilterResult.REMOVE)
+        return True
+
+    if args.restart_every > 0:
+        GLib.timeout_add(int(args.restart_every * 1000), disconnect_clients)
+    loop = GLib.MainLoop()
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    GObject.threads_init()
+    Gst.init(None)
+    sys.exit(main(args))
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+# Class thresholds, enabled classes and redaction styles that can change while the pipeline runs.
+# The probes read one immutable RuntimeSettings snapshot per batch; a reload builds a new
+# snapshot and swaps the reference, so a change applies from the next frame without pausing
+# or dropping anything. --runtime_config is watched for changes and reloaded on SIGHUP.
+#
+# [face]
+# threshold = 0.3
+# style = blur:31
+#
+# [license_plate]
+# enabled = true
+# style = fill
+# color = 0.5, 0.0, 0.5
+#
+# python3 runtime_config.py set runtime.ini face.threshold=0.4 license_plate.style=pixelate:12
+
+import os
+import sys
+import signal
+import logging
+import argparse
+import configparser
+
+from detections import REDACTION_COLORS
+from redaction_styles import parse_styles
+
+logger = logging.getLogger("redaction.runtime")
+
+SETTING_KEYS = ("enabled", "threshold", "style", "color")
+
+class RuntimeSettings(object):
+    """Snapshot of the per-class settings, never modified once built"""
+    def __init__(self, styles, colors=REDACTION_COLORS, thresholds=None, disabled=()):
+        self.styles = dict(styles)
+        self.colors = dict(colors)
+        # minimum confidence kept per class, on top of the detector thresholds
+        self.thresholds = dict(thresholds or {})
+        self.disabled = frozenset(disabled)
+        self.pixel_styles = dict((class_id, style) for class_id, style in self.styles.items() if style.kind != "fill")
+
+    def fill_colors(self):
+        """{class_id: colour} of the filled classes, black for those without a colour, as style_rect draws them"""
+        return dict((class_id, self.colors.get(class_id, (0.0, 0.0, 0.0, 1.0))) for class_id, style in self.styles.items()
+            if style.kind == "fill")
+
+    def accepts(self, class_id, confidence):
+        return class_id not in self.disabled and confidence >= self.thresholds.get(class_id, 0.0)
+
+    def updated(self, overrides, class_names):
+        """Returns a new snapshot with {class name or id: {setting: value}} applied"""
+        styles = dict(self.styles)
+        colors = dict(self.colors)
+        thresholds = dict(self.thresholds)
+        disabled = set(self.disabled)
+        for target, values in overrides.items():
+            target = str(target)
+            class_id = int(target) if target.isdigit() else class_names.index(target) if target in class_names else None
+            if class_id is None:
+                raise ValueError("unknown class %s" % target)
+            for key, value in values.items():
+                if key == "enabled":
+                    enabled = value if isinstance(value, bool) else str(value).strip().lower() in ("1", "true", "yes", "on")
+                    (disabled.discard if enabled else disabled.add)(class_id)
+                elif key == "threshold":
+                    thresholds[class_id] = float(value)
+                elif key == "style":
+                    styles.update(parse_styles("%d=%s" % (class_id, value), class_names, colors={}))
+                elif key == "color":
+                    components = [float(c) for c in (value.split(",") if isinstance(value, str) else value)]
+                    colors[class_id] = tuple(components + [1.0] * (4 - len(components)))
+                else:
+                    raise ValueError("unknown setting %s, expected one of %s" % (key, ", ".join(SETTING_KEYS)))
+        return RuntimeSettings(styles, colors, thresholds, disabled)
+
+def read_overrides(path):
+    parser = configparser.ConfigParser(interpolation=None)
+    if not parser.read(path):
+        raise IOError("could not read runtime config %s" % path)
+    return dict((section, dict(parser[section])) for section in parser.sections())
+
+def import_glib():
+    """GLib is imported on first use, so the settings work without gi"""
+    import gi
+    gi.require_version("GLib", "2.0")
+    from gi.repository import GLib
+    return GLib
+
+class ConfigWatcher(object):
+    """Reloads a runtime config when its modification time changes or on SIGHUP, from the GLib main loop"""
+    def __init__(self, path, interval, base, class_names, on_change):
+        self.path = path
+        # settings from the command line, the file is applied on top of them on every reload
+        self.base = base
+        self.class_names = class_names
+        self.on_change = on_change
+        self.mtime = None
+        GLib = import_glib()
+        self.timeout_id = GLib.timeout_add(int(interval * 1000), self.poll)
+        self.signal_id = GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGHUP, self.reload)
+
+    def load(self):
+        self.mtime = os.path.getmtime(self.path)
+        return self.base.updated(read_overrides(self.path), self.class_names)
+
+    def poll(self):
+        try:
+            changed = os.path.getmtime(self.path) != self.mtime
+        except OSError:
+            changed = False
+        if changed:
+            self.reload()
+        return True
+
+    def reload(self):
+        try:
+            settings = self.load()
+        except (IOError, OSError, ValueError, configparser.Error) as e:
+            # a half edited file keeps the current settings
+            logger.warning("runtime config %s not applied: %s", self.path, e)
+            return True
+        logger.info("runtime config %s applied", self.path)
+        self.on_change(settings)
+        return True
+
+    def stop(self):
+        GLib = import_glib()
+        for source_id in (self.timeout_id, self.signal_id):
+            GLib.source_remove(source_id)
+
+def set_values(path, assignments):
+    """Applies <class>.<setting>=<value> assignments to a runtime config file, replaced atomically"""
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read(path)
+    for assignment in assignments:
+        name, _, value = assignment.partition("=")
+        section, _, key = name.partition(".")
+        if not value or key not in SETTING_KEYS:
+            raise ValueError("expected <class>.<%s>=<value>, got %s" % ("|".join(SETTING_KEYS), assignment))
+        if not parser.has_section(section):
+            parser.add_section(section)
+        parser[section][key] = value
+    with open(path + ".tmp", "w") as config_file:
+        parser.write(config_file)
+    os.replace(path + ".tmp", path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="edit the runtime config of a running redaction app")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    set_parser = subparsers.add_parser("set", help="change settings, picked up by the app within --runtime_config_interval")
+    set_parser.add_argument('config', help='--runtime_config file of the app')
+    set_parser.add_argument('assignments', nargs='+', help='<class>.<setting>=<value>, setting is one of %s' % ", ".join(SETTING_KEYS))
+    args = parser.parse_args()
+    try:
+        set_values(args.config, args.assignments)
+    except ValueError as e:
+        parser.error(str(e))
+    sys.exit(0)
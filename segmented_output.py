@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# Rolling segmented output, for --segment_seconds and --segment_size_mb.
+# splitmuxsink writes the -o output of each source as <stem>_00000<ext>, <stem>_00001<ext>, ...
+# and starts a new file at the first keyframe past the duration or size limit. Each segment is
+# a complete file once it is closed, so the muxer index only ever holds one segment in memory
+# and a crash loses at most the segment being written. Every closed segment is appended to a
+# JSON lines manifest, logged, and handed to --segment_command, which runs in the background
+# (e.g. an upload) while the recording goes on.
+#
+# {"source": 0, "index": 3, "location": "out_00003.mp4", "start_ns": 180000000000, "duration_ns": 60000000000, "bytes": 7340032, "closed": 1700000000.0}
+
+import os
+import os.path
+import json
+import time
+import shlex
+import logging
+import threading
+import subprocess
+
+logger = logging.getLogger("redaction.segments")
+
+def segment_pattern(location):
+    """splitmuxsink location of the segments of an output"""
+    stem, extension = os.path.splitext(location)
+    return stem + "_%05d" + extension
+
+def default_manifest(location):
+    stem, _ = os.path.splitext(location)
+    return stem + ".segments.jsonl"
+
+class SegmentLog(object):
+    """Records the segments splitmuxsink closes and runs the segment command on each of them"""
+    def __init__(self, path, command=None):
+        self.path = path
+        # format string, {location}, {source}, {index}, {start_ns} and {duration_ns} are replaced
+        self.command = command
+        self.lock = threading.Lock()
+        self.manifest = open(path, "a")
+        # running time each sink opened its current segment at, and segments closed per source
+        self.opened = {}
+        self.counts = {}
+        self.processes = []
+
+    def fragment_opened(self, source_index, running_time):
+        with self.lock:
+            self.opened[source_index] = running_time
+
+    def fragment_closed(self, source_index, location, running_time):
+        """Called from the bus with the splitmuxsink-fragment-closed message of a source"""
+        with self.lock:
+            start = self.opened.pop(source_index, 0)
+            index = self.counts.get(source_index, 0)
+            self.counts[source_index] = index + 1
+            entry = {
+                "source": source_index,
+                "index": index,
+                "location": location,
+                "start_ns": start,
+                "duration_ns": running_time - start,
+                "bytes": os.path.getsize(location) if os.path.exists(location) else None,
+                "closed": time.time(),
+            }
+            # one line per segment, flushed so a reader tailing the manifest sees it at once
+            self.manifest.write(json.dumps(entry) + "\n")
+            self.manifest.flush()
+            os.fsync(self.manifest.fileno())
+        logger.info("segment %d of source %d closed: %s (%.1f s)", index, source_index, location, entry["duration_ns"] / 1e9)
+        if self.command is not None:
+            self.run_command(entry)
+        return entry
+
+    def run_command(self, entry):
+        self.reap()
+        argv = [arg.format(**entry) for arg in shlex.split(self.command)]
+        try:
+            self.processes.append((subprocess.Popen(argv), entry["location"]))
+        except OSError as e:
+            logger.warning("segment command for %s failed to start: %s", entry["location"], e)
+
+    def reap(self, wait=False):
+        """Forgets the finished segment commands, logging the failed ones"""
+        running = []
+        for process, location in self.processes:
+            code = process.wait() if wait else process.poll()
+            if code is None:
+                running.append((process, location))
+            elif code != 0:
+                logger.warning("segment command for %s exited with status %d", location, code)
+        self.processes = running
+
+    def close(self):
+        """Waits for the running segment commands and closes the manifest"""
+        self.reap(wait=True)
+        with self.lock:
+            self.manifest.close()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+# Soak test of the redaction app: runs the pipeline on synthetic videotestsrc sources for hours
+# and samples the process RSS, the Python heap (tracemalloc), the number of live Python objects
+# and the GstBuffer/GstBufferPool objects alive (leaks tracer, GStreamer >= 1.18) and queued at
+# a fixed interval. The samples are written as a JSON lines time series, and the run fails
+# when one of them grew past its threshold between the end of the warmup and the end of the run.
+#
+# python3 soak.py --hours 12 --sources 4 -o soak.jsonl --app_args "-c configs/pgie_config_fd_lpd.txt"
+# python3 soak.py --hours 1 --app_args "--detector stub"
+
+import os
+import gc
+import sys
+import json
+import time
+import shlex
+import argparse
+import tracemalloc
+import collections
+
+# must be set before GStreamer is initialised, the app module initialises nothing at import
+os.environ.setdefault("GST_TRACERS", 'leaks(filters="GstBuffer,GstBufferPool")')
+
+from pipeline_profiles import parse_args_with_profile
+
+# samples averaged at each end of the run when measuring growth, against sampling noise
+GROWTH_SAMPLES = 3
+# allocation sites reported at the end of the run
+TOP_ALLOCATIONS = 10
+
+def rss_bytes():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return None
+
+def import_gst():
+    """GStreamer and the app are imported on first use, so the growth checks run without them"""
+    import gi
+    gi.require_version("Gst", "1.0")
+    from gi.repository import Gst, GObject, GLib
+    return Gst, GObject, GLib
+
+def leaks_tracer():
+    Gst, GObject, GLib = import_gst()
+    # listing the active tracers appeared in GStreamer 1.18
+    if not hasattr(Gst, "tracing_get_active_tracers"):
+        return None
+    for tracer in Gst.tracing_get_active_tracers():
+        if tracer.__gtype__.name == "GstLeaksTracer":
+            return tracer
+    return None
+
+def live_gst_objects(tracer):
+    """{"Buffer": n, "BufferPool": n} alive according to the leaks tracer, None when it can not tell"""
+    if tracer is None:
+        return None
+    live = tracer.emit("get-live-objects")
+    counts = collections.Counter()
+    objects = live.get_value("live-objects-list") or []
+    for entry in objects:
+        counts[type(entry.get_value("object")).__name__] += 1
+    return dict(counts)
+
+class SoakSampler(object):
+    """Samples the memory of the process and of the pipeline from the main loop"""
+    def __init__(self, app, output_path, interval):
+        self.app = app
+        self.output = open(output_path, "w") if output_path is not None else None
+        self.samples = []
+        self.tracer = leaks_tracer()
+        if self.tracer is None:
+            print("GStreamer leaks tracer not active, GstBuffer and GstBufferPool objects are not counted")
+        self.start = time.time()
+        Gst, GObject, GLib = import_gst()
+        self.timeout_id = GLib.timeout_add(int(interval * 1000), self.sample)
+
+    def sample(self):
+        current, peak = tracemalloc.get_traced_memory()
+        queued = 0
+        for element in self.app.stage_elements:
+            if element.get_factory() is not None and element.get_factory().get_name() == "queue":
+                queued += element.get_property("current-level-buffers")
+        record = {
+            "uptime_s": time.time() - self.start,
+            "frames": sum(self.app.source_frame_numbers),
+            "rss_bytes": rss_bytes(),
+            "python_traced_bytes": current,
+            "python_peak_bytes": peak,
+            "python_objects": len(gc.get_objects()),
+            "gst_live_objects": live_gst_objects(self.tracer),
+            "queued_buffers": queued,
+        }
+        self.samples.append(record)
+        if self.output is not None:
+            self.output.write(json.dumps(record) + "\n")
+            self.output.flush()
+        return True
+
+    def stop(self):
+        Gst, GObject, GLib = import_gst()
+        GLib.source_remove(self.timeout_id)
+        self.sample()
+        if self.output is not None:
+            self.output.close()
+
+def metric(sample, name):
+    if name.startswith("gst_"):
+        objects = sample["gst_live_objects"]
+        return None if objects is None else objects.get(name[len("gst_"):], 0)
+    return sample[name]
+
+def growth(samples, name):
+    """Mean of the last samples minus mean of the first ones, None when the metric is missing"""
+    values = [metric(sample, name) for sample in samples]
+    if len(values) < 2 or None in values:
+        return None
+    count = min(GROWTH_SAMPLES, len(values) // 2)
+    return sum(values[-count:]) / float(count) - sum(values[:count]) / float(count)
+
+def check(samples, args):
+    """Prints the growth of each metric, returns the list of the ones over their threshold"""
+    failures = []
+    limits = [
+        ("rss_bytes", args.max_rss_growth_mb * 1024 * 1024, "MB", 1024 * 1024),
+        ("python_traced_bytes", args.max_python_growth_mb * 1024 * 1024, "MB", 1024 * 1024),
+        ("python_objects", args.max_object_growth, "", 1),
+        ("gst_Buffer", args.max_buffer_growth, "", 1),
+        ("gst_BufferPool", args.max_pool_growth, "", 1),
+    ]
+    for name, limit, unit, scale in limits:
+        value = growth(samples, name)
+        if value is None:
+            print("%-20s not measured" % name)
+            continue
+        over = value > limit
+        print("%-20s %+.1f%s (limit %.1f%s)%s" % (name, value / scale, unit, limit / scale, unit, "  FAILED" if over else ""))
+        if over:
+            failures.append(name)
+    return failures
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="soak test of the redaction pipeline on synthetic sources")
+    parser.add_argument('--hours', type=float, default=8, help='(optional) duration of the run')
+    parser.add_argument('--warmup_minutes', type=float, default=10, help='(optional) minutes before the baseline, while caches and pools fill up')
+    parser.add_argument('--sample_interval', type=float, default=60, help='(optional) seconds between two samples')
+    parser.add_argument('--sources', type=int, default=1, help='(optional) number of videotestsrc inputs, when --app_args gives none')
+    parser.add_argument('-o', '--output', default="soak.jsonl", help='(optional) JSON lines time series of the samples')
+    parser.add_argument('--app_args', default="", help='(optional) other deepstream_redaction_app.py options, e.g. "-c <pgie config>" or "--detector stub"')
+    parser.add_argument('--max_rss_growth_mb', type=float, default=64, help='(optional) allowed RSS growth after the warmup')
+    parser.add_argument('--max_python_growth_mb', type=float, default=16, help='(optional) allowed growth of the memory traced by tracemalloc')
+    parser.add_argument('--max_object_growth', type=int, default=50000, help='(optional) allowed growth of the number of Python objects')
+    parser.add_argument('--max_buffer_growth', type=int, default=64, help='(optional) allowed growth of the live GstBuffers')
+    parser.add_argument('--max_pool_growth', type=int, default=0, help='(optional) allowed growth of the live GstBufferPools')
+    return parser
+
+def main(args):
+    Gst, GObject, GLib = import_gst()
+    import deepstream_redaction_app
+    from deepstream_redaction_app import Redaction_Main, TEST_SOURCE
+    app_argv = shlex.split(args.app_args)
+    if not any(arg in ("-i", "--input_mp4", "--input_list") for arg in app_argv):
+        # endless synthetic sources
+        app_argv += ["-i"] + [TEST_SOURCE] * args.sources
+    if not any(arg in ("-o", "--output_mp4", "--fakesink") for arg in app_argv):
+        app_argv += ["--fakesink"]
+    app_args = parse_args_with_profile(deepstream_redaction_app.build_arg_parser(), app_argv)
+    tracemalloc.start()
+    app = Redaction_Main(app_args, run=False)
+    if not app.built:
+        return 1
+    sampler = SoakSampler(app, args.output, args.sample_interval)
+    baseline = {}
+
+    def end_warmup():
+        baseline["index"] = len(sampler.samples)
+        baseline["snapshot"] = tracemalloc.take_snapshot()
+        print("Warmup done, measuring growth from here")
+        return False
+
+    def end_run():
+        print("Soak duration reached, stopping")
+        app.pipeline.send_event(Gst.Event.new_eos())
+        return False
+
+    GLib.timeout_add(int(args.warmup_minutes * 60 * 1000), end_warmup)
+    GLib.timeout_add(int(args.hours * 3600 * 1000), end_run)
+    app.run()
+    sampler.stop()
+    if app.error is not None:
+        print("Pipeline failed:", app.error)
+        return 1
+    samples = sampler.samples[baseline.get("index", 0):]
+    print("%d samples over %.1f hours, %d frames" % (len(samples), sampler.samples[-1]["uptime_s"] / 3600.0, sampler.samples[-1]["frames"]))
+    if "snapshot" in baseline:
+        print("Largest Python allocation growth since the warmup:")
+        for stat in tracemalloc.take_snapshot().compare_to(baseline["snapshot"], "lineno")[:TOP_ALLOCATIONS]:
+            print("  ", stat)
+    failures = check(samples, args)
+    if failures:
+        print("Soak test failed:", ", ".join(failures))
+        return 1
+    print("Soak test passed")
+    return 0
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    Gst, GObject, GLib = import_gst()
+    GObject.threads_init()
+    Gst.init(None)
+    sys.exit(main(args))
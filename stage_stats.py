@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+
+# Per-stage latency and throughput instrumentation for the redaction pipeline.
+# Buffer probes on the sink and src pads of each instrumented element record when a
+# buffer enters and leaves the element. Buffers are matched by source and PTS, since the
+# sources batched together usually share their PTS; a batched buffer leaves for the frames
+# of every source at its PTS, and counts as that many frames for the fps. Latency
+# percentiles, fps and queue fill levels are exported periodically as JSON or Prometheus text.
+
+import os
+import json
+import time
+import logging
+import threading
+import collections
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+
+from stage_timing import StageTimer, pop_entered, LATENCY_BUCKETS_MS, MAX_PENDING
+
+STATS_FORMATS = ["json", "prometheus"]
+
+def pad_source(pad):
+    """Source index of a request pad of a batching element (sink_<index> of nvstreammux), else None"""
+    name = pad.get_name()
+    if name.startswith("sink_") and name[len("sink_"):].isdigit():
+        return int(name[len("sink_"):])
+    return None
+
+class StageStats(object):
+    """Attaches buffer probes to the given elements and aggregates their timings. sources maps the
+    elements of a single source to its index, the others are batched or take the source from their pads."""
+    def __init__(self, elements, entry_elements=(), dropped_frames=None, motion_gates=None, sources=None):
+        self.lock = threading.Lock()
+        self.sources = sources or {}
+        # frames dropped per leaky queue, counted by the owner of the queues
+        self.dropped_frames = dropped_frames if dropped_frames is not None else {}
+        # per-source motion gates, for the share of frames that skipped the detector
+        self.motion_gates = motion_gates or []
+        self.stages = collections.OrderedDict()
+        self.queues = [e for e in elements if e.get_factory() is not None and e.get_factory().get_name() == "queue"]
+        # {pts: {source: time}} a frame was first seen entering the pipeline, for the end-to-end latency of sinks
+        self.entry_times = collections.OrderedDict()
+        # probe times and intervals are monotonic, only the snapshot timestamp is wall clock
+        self.last_sample = time.monotonic()
+        self.start = self.last_sample
+        self.probes = []
+        for element in elements:
+            self.instrument(element, element in entry_elements)
+
+    def instrument(self, element, is_entry):
+        stage = StageTimer(element.get_name())
+        self.stages[stage.name] = stage
+        source = self.sources.get(element)
+        srcpads = list(element.srcpads)
+        for pad in element.sinkpads:
+            if srcpads:
+                probe = self.on_sink_buffer_entry if is_entry else self.on_sink_buffer
+            else:
+                # sinks: measure from the moment the frame entered the pipeline
+                probe = self.on_sink_buffer_final
+            pad_source_index = source if source is not None else pad_source(pad)
+            self.probes.append((pad, pad.add_probe(Gst.PadProbeType.BUFFER, probe, (stage, pad_source_index))))
+        if srcpads:
+            for pad in srcpads:
+                self.probes.append((pad, pad.add_probe(Gst.PadProbeType.BUFFER, self.on_src_buffer, (stage, source))))
+
+    def remove(self):
+        for pad, probe_id in self.probes:
+            pad.remove_probe(probe_id)
+        self.probes = []
+
+    def on_sink_buffer_entry(self, pad, info, data):
+        stage, source = data
+        buffer = info.get_buffer()
+        now = time.monotonic()
+        with self.lock:
+            self.entry_times.setdefault(buffer.pts, {}).setdefault(source, now)
+            if len(self.entry_times) > MAX_PENDING:
+                self.entry_times.popitem(last=False)
+            stage.enter(source, buffer.pts, now)
+        return Gst.PadProbeReturn.OK
+
+    def on_sink_buffer(self, pad, info, data):
+        stage, source = data
+        buffer = info.get_buffer()
+        now = time.monotonic()
+        with self.lock:
+            stage.enter(source, buffer.pts, now)
+        return Gst.PadProbeReturn.OK
+
+    def on_src_buffer(self, pad, info, data):
+        stage, source = data
+        buffer = info.get_buffer()
+        now = time.monotonic()
+        with self.lock:
+            stage.leave(source, buffer.pts, now)
+        return Gst.PadProbeReturn.OK
+
+    def on_sink_buffer_final(self, pad, info, data):
+        stage, source = data
+        buffer = info.get_buffer()
+        now = time.monotonic()
+        with self.lock:
+            stage.leave(source, buffer.pts, now, pop_entered(self.entry_times, source, buffer.pts))
+        return Gst.PadProbeReturn.OK
+
+    def snapshot(self):
+        """Returns the current stats as a dict, and restarts the fps interval"""
+        now = time.monotonic()
+        with self.lock:
+            elapsed = max(now - self.last_sample, 1e-6)
+            stages = collections.OrderedDict()
+            for name, stage in self.stages.items():
+                p50, p95, p99 = stage.percentiles()
+                stages[name] = {
+                    "count": stage.count,
+                    "frames": stage.frames,
+                    "fps": stage.interval_frames / elapsed,
+                    "latency_ms": {"p50": p50, "p95": p95, "p99": p99,
+                        "mean": sum(stage.window) / len(stage.window) if stage.window else None},
+                    "buckets": list(stage.buckets),
+                    "latency_sum_ms": stage.latency_sum,
+                }
+                stage.interval_frames = 0
+            self.last_sample = now
+        queues = collections.OrderedDict()
+        for queue in self.queues:
+            queues[queue.get_name()] = {
+                "level_buffers": queue.get_property("current-level-buffers"),
+                "level_time_ms": queue.get_property("current-level-time") / 1e6,
+                "max_buffers": queue.get_property("max-size-buffers"),
+                "dropped": self.dropped_frames.get(queue.get_name(), 0),
+            }
+        motion = collections.OrderedDict()
+        for index, gate in enumerate(self.motion_gates):
+            motion[str(index)] = {"frames": gate.frames, "skipped": gate.skipped, "skip_ratio": gate.skip_ratio()}
+        return {"timestamp": time.time(), "uptime_s": now - self.start, "stages": stages, "queues": queues, "motion": motion}
+
+def format_prometheus(snapshot):
+    """Renders a snapshot in the Prometheus text exposition format"""
+    lines = [
+        "# TYPE redaction_stage_latency_ms histogram",
+    ]
+    for name, stage in snapshot["stages"].items():
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS + ["+Inf"], stage["buckets"]):
+            cumulative += count
+            lines.append('redaction_stage_latency_ms_bucket{stage="%s",le="%s"} %d' % (name, bound, cumulative))
+        lines.append('redaction_stage_latency_ms_sum{stage="%s"} %f' % (name, stage["latency_sum_ms"]))
+        lines.append('redaction_stage_latency_ms_count{stage="%s"} %d' % (name, cumulative))
+    lines.append("# TYPE redaction_stage_latency_quantile_ms gauge")
+    for name, stage in snapshot["stages"].items():
+        for quantile in ("p50", "p95", "p99"):
+            value = stage["latency_ms"][quantile]
+            if value is not None:
+                lines.append('redaction_stage_latency_quantile_ms{stage="%s",quantile="%s"} %f' % (name, quantile, value))
+    lines.append("# TYPE redaction_stage_fps gauge")
+    for name, stage in snapshot["stages"].items():
+        lines.append('redaction_stage_fps{stage="%s"} %f' % (name, stage["fps"]))
+    lines.append("# TYPE redaction_stage_buffers_total counter")
+    for name, stage in snapshot["stages"].items():
+        lines.append('redaction_stage_buffers_total{stage="%s"} %d' % (name, stage["count"]))
+    lines.append("# TYPE redaction_stage_frames_total counter")
+    for name, stage in snapshot["stages"].items():
+        lines.append('redaction_stage_frames_total{stage="%s"} %d' % (name, stage["frames"]))
+    lines.append("# TYPE redaction_queue_level_buffers gauge")
+    for name, queue in snapshot["queues"].items():
+        lines.append('redaction_queue_level_buffers{queue="%s"} %d' % (name, queue["level_buffers"]))
+    lines.append("# TYPE redaction_queue_dropped_frames_total counter")
+    for name, queue in snapshot["queues"].items():
+        lines.append('redaction_queue_dropped_frames_total{queue="%s"} %d' % (name, queue["dropped"]))
+    if snapshot["motion"]:
+        lines.append("# TYPE redaction_motion_frames_total counter")
+        for source, motion in snapshot["motion"].items():
+            lines.append('redaction_motion_frames_total{source="%s"} %d' % (source, motion["frames"]))
+        lines.append("# TYPE redaction_motion_skipped_frames_total counter")
+        for source, motion in snapshot["motion"].items():
+            lines.append('redaction_motion_skipped_frames_total{source="%s"} %d' % (source, motion["skipped"]))
+    return "\n".join(lines) + "\n"
+
+def write_snapshot(snapshot, path, stats_format):
+    """Replaces path atomically so scrapers never read a partial file"""
+    if stats_format == "prometheus":
+        text = format_prometheus(snapshot)
+    else:
+        text = json.dumps(snapshot, indent=2)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as stats_file:
+        stats_file.write(text)
+    os.replace(tmp_path, path)
+
+def print_summary(snapshot):
+    print("%-28s %8s %10s %10s %10s" % ("stage", "buffers", "p50 ms", "p95 ms", "p99 ms"))
+    for name, stage in snapshot["stages"].items():
+        latency = stage["latency_ms"]
+        print("%-28s %8d %10s %10s %10s" % (name, stage["count"],
+            *["-" if latency[q] is None else "%.2f" % latency[q] for q in ("p50", "p95", "p99")]))
+
+class StatsExporter(object):
+    """Writes StageStats snapshots every interval seconds from the GLib main loop"""
+    def __init__(self, stats, path, stats_format="json", interval=5, listeners=()):
+        self.stats = stats
+        self.path = path
+        self.stats_format = stats_format
+        # called with every snapshot, from the main loop
+        self.listeners = list(listeners)
+        self.timeout_id = GLib.timeout_add(int(interval * 1000), self.export)
+
+    def export(self):
+        snapshot = self.stats.snapshot()
+        if self.path is not None:
+            write_snapshot(snapshot, self.path, self.stats_format)
+        else:
+            logging.getLogger("redaction.stats").info("%s", json.dumps(snapshot["stages"]))
+        for listener in self.listeners:
+            listener(snapshot)
+        return True
+
+    def stop(self):
+        """Stops the timer, writes and returns the final snapshot"""
+        if self.timeout_id is not None:
+            GLib.source_remove(self.timeout_id)
+            self.timeout_id = None
+        snapshot = self.stats.snapshot()
+        if self.path is not None:
+            write_snapshot(snapshot, self.path, self.stats_format)
+        return snapshot
+
+class RateLimitedLog(object):
+    """Drops log records of a logger that come faster than one per interval seconds"""
+    def __init__(self, logger, interval=1.0):
+        self.logger = logger
+        self.interval = interval
+        self.last = None
+        self.suppressed = 0
+
+    def log(self, level, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        if self.last is not None and now - self.last < self.interval:
+            self.suppressed += 1
+            return
+        if self.suppressed:
+            msg = msg + " (%d similar messages suppressed)" % self.suppressed
+        self.logger.log(level, msg, *args)
+        self.last = now
+        self.suppressed = 0
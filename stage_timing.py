@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Latency and throughput bookkeeping of one pipeline stage, fed by the buffer probes of
+# stage_stats.StageStats with the times buffers enter and leave the element.
+
+import collections
+
+# upper bounds (ms) of the cumulative latency histogram buckets
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+# latencies kept per stage for the percentiles
+LATENCY_WINDOW = 4096
+# buffers in flight tracked per stage before the oldest ones are forgotten
+MAX_PENDING = 1024
+
+class StageTimer(object):
+    """Latency and throughput of one element"""
+    def __init__(self, name):
+        self.name = name
+        self.pending = collections.OrderedDict()
+        self.window = collections.deque(maxlen=LATENCY_WINDOW)
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum = 0.0
+        self.count = 0
+        # frames, a batched buffer carries one per source at its PTS
+        self.frames = 0
+        self.interval_frames = 0
+
+    def enter(self, source, pts, now):
+        self.pending.setdefault(pts, {})[source] = now
+        if len(self.pending) > MAX_PENDING:
+            self.pending.popitem(last=False)
+
+    def leave(self, source, pts, now, entered=None):
+        """Counts a buffer leaving, with the latency of each frame it carries. entered overrides
+        the entry times recorded by this stage"""
+        if entered is None:
+            entered = pop_entered(self.pending, source, pts)
+        self.count += 1
+        # an unmatched buffer still carries a frame
+        frames = max(1, len(entered))
+        self.frames += frames
+        self.interval_frames += frames
+        for entry_time in entered:
+            latency = (now - entry_time) * 1000.0
+            self.window.append(latency)
+            self.latency_sum += latency
+            for index, bound in enumerate(LATENCY_BUCKETS_MS):
+                if latency <= bound:
+                    self.buckets[index] += 1
+                    break
+            else:
+                self.buckets[-1] += 1
+
+    def percentiles(self):
+        latencies = sorted(self.window)
+        if not latencies:
+            return None, None, None
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+        return percentile(0.50), percentile(0.95), percentile(0.99)
+
+def pop_entered(entries, source, pts):
+    """Removes and returns the entry times of the frame of source at pts from {pts: {source: time}},
+    those of all the sources at pts for a batched buffer (source None)"""
+    sources = entries.get(pts)
+    if sources is None:
+        return []
+    if source is None:
+        del entries[pts]
+        return list(sources.values())
+    entered = sources.pop(source, None)
+    if not sources:
+        del entries[pts]
+    return [entered] if entered is not None else []
@@ -0,0 +1,31 @@
+import os
+
+from app_helpers import read_input_manifest, output_location_for_source, kitti_dir_for_source, \
+    is_live_uri, parse_resolution
+
+def test_read_input_manifest_skips_comments_and_blank_lines(tmp_path):
+    manifest = tmp_path / "inputs.txt"
+    manifest.write_text(u"# cameras\nfront.mp4\n\n  rtsp://10.0.0.12/stream  \n#back.mp4\nvideotestsrc:300\n")
+    assert read_input_manifest(str(manifest)) == ["front.mp4", "rtsp://10.0.0.12/stream", "videotestsrc:300"]
+
+def test_output_location_for_source():
+    assert output_location_for_source("out.mp4", 0, 1) == "out.mp4"
+    assert output_location_for_source("out/redacted.mp4", 2, 3) == "out/redacted_2.mp4"
+    assert output_location_for_source(None, 1, 3) is None
+
+def test_kitti_dir_for_source(tmp_path):
+    assert kitti_dir_for_source(str(tmp_path), 0, 1) == str(tmp_path)
+    assert kitti_dir_for_source(None, 0, 2) is None
+    kitti_dir = kitti_dir_for_source(str(tmp_path), 1, 2)
+    assert kitti_dir == os.path.join(str(tmp_path), "source_1")
+    assert os.path.isdir(kitti_dir)
+
+def test_is_live_uri():
+    assert is_live_uri("rtsp://10.0.0.12/stream")
+    assert is_live_uri("SRT://relay:9000")
+    assert not is_live_uri("file:///videos/a.mp4")
+    assert not is_live_uri("videos/a.mp4")
+
+def test_parse_resolution():
+    assert parse_resolution("1280x720") == (1280, 720)
+    assert parse_resolution("640X480") == (640, 480)
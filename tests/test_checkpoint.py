@@ -0,0 +1,80 @@
+import json
+
+from checkpoint import Checkpoint
+
+FRAME_NS = 40000000
+
+def create_input(tmp_path, content=b"video"):
+    location = tmp_path / "input.mp4"
+    location.write_bytes(content)
+    return str(location)
+
+def write_state(checkpoint, segments, pts, frame):
+    checkpoint.segments = segments
+    checkpoint.pts = pts
+    checkpoint.frame = frame
+    checkpoint.save()
+
+def test_open_resumes_a_checkpoint_of_the_same_input_and_output(tmp_path):
+    location = create_input(tmp_path)
+    path = str(tmp_path / "job.checkpoint")
+    fragment = tmp_path / "out.part00000.mp4"
+    fragment.write_bytes(b"fragment")
+    assert not Checkpoint.open(path, location, "out.mp4").resuming()
+    write_state(Checkpoint(path, location, "out.mp4"), [str(fragment)], 5 * 10 ** 9, 125)
+    checkpoint = Checkpoint.open(path, location, "out.mp4")
+    assert checkpoint.resuming()
+    assert (checkpoint.pts, checkpoint.start_pts, checkpoint.frame) == (5 * 10 ** 9, 5 * 10 ** 9, 125)
+    assert checkpoint.segments == [str(fragment)]
+
+def test_open_starts_over_for_another_input_or_output(tmp_path):
+    location = create_input(tmp_path)
+    path = str(tmp_path / "job.checkpoint")
+    fragment = tmp_path / "out.part00000.mp4"
+    fragment.write_bytes(b"fragment")
+    write_state(Checkpoint(path, location, "out.mp4"), [str(fragment)], 5 * 10 ** 9, 125)
+    assert not Checkpoint.open(path, location, "other.mp4").resuming()
+    create_input(tmp_path, b"another video")
+    checkpoint = Checkpoint.open(path, location, "out.mp4")
+    assert not checkpoint.resuming() and checkpoint.segments == []
+
+def test_open_starts_over_when_fragments_are_missing(tmp_path):
+    location = create_input(tmp_path)
+    path = str(tmp_path / "job.checkpoint")
+    fragment = tmp_path / "out.part00000.mp4"
+    fragment.write_bytes(b"fragment")
+    write_state(Checkpoint(path, location, "out.mp4"), [str(fragment), str(tmp_path / "out.part00001.mp4")], 10 ** 10, 250)
+    checkpoint = Checkpoint.open(path, location, "out.mp4")
+    assert not checkpoint.resuming() and checkpoint.segments == []
+
+def test_fragment_boundaries_start_at_the_first_pts_of_a_fresh_run(tmp_path):
+    location = create_input(tmp_path)
+    path = str(tmp_path / "job.checkpoint")
+    checkpoint = Checkpoint.open(path, location, "out.mp4")
+    # a stream whose timestamps start at 10 s
+    first_pts = 10 * 10 ** 9
+    for frame in range(60):
+        checkpoint.frame_seen(first_pts + frame * FRAME_NS, frame)
+    checkpoint.fragment_closed("out.part00000.mp4", 10 ** 9)
+    assert (checkpoint.pts, checkpoint.frame) == (first_pts + 10 ** 9, 25)
+    checkpoint.fragment_closed("out.part00001.mp4", 2 * 10 ** 9)
+    assert (checkpoint.pts, checkpoint.frame) == (first_pts + 2 * 10 ** 9, 50)
+    with open(path) as checkpoint_file:
+        state = json.load(checkpoint_file)
+    assert state["segments"] == ["out.part00000.mp4", "out.part00001.mp4"]
+    assert (state["pts"], state["frame"]) == (first_pts + 2 * 10 ** 9, 50)
+
+def test_fragment_boundaries_of_a_resumed_run_start_at_the_checkpoint(tmp_path):
+    location = create_input(tmp_path)
+    path = str(tmp_path / "job.checkpoint")
+    fragment = tmp_path / "out.part00000.mp4"
+    fragment.write_bytes(b"fragment")
+    write_state(Checkpoint(path, location, "out.mp4"), [str(fragment)], 10 ** 9, 25)
+    checkpoint = Checkpoint.open(path, location, "out.mp4")
+    for frame in range(25, 60):
+        checkpoint.frame_seen(frame * FRAME_NS, frame)
+    checkpoint.fragment_closed("out.part00001.mp4", 10 ** 9)
+    assert (checkpoint.pts, checkpoint.frame) == (2 * 10 ** 9, 50)
+    # every frame is in a fragment: the next one starts after the last frame seen
+    checkpoint.fragment_closed("out.part00002.mp4", 2 * 10 ** 9)
+    assert checkpoint.frame == 60
@@ -0,0 +1,42 @@
+import os
+
+from detections import Detection
+from detection_writer import DetectionWriter
+from detection_reader import DetectionStore
+from chunked_processing import ChunkJob, merge_detections
+
+FACE = Detection(0, 10.0, 20.0, 30.0, 40.0, 0.9, -1)
+
+def write_chunk(job_dir, frames, first_pts):
+    """The JSONL export of a chunk worker, with timestamps starting at first_pts"""
+    detections_dir = os.path.join(job_dir, "detections")
+    os.makedirs(detections_dir)
+    writer = DetectionWriter(detections_dir, [detections_dir], ["face"], "jsonl", flush_interval=0.01,
+        sources=[{"input": "chunk.mp4", "fingerprint": None, "width": 640, "height": 360}])
+    for frame in range(frames):
+        writer.put(0, frame, first_pts + 40 * frame, [FACE._replace(left=float(frame))] if frame % 2 == 0 else [], block=True)
+    assert writer.close() is None
+
+def test_merge_renumbers_frames_and_shifts_pts(tmp_path):
+    jobs = []
+    for chunk_index, (frames, start_pts) in enumerate([(3, 0), (4, 1000)]):
+        job_dir = str(tmp_path / ("job_%05d" % chunk_index))
+        # the second chunk is timestamped from 5 after the split, not from 0
+        write_chunk(job_dir, frames, 5 * chunk_index)
+        job = ChunkJob(0, chunk_index, "chunk.mp4", start_pts, job_dir, None)
+        job.frames = frames
+        jobs.append(job)
+    output_dir = str(tmp_path / "merged")
+    os.makedirs(output_dir)
+    writer = DetectionWriter(output_dir, [output_dir], ["face"], "jsonl", flush_interval=0.01,
+        sources=[{"input": "input.mp4", "fingerprint": None}])
+    merge_detections(jobs, writer, 0, ["face"])
+    assert writer.close() is None
+
+    merged = DetectionStore(output_dir, ["face"]).source(0)
+    assert sorted(merged.frames) == list(range(7))
+    assert sorted(merged.pts_frames.items()) == [(0, 0), (40, 1), (80, 2), (1000, 3), (1040, 4), (1080, 5), (1120, 6)]
+    # detections on the even frames of each chunk, at the left the chunk gave them
+    assert [len(merged.frames[frame]) for frame in range(7)] == [1, 0, 1, 1, 0, 1, 0]
+    assert merged.frames[5][0].left == 2.0
+    assert (merged.width, merged.height) == (640, 360)
@@ -0,0 +1,94 @@
+import threading
+
+import numpy as np
+import pytest
+
+from cpu_detectors import StubDetector, DETECTNET_BBOX_NORM, decode_detectnet_grid, cluster_confidence, parse_detectnet_output
+
+def test_stub_detector_boxes_drift_inside_the_frame():
+    detector = StubDetector(objects_per_frame=5)
+    frames = [np.zeros((720, 1280, 4), dtype=np.uint8)] * 3
+    results = detector.detect_batch(frames)
+    assert [len(detections) for detections in results] == [5, 5, 5]
+    assert [d.class_id for d in results[0]] == [0, 1, 0, 1, 0]
+    assert results[1][0].left == results[0][0].left + 1
+    for detections in results:
+        for d in detections:
+            assert 0 <= d.left and d.left + d.width <= 1280
+            assert 0 <= d.top and d.top + d.height <= 720
+
+def test_stub_detector_batches_on_several_threads_take_distinct_frames():
+    detector = StubDetector(objects_per_frame=1)
+    frames = [np.zeros((720, 1280, 4), dtype=np.uint8)] * 2
+    lefts = []
+    def worker():
+        for batch in range(50):
+            lefts.extend(detections[0].left for detections in detector.detect_batch(frames))
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert detector.frame_count == 800
+    # every frame number was handed out once, the drift wraps every 320 frames
+    assert sorted(lefts) == sorted(frame % 320 for frame in range(800))
+
+NET_WIDTH, NET_HEIGHT = 160, 96
+GRID_WIDTH, GRID_HEIGHT = 10, 6
+STRIDE = 16
+
+def attrs(**overrides):
+    values = {"threshold": 0.2, "group-threshold": 1, "eps": 0.2, "detected-min-w": 0, "detected-min-h": 0,
+        "detected-max-w": 1 << 30, "detected-max-h": 1 << 30}
+    values.update(overrides)
+    return values
+
+def detectnet_outputs(cells, num_classes=2):
+    """output_cov and output_bbox grids with a proposal (x1, y1, x2, y2) of the given score in each cell"""
+    cov = np.zeros((num_classes, GRID_HEIGHT, GRID_WIDTH), dtype=np.float32)
+    bbox = np.zeros((4 * num_classes, GRID_HEIGHT, GRID_WIDTH), dtype=np.float32)
+    for class_id, row, column, score, (x1, y1, x2, y2) in cells:
+        # the inverse of the decode: offsets from the cell center, in units of DETECTNET_BBOX_NORM
+        center_x = (column * STRIDE + 0.5) / DETECTNET_BBOX_NORM
+        center_y = (row * STRIDE + 0.5) / DETECTNET_BBOX_NORM
+        cov[class_id, row, column] = score
+        bbox[class_id * 4:class_id * 4 + 4, row, column] = (center_x - x1 / DETECTNET_BBOX_NORM, center_y - y1 / DETECTNET_BBOX_NORM,
+            x2 / DETECTNET_BBOX_NORM - center_x, y2 / DETECTNET_BBOX_NORM - center_y)
+    return cov, bbox
+
+CELLS = [
+    (0, 1, 2, 0.9, (20, 10, 60, 50)),
+    (0, 1, 3, 0.5, (22, 12, 62, 52)),
+    # under the threshold
+    (0, 4, 8, 0.1, (120, 60, 150, 90)),
+    # partly outside the network input
+    (1, 0, 0, 0.8, (-5, -5, 10, 200)),
+    (1, 5, 9, 0.7, (140, 80, 143, 83)),
+]
+
+def test_grid_cells_decode_to_proposals_in_network_coordinates():
+    cov, bbox = detectnet_outputs(CELLS)
+    rects, scores = decode_detectnet_grid(cov, bbox, 0, NET_WIDTH, NET_HEIGHT, attrs())
+    assert np.allclose(rects, [[20, 10, 40, 40], [22, 12, 40, 40]], atol=1e-3)
+    assert scores.tolist() == pytest.approx([0.9, 0.5])
+    # clipped to the input, and the 3 pixel box is under the minimum width
+    rects, scores = decode_detectnet_grid(cov, bbox, 1, NET_WIDTH, NET_HEIGHT, attrs(**{"detected-min-w": 4}))
+    assert np.allclose(rects, [[0, 0, 10, NET_HEIGHT - 1]], atol=1e-3)
+    assert scores.tolist() == pytest.approx([0.8])
+
+def test_cluster_confidence_is_the_best_covered_proposal():
+    rects = np.array([[20, 10, 40, 40], [22, 12, 40, 40], [100, 80, 10, 10]], dtype=np.float32)
+    scores = np.array([0.5, 0.9, 0.99], dtype=np.float32)
+    assert cluster_confidence(rects, scores, 21, 11, 40, 40) == pytest.approx(0.9)
+    # a cluster covering none of the proposals falls back to the best score
+    assert cluster_confidence(rects, scores, 300, 300, 10, 10) == pytest.approx(0.99)
+
+def test_parse_groups_the_proposals_of_an_object():
+    pytest.importorskip("cv2")
+    cov, bbox = detectnet_outputs(CELLS)
+    objects = parse_detectnet_output(cov, bbox, NET_WIDTH, NET_HEIGHT, [attrs(), attrs(**{"group-threshold": 0})])
+    faces = [o for o in objects if o[0] == 0]
+    assert len(faces) == 1
+    class_id, x1, y1, x2, y2, confidence = faces[0]
+    assert (x1, y1, x2, y2) == pytest.approx((21, 11, 61, 51), abs=1)
+    assert confidence == pytest.approx(0.9)
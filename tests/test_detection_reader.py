@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+
+from detections import Detection
+from detection_writer import DetectionWriter
+from detection_reader import DetectionStore
+from nvds_batch_walker import OBJECT_DTYPE
+
+CLASSES = ["face", "plate"]
+# values a float32 column stores exactly
+FACE = Detection(0, 10.5, 20.25, 30.0, 40.0, 0.75)
+PLATE = Detection(1, 100.0, 200.0, 64.0, 16.0, 0.5)
+
+def write(tmp_path, export_format, frames, num_sources=1):
+    output_dir = str(tmp_path)
+    kitti_dirs = [output_dir]
+    if num_sources > 1:
+        kitti_dirs = [os.path.join(output_dir, "source_%d" % i) for i in range(num_sources)]
+        for kitti_dir in kitti_dirs:
+            os.makedirs(kitti_dir)
+    writer = DetectionWriter(output_dir, kitti_dirs, CLASSES, export_format, flush_interval=0.01,
+        sources=[{"input": "%d.mp4" % i, "fingerprint": None, "width": 1280, "height": 720} for i in range(num_sources)])
+    for source_index, frame_number, pts, detections in frames:
+        writer.put(source_index, frame_number, pts, detections, block=True)
+    assert writer.close() is None
+    return DetectionStore(output_dir, CLASSES)
+
+def test_columnar_round_trip(tmp_path):
+    store = write(tmp_path, "columnar", [(0, 0, 0, [FACE, PLATE]), (0, 1, 40, []), (1, 0, 0, [PLATE]), (0, 2, 80, [FACE])],
+        num_sources=2)
+    first = store.source(0)
+    assert first.frames == {0: [FACE, PLATE], 1: [], 2: [FACE]}
+    assert first.pts_frames == {0: 0, 40: 1, 80: 2}
+    assert store.source(1).frames == {0: [PLATE]}
+    assert (first.width, first.height) == (1280, 720)
+
+def test_columnar_round_trip_of_walker_records(tmp_path):
+    rows = np.zeros(1, dtype=OBJECT_DTYPE)
+    rows[0] = (0, 3, PLATE.class_id, PLATE.left, PLATE.top, PLATE.width, PLATE.height, PLATE.confidence)
+    store = write(tmp_path, "columnar", [(0, 3, 120, rows)])
+    assert store.source(0).frames == {3: [PLATE]}
+
+def test_kitti_round_trip(tmp_path):
+    store = write(tmp_path, "kitti", [(0, 0, 0, [FACE, PLATE]), (0, 1, 40, []), (1, 5, 200, [PLATE])], num_sources=2)
+    # kitti keeps whole pixel corners and no confidence or timestamps
+    assert store.source(0).frames == {0: [Detection(0, 10.0, 20.0, 30.0, 40.0, 1.0), Detection(1, 100.0, 200.0, 64.0, 16.0, 1.0)],
+        1: []}
+    assert store.source(1).frames == {5: [Detection(1, 100.0, 200.0, 64.0, 16.0, 1.0)]}
+    assert not store.source(0).pts_frames
+
+def test_lookup_by_pts_scales_to_the_current_frame_size(tmp_path):
+    store = write(tmp_path, "columnar", [(0, 0, 0, []), (0, 1, 40, [FACE])])
+    store.match_inputs(["0.mp4"])
+    # the frame numbering moved, the pts did not
+    scaled = store.lookup(0, 7, 40, 640, 360)
+    assert scaled == [FACE._replace(left=5.25, top=10.125, width=15.0, height=20.0)]
+    assert store.lookup(0, 1, None, 1280, 720) == [FACE]
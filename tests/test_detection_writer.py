@@ -0,0 +1,62 @@
+import json
+import os
+
+from detections import Detection
+from detection_writer import DetectionWriter, truncate_export, JSONL_FILE, COLUMNAR_FILE, COLUMNAR_RECORD, SOURCES_FILE
+from detection_reader import DetectionStore
+
+FACE = Detection(0, 10.0, 20.0, 30.0, 40.0, 0.9)
+
+def test_jsonl_export(tmp_path):
+    writer = DetectionWriter(str(tmp_path), [str(tmp_path)], ["face"], "jsonl", flush_interval=0.01,
+        sources=[{"input": "a.mp4", "fingerprint": None}])
+    writer.put(0, 0, 0, [FACE])
+    writer.put(0, 1, 40, [])
+    assert writer.close() is None
+    with open(str(tmp_path / JSONL_FILE)) as jsonl_file:
+        frames = [json.loads(line) for line in jsonl_file]
+    assert [frame["frame"] for frame in frames] == [0, 1]
+    assert frames[0]["objects"] == [[0, 10.0, 20.0, 30.0, 40.0, 0.9, -1]]
+    assert os.path.exists(str(tmp_path / SOURCES_FILE))
+
+def test_failed_writes_are_reported_by_close(tmp_path):
+    missing = str(tmp_path / "missing")
+    writer = DetectionWriter(str(tmp_path), [missing], ["face"], "kitti", queue_size=2, flush_interval=0.01)
+    for frame in range(10):
+        writer.put(0, frame, 0, [FACE], block=True)
+    assert writer.close() is not None
+    assert writer.failed == 10
+    assert not writer.thread.is_alive()
+
+def write_frames(output_dir, export_format, frames, append=False):
+    writer = DetectionWriter(output_dir, [output_dir], ["face"], export_format, flush_interval=0.01, append=append)
+    for frame in frames:
+        # frame n has n faces
+        writer.put(0, frame, 40 * frame, [FACE] * frame, block=True)
+    assert writer.close() is None
+
+def test_truncated_jsonl_export_appends_from_the_checkpoint(tmp_path):
+    write_frames(str(tmp_path), "jsonl", range(5))
+    with open(str(tmp_path / JSONL_FILE), "a") as jsonl_file:
+        # the last record of the interrupted run, half written
+        jsonl_file.write('{"source": 0, "frame": 5, "pts"')
+    truncate_export(str(tmp_path), "jsonl", 3)
+    write_frames(str(tmp_path), "jsonl", range(3, 6), append=True)
+    frames = DetectionStore(str(tmp_path), ["face"]).source(0).frames
+    assert sorted(frames) == list(range(6))
+    assert [len(frames[frame]) for frame in range(6)] == list(range(6))
+
+def test_truncated_columnar_export_appends_from_the_checkpoint(tmp_path):
+    write_frames(str(tmp_path), "columnar", range(5))
+    truncate_export(str(tmp_path), "columnar", 3)
+    assert os.path.getsize(str(tmp_path / COLUMNAR_FILE)) == 3 * COLUMNAR_RECORD.size
+    write_frames(str(tmp_path), "columnar", range(3, 6), append=True)
+    frames = DetectionStore(str(tmp_path), ["face"]).source(0).frames
+    assert [len(frames[frame]) for frame in range(6)] == list(range(6))
+
+def test_truncate_past_the_end_keeps_the_export(tmp_path):
+    write_frames(str(tmp_path), "columnar", range(3))
+    truncate_export(str(tmp_path), "columnar", 10)
+    assert os.path.getsize(str(tmp_path / COLUMNAR_FILE)) == 3 * COLUMNAR_RECORD.size
+    # nothing exported yet
+    truncate_export(str(tmp_path / "missing"), "jsonl", 3)
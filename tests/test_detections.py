@@ -0,0 +1,5 @@
+from detections import Detection
+
+def test_track_id_defaults_to_untracked():
+    assert Detection(0, 1, 2, 3, 4, 0.5).track_id == -1
+    assert Detection(1, 1, 2, 3, 4, 0.5, 7).track_id == 7
@@ -0,0 +1,105 @@
+import itertools
+import os
+
+import pytest
+
+import engine_cache
+from engine_cache import EngineCache, read_config
+
+@pytest.fixture
+def config(tmp_path):
+    model_dir = tmp_path / "models"
+    model_dir.mkdir()
+    (model_dir / "resnet10.caffemodel").write_bytes(b"weights")
+    (model_dir / "resnet10.prototxt").write_text(u"input_dim: 1\ninput_dim: 3\ninput_dim: 270\ninput_dim: 480\n")
+    path = tmp_path / "pgie.txt"
+    path.write_text(u"[property]\nmodel-file=models/resnet10.caffemodel\nproto-file=models/resnet10.prototxt\n"
+        u"model-engine-file=models/resnet10.caffemodel_b1_fp32.engine\nbatch-size=1\nnetwork-mode=0\n")
+    return str(path)
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # distinct last_used times, the eviction order does not depend on the clock resolution
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(engine_cache.time, "time", lambda: float(next(ticks)))
+
+class FakeBuilder(object):
+    def __init__(self, tmp_path):
+        self.tmp_path = tmp_path
+        self.builds = []
+
+    def __call__(self, config_path, batch_size):
+        patched = read_config(config_path)["property"]
+        assert patched["batch-size"] == str(batch_size)
+        assert "model-engine-file" not in patched
+        self.builds.append((batch_size, patched["network-mode"]))
+        built = self.tmp_path / ("built_%d.engine" % len(self.builds))
+        built.write_bytes(b"engine")
+        return str(built)
+
+def make_cache(tmp_path, **kwargs):
+    return EngineCache(str(tmp_path / "engines"), platform_name="test-gpu", version="7.1.3", **kwargs)
+
+def test_hit_after_miss(tmp_path, config):
+    cache = make_cache(tmp_path)
+    builder = FakeBuilder(tmp_path)
+    first = cache.ensure(config, 2, builder)
+    second = cache.ensure(config, 2, builder)
+    assert first == second
+    assert builder.builds == [(2, "0")]
+    patched = read_config(first)["property"]
+    assert patched["batch-size"] == "2"
+    assert os.path.dirname(patched["model-engine-file"]) == cache.cache_dir
+    assert os.path.exists(patched["model-engine-file"])
+    # the model paths stay valid from the cache folder
+    assert os.path.exists(patched["model-file"])
+
+def test_key_follows_batch_size_precision_platform_and_model(tmp_path, config):
+    builder = FakeBuilder(tmp_path)
+    cache = make_cache(tmp_path)
+    cache.ensure(config, 1, builder)
+    cache.ensure(config, 4, builder)
+    cache.ensure(config, 1, builder, precision="fp16")
+    EngineCache(cache.cache_dir, platform_name="other-gpu", version="7.1.3").ensure(config, 1, builder)
+    EngineCache(cache.cache_dir, platform_name="test-gpu", version="8.0.1").ensure(config, 1, builder)
+    with open(os.path.join(os.path.dirname(config), "models", "resnet10.caffemodel"), "wb") as model_file:
+        model_file.write(b"retrained weights")
+    cache.ensure(config, 1, builder)
+    assert builder.builds == [(1, "0"), (4, "0"), (1, "2"), (1, "0"), (1, "0"), (1, "0")]
+    assert len(cache.read_index()) == 6
+
+def test_least_recently_used_engines_are_evicted(tmp_path, config):
+    builder = FakeBuilder(tmp_path)
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.ensure(config, 1, builder)
+    cache.ensure(config, 2, builder)
+    # batch size 1 is used again, so batch size 2 is the one evicted
+    cache.ensure(config, 1, builder)
+    cache.ensure(config, 3, builder)
+    index = cache.read_index()
+    assert sorted(entry["batch_size"] for entry in index.values()) == [1, 3]
+    engines = [name for name in os.listdir(cache.cache_dir) if name.endswith(".engine")]
+    assert len(engines) == 2
+    # the patched configs of the evicted engines go with them
+    assert sorted(name[:-len(".txt")] for name in os.listdir(cache.cache_dir) if name.endswith(".txt")) == sorted(index)
+    cache.ensure(config, 2, builder)
+    assert builder.builds == [(1, "0"), (2, "0"), (3, "0"), (2, "0")]
+
+def test_engine_removed_behind_the_index_is_rebuilt(tmp_path, config):
+    builder = FakeBuilder(tmp_path)
+    cache = make_cache(tmp_path)
+    patched = read_config(cache.ensure(config, 1, builder))["property"]
+    os.remove(patched["model-engine-file"])
+    rebuilt = read_config(cache.ensure(config, 1, builder))["property"]
+    assert os.path.exists(rebuilt["model-engine-file"])
+    assert builder.builds == [(1, "0"), (1, "0")]
+    assert len(cache.read_index()) == 1
+
+def test_failed_build_leaves_no_entry(tmp_path, config):
+    cache = make_cache(tmp_path)
+    def failing_builder(config_path, batch_size):
+        raise RuntimeError("out of memory")
+    with pytest.raises(RuntimeError):
+        cache.ensure(config, 1, failing_builder)
+    assert cache.read_index() == {}
+    assert [name for name in os.listdir(cache.cache_dir) if name.endswith(".txt")] == []
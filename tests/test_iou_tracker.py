@@ -0,0 +1,42 @@
+from detections import Detection
+from iou_tracker import IouTracker, iou, expand
+
+def face(left, top=100):
+    return Detection(0, left, top, 40, 40, 0.9)
+
+def test_tracks_survive_an_interval_longer_than_max_age():
+    interval = 8
+    tracker = IouTracker(max_age=5)
+    for frame in range(4 * (interval + 1)):
+        detected = frame % (interval + 1) == 0
+        boxes = tracker.update([face(100 + frame)] if detected else None, 1280, 720)
+        assert len(boxes) == 1, "no box on frame %d" % frame
+        assert boxes[0].track_id == 0
+
+def test_track_expires_after_max_age_missed_detections():
+    tracker = IouTracker(max_age=2)
+    tracker.update([face(100)])
+    for missed in range(2):
+        assert len(tracker.update([])) == 1
+    assert tracker.update([]) == []
+
+def test_skipped_frames_do_not_count_as_misses():
+    tracker = IouTracker(max_age=1)
+    tracker.update([face(100)])
+    for skipped in range(10):
+        assert len(tracker.update(None)) == 1
+    assert len(tracker.update([])) == 1
+    assert tracker.update([]) == []
+
+def test_coasting_box_moves_and_grows():
+    tracker = IouTracker(max_age=5, margin=0.0, coast_margin=0.1, smoothing=0.0)
+    tracker.update([face(100)])
+    tracker.update([face(110)])
+    coasted = tracker.update(None)[0]
+    assert coasted.left < 120 < coasted.left + coasted.width
+    assert coasted.width > 40
+
+def test_iou_and_expand():
+    assert iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert iou((0, 0, 10, 10), (20, 20, 10, 10)) == 0.0
+    assert expand((10, 10, 10, 10), 0.5, 15, 15) == (5.0, 5.0, 10.0, 10.0)
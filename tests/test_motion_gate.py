@@ -0,0 +1,57 @@
+import numpy as np
+
+from motion_gate import MotionGate, create_gates, luma
+
+def frame(value=0, moving=0):
+    """64x64 RGBA frame, with its first moving rows brightened"""
+    pixels = np.full((64, 64, 4), value, dtype=np.uint8)
+    pixels[:moving] = 255
+    return pixels
+
+def test_luma_subsamples():
+    plane = luma(frame(100), 8)
+    assert plane.shape == (8, 8)
+    assert plane.dtype == np.uint8
+    assert int(plane[0, 0]) == 100
+
+def test_static_frames_skip_the_detector():
+    gate = MotionGate(0.1, force_interval=30, step=8)
+    assert gate.should_detect(frame())
+    assert [gate.should_detect(frame()) for _ in range(4)] == [False] * 4
+    assert gate.skip_ratio() == 4 / 5.0
+
+def test_motion_over_the_threshold_runs_the_detector():
+    gate = MotionGate(0.2, step=8)
+    gate.should_detect(frame())
+    # one sampled row in eight changed is 12.5 %, three are 37.5 %
+    assert not gate.should_detect(frame(moving=8))
+    assert gate.should_detect(frame(moving=24))
+
+def test_changes_add_up_against_the_last_detected_frame():
+    gate = MotionGate(0.2, step=8)
+    gate.should_detect(frame())
+    assert not gate.should_detect(frame(moving=8))
+    assert gate.should_detect(frame(moving=16))
+    assert not gate.should_detect(frame(moving=16))
+
+def test_detection_is_forced_every_force_interval():
+    gate = MotionGate(0.5, force_interval=3, step=8)
+    assert [gate.should_detect(frame()) for _ in range(7)] == [True, False, False, True, False, False, True]
+
+def test_observe_reports_motion_since_the_last_inferred_frame():
+    gate = MotionGate(0.1, step=8)
+    assert gate.observe(frame(), True)
+    assert not gate.observe(frame(), False)
+    assert gate.observe(frame(moving=16), False)
+    # still measured against the inferred frame
+    assert gate.observe(frame(moving=16), False)
+    gate.observe(frame(moving=16), True)
+    assert not gate.observe(frame(moving=16), False)
+    assert gate.skip_ratio() == 4 / 6.0
+    gate.reset()
+    assert gate.skip_ratio() == 0.0
+
+def test_create_gates():
+    assert create_gates(None, 2, 30, 8) is None
+    gates = create_gates([0.01, 0.2], 3, 30, 8)
+    assert [gate.threshold for gate in gates] == [0.01, 0.2, 0.2]
@@ -0,0 +1,50 @@
+import re
+import ctypes
+
+import numpy as np
+import pytest
+
+from detection_writer import COLUMNAR_RECORD
+from nvds_batch_walker import WALKER_STRUCTS, OBJECT_DTYPE, FRAME_DTYPE
+
+C_TYPES = {
+    "int": ctypes.c_int,
+    "unsigned int": ctypes.c_uint,
+    "unsigned long long": ctypes.c_ulonglong,
+    "float": ctypes.c_float,
+}
+
+def c_structs():
+    """ctypes mirrors of the structs the compiled walker is built with"""
+    structs = {}
+    for body, name in re.findall(r"typedef struct \{(.*?)\} (\w+);", WALKER_STRUCTS, re.S):
+        fields = [(field, C_TYPES[c_type]) for c_type, field in re.findall(r"(\w[a-z ]*?) (\w+);", body)]
+        structs[name] = type(name, (ctypes.Structure,), {"_fields_": fields})
+    return structs
+
+def assert_same_layout(struct, dtype):
+    assert ctypes.sizeof(struct) == dtype.itemsize
+    assert [name for name, _ in struct._fields_] == list(dtype.names)
+    for name, c_type in struct._fields_:
+        assert getattr(struct, name).offset == dtype.fields[name][1], name
+        assert ctypes.sizeof(c_type) == dtype.fields[name][0].itemsize, name
+
+def test_walker_records_match_the_dtypes():
+    structs = c_structs()
+    assert_same_layout(structs["RedactionObject"], OBJECT_DTYPE)
+    assert_same_layout(structs["RedactionFrame"], FRAME_DTYPE)
+
+def test_walker_objects_are_columnar_records():
+    # the columnar export writes the walker arrays as they are
+    assert COLUMNAR_RECORD.size == OBJECT_DTYPE.itemsize
+    values = (1, 2, 3, 4.0, 5.0, 6.0, 7.0, 0.5)
+    assert COLUMNAR_RECORD.unpack(np.array([values], dtype=OBJECT_DTYPE).tobytes()) == values
+
+def test_cffi_layout_matches_the_dtypes():
+    cffi = pytest.importorskip("cffi")
+    ffi = cffi.FFI()
+    ffi.cdef(WALKER_STRUCTS)
+    for name, dtype in (("RedactionObject", OBJECT_DTYPE), ("RedactionFrame", FRAME_DTYPE)):
+        assert ffi.sizeof(name) == dtype.itemsize
+        for field in dtype.names:
+            assert ffi.offsetof(name, field) == dtype.fields[field][1], field
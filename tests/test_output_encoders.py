@@ -0,0 +1,78 @@
+import types
+
+import pytest
+
+import output_encoders
+from output_encoders import resolve_encoder, accepts, SYSTEM_MEMORY_I420, NVMM_I420
+
+SINK, SRC = "sink", "src"
+
+class FakeCaps(object):
+    """Caps that intersect when they share a format string, enough to tell the memory types apart"""
+    def __init__(self, *formats):
+        self.formats = set(formats)
+
+    def can_intersect(self, other):
+        return bool(self.formats & other.formats)
+
+class FakeTemplate(object):
+    def __init__(self, direction, *formats):
+        self.direction = direction
+        self.caps = FakeCaps(*formats)
+
+    def get_caps(self):
+        return self.caps
+
+class FakeFactory(object):
+    def __init__(self, *templates):
+        self.templates = templates
+
+    def get_static_pad_templates(self):
+        return self.templates
+
+def fake_gst(factories):
+    """The part of Gst output_encoders looks factories and caps up with"""
+    return types.SimpleNamespace(
+        ElementFactory=types.SimpleNamespace(find=factories.get),
+        Caps=types.SimpleNamespace(from_string=FakeCaps),
+        PadDirection=types.SimpleNamespace(SINK=SINK, SRC=SRC))
+
+@pytest.fixture
+def installed(monkeypatch):
+    """Installs the given element factories in place of the registry"""
+    def install(*names, **factories):
+        factories.update((name, FakeFactory()) for name in names)
+        monkeypatch.setattr(output_encoders, "import_gst", lambda: fake_gst(factories))
+    return install
+
+@pytest.mark.parametrize("names, allow_hardware, expected", [
+    (["nvv4l2h264enc", "omxh264enc", "x264enc", "openh264enc", "avenc_mpeg4"], True, "nvv4l2h264enc"),
+    (["omxh264enc", "x264enc"], True, "omxh264enc"),
+    (["x264enc", "openh264enc"], True, "x264enc"),
+    # the cpu path feeds system memory frames, the hardware encoders are skipped
+    (["nvv4l2h264enc", "omxh264enc", "openh264enc"], False, "openh264enc"),
+    (["nvv4l2h264enc", "omxh264enc"], False, "avenc_mpeg4"),
+    ([], True, "avenc_mpeg4"),
+])
+def test_auto_picks_the_first_installed_encoder(installed, names, allow_hardware, expected):
+    installed(*names)
+    assert resolve_encoder("auto", allow_hardware) == expected
+
+@pytest.mark.parametrize("name", ["x265enc", "nvv4l2h265enc", "avenc_mpeg4"])
+def test_explicit_encoders_are_kept_even_when_missing(installed, name):
+    # a missing encoder is reported when the output is built, not replaced by another one
+    installed()
+    assert resolve_encoder(name) == name
+    assert not accepts(name, SYSTEM_MEMORY_I420)
+
+@pytest.mark.parametrize("templates, caps, expected", [
+    ([FakeTemplate(SINK, SYSTEM_MEMORY_I420)], SYSTEM_MEMORY_I420, True),
+    ([FakeTemplate(SINK, SYSTEM_MEMORY_I420)], NVMM_I420, False),
+    ([FakeTemplate(SINK, SYSTEM_MEMORY_I420), FakeTemplate(SINK, NVMM_I420)], NVMM_I420, True),
+    # only the sink pads take the input
+    ([FakeTemplate(SRC, NVMM_I420)], NVMM_I420, False),
+    ([], SYSTEM_MEMORY_I420, False),
+])
+def test_accepts_checks_the_sink_pad_templates(installed, templates, caps, expected):
+    installed(encoder=FakeFactory(*templates))
+    assert accepts("encoder", caps) == expected
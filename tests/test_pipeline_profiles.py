@@ -0,0 +1,59 @@
+import argparse
+
+import pytest
+
+from pipeline_profiles import load_profile, save_profile, Profile, parse_args_with_profile, profile_defaults
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input_mp4', nargs='+')
+    parser.add_argument('--motion_threshold', type=float, nargs='+')
+    parser.add_argument('--pgie_interval', type=int)
+    parser.add_argument('--encoder', choices=['auto', 'x264enc', 'nvv4l2h264enc'], default='auto')
+    parser.add_argument('--fakesink', action='store_true')
+    parser.add_argument('--profile')
+    return parser
+
+def write_profile(tmp_path, text):
+    path = tmp_path / "profile.ini"
+    path.write_text(u"[app]\n" + text)
+    return str(path)
+
+def test_profile_options_are_converted_like_the_command_line(tmp_path):
+    profile = write_profile(tmp_path, u"motion_threshold = 0.002 0.01\ninput_mp4 = a.mp4 'my clip.mp4'\n"
+        u"pgie_interval = 2\nencoder = x264enc\nfakesink = true\n")
+    args = parse_args_with_profile(build_parser(), ["--profile", profile])
+    assert args.motion_threshold == [0.002, 0.01]
+    assert args.input_mp4 == ["a.mp4", "my clip.mp4"]
+    assert args.pgie_interval == 2
+    assert args.encoder == "x264enc"
+    assert args.fakesink is True
+
+def test_single_values_of_nargs_options_are_lists(tmp_path):
+    args = parse_args_with_profile(build_parser(), ["--profile", write_profile(tmp_path, u"motion_threshold = 0.002\nfakesink = off\n")])
+    assert args.motion_threshold == [0.002]
+    assert args.fakesink is False
+
+def test_the_command_line_overrides_the_profile(tmp_path):
+    profile = write_profile(tmp_path, u"motion_threshold = 0.002\npgie_interval = 2\n")
+    args = parse_args_with_profile(build_parser(), ["--profile", profile, "--motion_threshold", "0.5", "0.6"])
+    assert args.motion_threshold == [0.5, 0.6]
+    assert args.pgie_interval == 2
+
+@pytest.mark.parametrize("options", [{"unknown_option": "1"}, {"pgie_interval": "two"}, {"pgie_interval": "1 2"},
+    {"encoder": "vp8enc"}, {"fakesink": "maybe"}, {"motion_threshold": ""}])
+def test_bad_profile_options_are_rejected(options):
+    with pytest.raises(ValueError):
+        profile_defaults(build_parser(), options)
+
+def test_bad_profile_fails_the_parse(tmp_path):
+    with pytest.raises(SystemExit):
+        parse_args_with_profile(build_parser(), ["--profile", write_profile(tmp_path, u"pgie_intervall = 2\n")])
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "saved.ini")
+    save_profile(Profile({"pgie_interval": 2, "fakesink": True}, [("element:", "queue_*", {"max-size-buffers": "4"})]), path, ["tuned"])
+    profile = load_profile(path)
+    assert profile.app_options == {"pgie_interval": "2", "fakesink": "true"}
+    assert profile.element_rules == [("element:", "queue_*", {"max-size-buffers": "4"})]
+    assert profile_defaults(build_parser(), profile.app_options) == {"pgie_interval": 2, "fakesink": True}
@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+
+from detections import Detection
+from privacy_masks import SourceRegions, rasterize, load_regions
+
+SQUARE = [[2, 2], [6, 2], [6, 6], [2, 6]]
+
+def box(left, top, width, height):
+    return Detection(0, left, top, width, height, 0.9)
+
+def test_rasterize_fills_the_pixel_centres_inside():
+    raster = rasterize([SQUARE], 8, 8)
+    assert raster.sum() == 16
+    assert raster[2:6, 2:6].all()
+
+def test_rasterize_overlapping_polygons_stay_filled():
+    raster = rasterize([SQUARE, [[4, 4], [8, 4], [8, 8], [4, 8]]], 8, 8)
+    assert raster[4:6, 4:6].all()
+    assert raster.sum() == 16 + 16 - 4
+
+def test_rasterize_scales_to_the_frame():
+    raster = rasterize([SQUARE], 16, 16, 2.0, 2.0)
+    assert raster.sum() == 64
+    assert raster[4:12, 4:12].all()
+
+def test_apply_masks_on_a_padded_surface():
+    # mapped surfaces can be wider than the frame, the mask must not shear
+    surface = np.zeros((8, 12, 4), dtype=np.uint8)
+    frame = surface[:, :8]
+    SourceRegions(masks=[SQUARE], color=(255, 0, 0)).apply_masks(frame)
+    assert (surface[2:6, 2:6, 0] == 255).all()
+    assert surface[:, :, 0].sum() == 16 * 255
+    assert surface[:, :, 1:].sum() == 0
+
+def test_rois_bound_the_detector_and_drop_the_boxes_outside():
+    regions = SourceRegions(rois=[[[0, 64], [128, 64], [128, 128], [0, 128]]], grid_cell=16)
+    assert regions.roi_bounds(128, 128) == (0, 64, 128, 128)
+    inside, touching, outside = box(10, 80, 20, 20), box(10, 40, 20, 30), box(10, 10, 20, 20)
+    assert regions.inside([inside, touching, outside], 128, 128) == [True, True, False]
+    assert regions.select([outside, inside], 128, 128) == [inside]
+    assert SourceRegions(masks=[SQUARE]).inside([outside], 128, 128) == [True]
+
+def test_load_regions_by_index_location_and_default(tmp_path):
+    path = tmp_path / "regions.json"
+    path.write_text(json.dumps({
+        "grid_cell": 8,
+        "sources": {
+            "*": {"rois": [SQUARE]},
+            "0": {"masks": [SQUARE], "color": [255, 255, 255]},
+            "rtsp://cam/2": {"masks": [SQUARE], "size": [8, 8]},
+        },
+    }))
+    regions = load_regions(str(path), ["a.mp4", "b.mp4", "rtsp://cam/2"])
+    assert regions[0].masks == [SQUARE] and regions[0].color == [255, 255, 255]
+    assert regions[1].rois == [SQUARE] and regions[1].grid_cell == 8
+    assert regions[2].size == [8, 8]
+    path.write_text(json.dumps({"sources": {"1": {"masks": [SQUARE]}}}))
+    assert load_regions(str(path), ["a.mp4", "b.mp4"])[0] is None
@@ -0,0 +1,114 @@
+import json
+import argparse
+
+import qos_controller
+from qos_controller import QosController, OVERLOAD_SAMPLES, RECOVER_SAMPLES
+
+class FakeElement(object):
+    def __init__(self, **properties):
+        self.properties = properties
+
+    def get_property(self, name):
+        return self.properties[name]
+
+    def set_property(self, name, value):
+        self.properties[name] = value
+
+class FakeApp(object):
+    """The parts of Redaction_Main the controller samples and adjusts"""
+    def __init__(self, trackers=None, cpu_mode=False, interval=0):
+        self.streammux = FakeElement(**{"batched-push-timeout": 40000})
+        self.trackers = trackers
+        self.tracker = None
+        self.cpu_mode = cpu_mode
+        self.interval = interval
+        self.inference_queues = [FakeElement(**{"current-level-time": 0})]
+        self.drop_policy = "configured"
+        self.source_frame_numbers = [0, 0]
+        self.num_sources = 2
+        self.probe_seconds = 0.0
+
+    def inference_interval(self):
+        return self.interval
+
+    def set_inference_interval(self, interval):
+        self.interval = interval
+
+    def set_overload_drops(self, policy):
+        self.drop_policy = policy
+
+def qos_args(**overrides):
+    args = dict(qos_target_fps=25.0, qos_target_latency_ms=None, qos_log=None, qos_interval=2.0, batched_push_timeout=40000,
+        qos_min_push_timeout=10000, qos_max_interval=2, tracker_max_age=30, qos_allow_drops=True)
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+def test_interval_is_not_raised_without_a_tracker_on_nvinfer():
+    controller = QosController(FakeApp(), qos_args())
+    assert [knob.name for knob in controller.knobs] == ["batched-push-timeout", "drop-policy"]
+    # the cpu path redacts the skipped frames with the boxes of the last detection
+    controller = QosController(FakeApp(cpu_mode=True), qos_args())
+    assert [knob.name for knob in controller.knobs] == ["batched-push-timeout", "interval", "drop-policy"]
+
+def test_interval_is_capped_at_the_tracker_max_age():
+    controller = QosController(FakeApp(trackers=[], interval=1), qos_args(qos_max_interval=10, tracker_max_age=4))
+    assert controller.knobs[1].values == [1, 2, 3, 4]
+    controller = QosController(FakeApp(trackers=[], interval=1), qos_args(qos_max_interval=3))
+    assert controller.knobs[1].values == [1, 2, 3]
+
+def test_overload_degrades_one_knob_and_recovery_restores_it(tmp_path):
+    app = FakeApp(trackers=[])
+    log_path = str(tmp_path / "qos.jsonl")
+    controller = QosController(app, qos_args(qos_log=log_path))
+    assert controller.knobs[0].values == [40000, 20000, 10000]
+    metrics = {"fps": 10.0, "latency_ms": 0.0, "probe_ms": 1.0}
+    controller.measure = lambda: metrics
+    for sample in range(OVERLOAD_SAMPLES - 1):
+        controller.sample()
+    assert app.streammux.get_property("batched-push-timeout") == 40000
+    controller.sample()
+    assert app.streammux.get_property("batched-push-timeout") == 20000
+    assert app.interval == 0
+    # a sample between the targets resets both counts
+    controller.sample()
+    metrics["fps"] = 24.0
+    controller.sample()
+    metrics["fps"] = 10.0
+    controller.sample()
+    assert app.streammux.get_property("batched-push-timeout") == 20000
+
+    metrics["fps"] = 25.0
+    for sample in range(RECOVER_SAMPLES - 1):
+        controller.sample()
+    assert app.streammux.get_property("batched-push-timeout") == 20000
+    controller.sample()
+    assert app.streammux.get_property("batched-push-timeout") == 40000
+    controller.stop()
+    with open(log_path) as log_file:
+        moves = [json.loads(line) for line in log_file]
+    assert [(move["knob"], move["old"], move["new"]) for move in moves] == \
+        [("batched-push-timeout", 40000, 20000), ("batched-push-timeout", 20000, 40000)]
+
+def test_latency_overload_walks_the_knobs_in_order():
+    app = FakeApp(trackers=[])
+    controller = QosController(app, qos_args(qos_target_fps=None, qos_target_latency_ms=100.0))
+    controller.measure = lambda: {"fps": 25.0, "latency_ms": 500.0, "probe_ms": 1.0}
+    for sample in range(6 * OVERLOAD_SAMPLES):
+        controller.sample()
+    assert app.streammux.get_property("batched-push-timeout") == 10000
+    assert app.interval == 2
+    assert app.drop_policy == "oldest"
+
+def test_measure_uses_the_frames_and_queues_since_the_last_sample(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(qos_controller.time, "monotonic", lambda: now[0])
+    app = FakeApp()
+    controller = QosController(app, qos_args())
+    now[0] = 102.0
+    app.source_frame_numbers = [50, 50]
+    app.probe_seconds = 0.5
+    app.inference_queues[0].set_property("current-level-time", 80 * 1000000)
+    assert controller.measure() == {"fps": 25.0, "latency_ms": 80.0, "probe_ms": 5.0}
+    now[0] = 104.0
+    app.source_frame_numbers = [60, 60]
+    assert controller.measure()["fps"] == 5.0
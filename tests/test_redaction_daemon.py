@@ -0,0 +1,120 @@
+import os
+import json
+import argparse
+import threading
+import http.client
+
+import pytest
+
+from redaction_styles import parse_styles
+from runtime_config import RuntimeSettings
+from redaction_daemon import Job, RedactionDaemon, WatchFolder, ThreadingHTTPServer, JobRequestHandler
+
+CLASS_NAMES = ["face", "license_plate", "make", "model"]
+
+class FakeApp(object):
+    """Takes the runtime settings of the daemon, jobs are never run"""
+    def __init__(self):
+        self.settings = RuntimeSettings(parse_styles(None, CLASS_NAMES))
+        self.pgie_classes_str = CLASS_NAMES
+
+    def update_settings(self, settings):
+        self.settings = settings
+
+def create_daemon(tmp_path, fakesink=False, export_detections=False):
+    args = argparse.Namespace(output_dir=str(tmp_path / "redacted"), fakesink=fakesink, export_detections=export_detections,
+        status_file=str(tmp_path / "status.json"))
+    return RedactionDaemon(args, FakeApp())
+
+def test_job_to_dict():
+    job = Job(3, "/in/a.mp4", "/out/a_redacted.mp4", None)
+    assert job.to_dict()["status"] == "queued"
+    assert job.to_dict()["run_ms"] is None and job.to_dict()["fps"] is None
+    job.submitted, job.started, job.finished = 10.0, 10.5, 12.5
+    job.frames = 100
+    status = job.to_dict()
+    assert (status["id"], status["queued_ms"], status["run_ms"], status["fps"]) == (3, 500, 2000, 50.0)
+
+def test_submit_defaults(tmp_path):
+    daemon = create_daemon(tmp_path, export_detections=True)
+    job = daemon.submit("incoming/clip.mp4")
+    output_dir = str(tmp_path / "redacted")
+    assert job.input_path == os.path.abspath("incoming/clip.mp4")
+    assert job.output_path == os.path.join(output_dir, "clip_redacted.mp4")
+    assert job.kitti_dir == os.path.join(output_dir, "clip_kitti")
+    assert daemon.queue.get_nowait() is job
+    with open(str(tmp_path / "status.json")) as status_file:
+        assert [j["id"] for j in json.load(status_file)["jobs"]] == [1]
+
+    daemon = create_daemon(tmp_path, fakesink=True)
+    job = daemon.submit("clip.mp4", kitti_dir="boxes")
+    assert job.output_path is None and job.kitti_dir == "boxes"
+
+@pytest.fixture
+def endpoint(tmp_path):
+    daemon = create_daemon(tmp_path)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), JobRequestHandler)
+    server.redaction_daemon = daemon
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    def request(method, path, body=None):
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+        connection.request(method, path, body=None if body is None else json.dumps(body))
+        response = connection.getresponse()
+        result = response.status, json.loads(response.read().decode("utf-8"))
+        connection.close()
+        return result
+
+    yield daemon, request
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+def test_job_routes(endpoint):
+    daemon, request = endpoint
+    status, job = request("POST", "/jobs", {"input": "a.mp4", "kitti": "a_boxes"})
+    assert status == 202 and job["id"] == 1 and job["kitti"] == "a_boxes"
+    for body in ({"output": "b.mp4"}, {"input": None}, ["a.mp4"], {"input": "b.mp4", "output": 3}):
+        assert request("POST", "/jobs", body)[0] == 400
+    assert request("GET", "/jobs") == (200, {"jobs": [job]})
+    assert request("GET", "/jobs/1") == (200, job)
+    assert request("GET", "/jobs/2")[0] == 404
+    assert request("GET", "/jobs/first")[0] == 404
+    assert request("GET", "/status")[0] == 404
+    assert request("POST", "/status", {})[0] == 404
+
+def test_config_route(endpoint):
+    daemon, request = endpoint
+    assert request("POST", "/config", {"face": {"threshold": 0.4}})[0] == 200
+    assert not daemon.app.settings.accepts(0, 0.3)
+    for body in ({"face": {"threshold": None}}, {"person": {"threshold": 0.4}}, {"face": {"size": 3}}, ["face"]):
+        status, reply = request("POST", "/config", body)
+        assert status == 400 and reply["error"]
+    # rejected updates leave the settings alone
+    assert daemon.app.settings.accepts(0, 0.4)
+
+def test_watch_folder_submits_files_once_they_stop_growing(tmp_path):
+    daemon = create_daemon(tmp_path)
+    # no polling thread, the test scans itself
+    daemon.stopping = True
+    incoming = tmp_path / "incoming"
+    incoming.mkdir()
+    (incoming / "a.mp4").write_bytes(b"1234")
+    (incoming / "notes.txt").write_bytes(b"1234")
+    watch = WatchFolder(daemon, str(incoming), 0)
+    watch.thread.join()
+    watch.scan()
+    assert daemon.queue.empty()
+    watch.scan()
+    watch.scan()
+    assert daemon.queue.get_nowait().input_path == str(incoming / "a.mp4")
+    assert daemon.queue.empty()
+
+def test_watch_folder_survives_a_missing_folder(tmp_path):
+    daemon = create_daemon(tmp_path)
+    daemon.stopping = True
+    watch = WatchFolder(daemon, str(tmp_path / "unmounted"), 0)
+    watch.thread.join()
+    watch.scan()
+    assert daemon.queue.empty()
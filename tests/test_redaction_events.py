@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from detections import Detection
+from nvds_batch_walker import OBJECT_DTYPE
+from redaction_events import EventStream, as_detections
+
+class CountingStream(EventStream):
+    """Counts the wakeups the producers schedule on the asyncio loop"""
+    wakeups = 0
+
+    def wakeup(self):
+        self.wakeups += 1
+        EventStream.wakeup(self)
+
+def run(coroutine_function):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine_function(loop))
+    finally:
+        loop.close()
+
+async def drain(stream):
+    return [event async for event in stream]
+
+def test_a_full_stream_drops_and_counts_the_oldest_events():
+    async def scenario(loop):
+        stream = EventStream(loop, 3)
+        for event in range(5):
+            stream.put(event)
+        stream.close()
+        # closed streams take no more events, the queued ones are still delivered
+        stream.put(5)
+        return stream, await drain(stream)
+    stream, events = run(scenario)
+    assert events == [2, 3, 4]
+    assert stream.dropped == 2
+
+def test_a_burst_from_another_thread_wakes_the_consumer_once():
+    async def scenario(loop):
+        stream = CountingStream(loop, 16)
+        first = loop.create_task(stream.__anext__())
+        # let the consumer wait on the empty stream
+        await asyncio.sleep(0)
+        producer = threading.Thread(target=lambda: [stream.put(event) for event in range(5)])
+        producer.start()
+        producer.join()
+        events = [await first]
+        stream.close()
+        events += await drain(stream)
+        return stream, events
+    stream, events = run(scenario)
+    assert events == [0, 1, 2, 3, 4]
+    # a single wakeup for the whole burst
+    assert stream.wakeups == 1
+
+def test_close_ends_a_waiting_iteration():
+    async def scenario(loop):
+        stream = EventStream(loop, 16)
+        consumer = loop.create_task(drain(stream))
+        await asyncio.sleep(0)
+        loop.call_soon(stream.close)
+        return await asyncio.wait_for(consumer, 5)
+    assert run(scenario) == []
+
+def test_as_detections_copies_walker_rows():
+    rows = np.zeros(2, dtype=OBJECT_DTYPE)
+    rows[0] = (0, 7, 1, 10.0, 20.0, 30.0, 40.0, 0.5)
+    rows[1] = (0, 7, 0, 1.0, 2.0, 3.0, 4.0, 0.25)
+    for detections in (rows, rows.view(np.recarray)):
+        converted = as_detections(detections)
+        assert converted == [Detection(1, 10.0, 20.0, 30.0, 40.0, 0.5), Detection(0, 1.0, 2.0, 3.0, 4.0, 0.25)]
+        assert all(type(value) in (int, float) for value in converted[0])
+    # the walker reuses its array, the events keep their own values
+    rows["left"] = 0
+    assert converted[0].left == 10.0
+
+def test_as_detections_copies_lists():
+    detections = [Detection(0, 1.0, 2.0, 3.0, 4.0, 0.9)]
+    converted = as_detections(detections)
+    assert converted == detections and converted is not detections
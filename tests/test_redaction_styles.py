@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from detections import Detection, REDACTION_COLORS
+from redaction_styles import RedactionStyle, parse_styles, needs_pixels, redact_boxes
+
+CLASS_NAMES = ["face", "license_plate", "make", "model"]
+
+def test_parse_styles_defaults_to_filling_the_coloured_classes():
+    assert parse_styles(None, CLASS_NAMES) == {0: RedactionStyle("fill", 0), 1: RedactionStyle("fill", 0)}
+
+def test_parse_styles_per_class():
+    styles = parse_styles("blur:31,license_plate=pixelate,2=fill", CLASS_NAMES)
+    assert styles == {0: RedactionStyle("blur", 31), 1: RedactionStyle("pixelate", 16), 2: RedactionStyle("fill", 0)}
+    assert needs_pixels(styles)
+    assert not needs_pixels(parse_styles("make=fill", CLASS_NAMES))
+
+@pytest.mark.parametrize("spec", ["smudge", "face=blur:0", "person=blur"])
+def test_parse_styles_rejects(spec):
+    with pytest.raises(ValueError):
+        parse_styles(spec, CLASS_NAMES)
+
+def gradient():
+    frame = np.zeros((32, 32, 4), dtype=np.uint8)
+    frame[:, :, 0] = np.arange(32, dtype=np.uint8)[None, :] * 8
+    frame[:, :, 1] = np.arange(32, dtype=np.uint8)[:, None] * 8
+    frame[:, :, 3] = 255
+    return frame
+
+def test_fill_uses_the_class_colour():
+    frame = gradient()
+    redact_boxes(frame, [Detection(1, 4, 4, 8, 8, 0.9)], parse_styles(None, CLASS_NAMES))
+    assert (frame[4:12, 4:12, :3] == [int(255 * c) for c in REDACTION_COLORS[1][:3]]).all()
+    assert (frame[4:12, 4:12, 3] == 255).all()
+    assert (frame[0, :, :3] == gradient()[0, :, :3]).all()
+
+def test_pixelate_averages_each_cell():
+    frame = gradient()
+    redact_boxes(frame, [Detection(0, 8, 8, 16, 16, 0.9)], {0: RedactionStyle("pixelate", 8)})
+    cell = frame[8:16, 8:16, :3].reshape(-1, 3)
+    assert (cell == cell[0]).all()
+    assert tuple(cell[0]) == (int(np.round(gradient()[8:16, 8:16, 0].mean())), int(np.round(gradient()[8:16, 8:16, 1].mean())), 0)
+    assert (frame[8:16, 16:24, 0] != frame[8:16, 8:16, 0]).all()
+
+def test_blur_matches_a_direct_box_filter_and_leaves_the_rest():
+    frame = gradient()
+    redact_boxes(frame, [Detection(0, 10, 10, 6, 6, 0.9), Detection(0, 12, 12, 6, 6, 0.9)], {0: RedactionStyle("blur", 5)})
+    original = gradient().astype(np.float64)
+    for y, x in [(10, 10), (14, 14), (17, 17)]:
+        expected = original[y - 2:y + 3, x - 2:x + 3, :3].reshape(-1, 3).mean(axis=0)
+        assert np.abs(frame[y, x, :3] - expected).max() <= 1
+    assert (frame[:10] == gradient()[:10]).all()
+
+def test_unstyled_classes_and_empty_boxes_are_left_alone():
+    frame = gradient()
+    redact_boxes(frame, [Detection(3, 4, 4, 8, 8, 0.9), Detection(0, 40, 40, 8, 8, 0.9)], parse_styles(None, CLASS_NAMES))
+    assert (frame == gradient()).all()
@@ -0,0 +1,44 @@
+import pytest
+
+from detections import REDACTION_COLORS
+from redaction_styles import parse_styles, RedactionStyle
+from runtime_config import RuntimeSettings, set_values, read_overrides
+
+CLASS_NAMES = ["face", "license_plate", "make", "model"]
+
+def test_fill_colors_follow_the_resolved_styles():
+    settings = RuntimeSettings(parse_styles("make=fill", CLASS_NAMES))
+    assert settings.fill_colors() == {0: REDACTION_COLORS[0], 1: REDACTION_COLORS[1], 2: (0.0, 0.0, 0.0, 1.0)}
+    settings = settings.updated({"face": {"color": "0, 1, 0"}, "license_plate": {"style": "blur"}}, CLASS_NAMES)
+    assert settings.fill_colors() == {0: (0.0, 1.0, 0.0, 1.0), 2: (0.0, 0.0, 0.0, 1.0)}
+
+def test_updated_leaves_the_snapshot_alone():
+    settings = RuntimeSettings(parse_styles(None, CLASS_NAMES))
+    updated = settings.updated({"face": {"threshold": "0.4", "enabled": "false"}, "1": {"style": "pixelate:8"}}, CLASS_NAMES)
+    assert settings.accepts(0, 0.1) and not settings.pixel_styles
+    assert not updated.accepts(0, 0.9)
+    assert updated.pixel_styles == {1: RedactionStyle("pixelate", 8)}
+
+def test_updated_rejects_unknown_classes_and_settings():
+    settings = RuntimeSettings(parse_styles(None, CLASS_NAMES))
+    with pytest.raises(ValueError):
+        settings.updated({"person": {"threshold": "0.5"}}, CLASS_NAMES)
+    with pytest.raises(ValueError):
+        settings.updated({"face": {"opacity": "0.5"}}, CLASS_NAMES)
+
+def test_set_values_round_trip(tmp_path):
+    path = str(tmp_path / "runtime.ini")
+    set_values(path, ["face.threshold=0.3", "license_plate.style=blur:31"])
+    assert read_overrides(path) == {"face": {"threshold": "0.3"}, "license_plate": {"style": "blur:31"}}
+    with pytest.raises(ValueError):
+        set_values(path, ["face.size=3"])
+
+def test_file_overrides_apply_on_top_of_the_command_line(tmp_path):
+    path = tmp_path / "runtime.ini"
+    path.write_text(u"[face]\nthreshold = 0.3\nstyle = blur:31\n\n[license_plate]\nenabled = false\ncolor = 0.5, 0.0, 0.5\n")
+    base = RuntimeSettings(parse_styles("make=fill", CLASS_NAMES))
+    settings = base.updated(read_overrides(str(path)), CLASS_NAMES)
+    assert settings.styles[0] == RedactionStyle("blur", 31) and settings.styles[2] == RedactionStyle("fill", 0)
+    assert not settings.accepts(0, 0.2) and settings.accepts(0, 0.3)
+    assert not settings.accepts(1, 1.0)
+    assert settings.colors[1] == (0.5, 0.0, 0.5, 1.0)
@@ -0,0 +1,26 @@
+import json
+import sys
+
+from segmented_output import SegmentLog, segment_pattern, default_manifest
+
+def test_segment_names():
+    assert segment_pattern("out/cam.mp4") == "out/cam_%05d.mp4"
+    assert default_manifest("out/cam.mp4") == "out/cam.segments.jsonl"
+
+def test_closed_segments_are_logged_and_handed_to_the_command(tmp_path):
+    segment = tmp_path / "cam_00000.mp4"
+    segment.write_bytes(b"x" * 10)
+    uploaded = tmp_path / "uploaded.txt"
+    command = "%s -c \"import sys; open(sys.argv[1], 'a').write(sys.argv[2] + chr(10))\" %s {location}" % (sys.executable, uploaded)
+    log = SegmentLog(str(tmp_path / "cam.segments.jsonl"), command)
+    log.fragment_opened(0, 0)
+    log.fragment_closed(0, str(segment), 60 * 10 ** 9)
+    log.fragment_opened(0, 60 * 10 ** 9)
+    log.fragment_closed(0, str(tmp_path / "cam_00001.mp4"), 90 * 10 ** 9)
+    log.close()
+    with open(str(tmp_path / "cam.segments.jsonl")) as manifest:
+        entries = [json.loads(line) for line in manifest]
+    assert [(e["index"], e["start_ns"], e["duration_ns"], e["bytes"]) for e in entries] == \
+        [(0, 0, 60 * 10 ** 9, 10), (1, 60 * 10 ** 9, 30 * 10 ** 9, None)]
+    # the commands run side by side
+    assert sorted(uploaded.read_text().split()) == [str(segment), str(tmp_path / "cam_00001.mp4")]
@@ -0,0 +1,27 @@
+import argparse
+
+from soak import growth, check, build_arg_parser
+
+def sample(rss_mb, objects, buffers=None):
+    return {"rss_bytes": rss_mb * 1024 * 1024, "python_traced_bytes": 0, "python_objects": objects,
+        "gst_live_objects": None if buffers is None else {"Buffer": buffers}}
+
+def test_growth_averages_the_ends_of_the_run():
+    samples = [sample(100, 10), sample(102, 10), sample(101, 10), sample(150, 10), sample(151, 10), sample(152, 10)]
+    # (150 + 151 + 152) / 3 - (100 + 102 + 101) / 3
+    assert growth(samples, "rss_bytes") == 50 * 1024 * 1024
+    assert growth(samples[:2], "rss_bytes") == 2 * 1024 * 1024
+    assert growth(samples[:1], "rss_bytes") is None
+
+def test_growth_of_gst_objects():
+    assert growth([sample(100, 10, 4), sample(100, 10, 4), sample(100, 10, 20)], "gst_Buffer") == 16
+    # a pool that never appears counts as none alive, a missing tracer is not measured
+    assert growth([sample(100, 10, 4), sample(100, 10, 4)], "gst_BufferPool") == 0
+    assert growth([sample(100, 10), sample(100, 10)], "gst_Buffer") is None
+
+def test_check_reports_the_metrics_over_their_limit():
+    args = build_arg_parser().parse_args(["--max_rss_growth_mb", "64", "--max_object_growth", "100"])
+    steady = [sample(100, 1000, 8)] * 6
+    assert check(steady, args) == []
+    leaking = [sample(100 + 30 * i, 1000 + 50 * i, 8 + 30 * i) for i in range(6)]
+    assert check(leaking, args) == ["rss_bytes", "python_objects", "gst_Buffer"]
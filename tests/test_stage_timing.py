@@ -0,0 +1,31 @@
+import collections
+
+from stage_timing import StageTimer, pop_entered
+
+def test_batched_sources_with_the_same_pts_do_not_collide():
+    stage = StageTimer("stream-muxer")
+    stage.enter(0, 40, 10.000)
+    stage.enter(1, 40, 10.010)
+    # the batch leaves once for both frames
+    stage.leave(None, 40, 10.020)
+    assert stage.count == 1
+    # but counts as two frames for the fps
+    assert stage.frames == stage.interval_frames == 2
+    assert sorted(round(latency) for latency in stage.window) == [10, 20]
+    assert not stage.pending
+
+def test_per_source_buffers_leave_with_their_own_entry_time():
+    entries = collections.OrderedDict()
+    entries.setdefault(40, {})[0] = 1.0
+    entries.setdefault(40, {})[1] = 2.0
+    assert pop_entered(entries, 1, 40) == [2.0]
+    assert pop_entered(entries, 1, 40) == []
+    assert pop_entered(entries, 0, 40) == [1.0]
+    assert not entries
+
+def test_unmatched_buffers_are_counted_without_latency():
+    stage = StageTimer("fakesink")
+    stage.leave(0, 80, 1.0)
+    assert stage.count == 1 and not stage.window
+    assert stage.frames == 1
+    assert stage.percentiles() == (None, None, None)